@@ -0,0 +1,358 @@
+"""
+Memory-bounded evaluation of the clusterings of the unsupervised experiments.
+
+The silhouette is computed by blocks of rows: the distances from a block of
+samples to every sample are reduced to per-cluster sums right away, so the
+memory used is ``block_size * n_samples`` distances instead of the full
+``n_samples ** 2`` matrix. ``silhouette_estimate`` computes it for a
+stratified (by cluster) sample of the rows only and gives a confidence
+interval of the mean.
+
+The cluster/class contingency table is built with a single ``bincount``,
+and the homogeneity and completeness come from it.
+
+Noise points of DBSCAN/OPTICS (label ``-1``) can be dropped
+(``drop_noise=True``); otherwise they are treated as one more cluster (as
+``sklearn.metrics`` does).
+"""
+from statistics import NormalDist
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+import numpy.typing as npt
+
+FloatArray = npt.NDArray[np.float64]
+IntArray = npt.NDArray[np.int64]
+
+NOISE = -1
+"""Label of the noise points (DBSCAN, OPTICS)"""
+
+WORKING_MEMORY = 64 * 2**20
+"""Default bytes of the distance block of the silhouette"""
+
+SilhouetteEstimate = NamedTuple(
+    "SilhouetteEstimate",
+    [("mean", float), ("low", float), ("high", float), ("n_samples", int)],
+)
+"""Estimated mean silhouette and its confidence interval"""
+
+
+def contingency_table(
+    labels: Sequence[int], classes: Sequence[int], drop_noise: bool = False
+) -> Tuple[IntArray, IntArray, IntArray]:
+    """
+    Number of samples of each class in each cluster.
+
+    Parameters
+    ----------
+    labels : Sequence[int]
+        Cluster of each sample.
+    classes : Sequence[int]
+        Class of each sample.
+    drop_noise : bool
+        Whether to leave out the noise samples (label ``-1``).
+
+    Returns
+    -------
+    Tuple[IntArray, IntArray, IntArray]
+        The (n_clusters, n_classes) table and the cluster and class of each
+        row and column.
+    """
+    labels = np.asarray(labels)
+    classes = np.asarray(classes)
+    if labels.shape != classes.shape:
+        raise ValueError("There must be a class for each label")
+    if drop_noise:
+        valid = labels != NOISE
+        labels, classes = labels[valid], classes[valid]
+    cluster_ids, cluster_idx = np.unique(labels, return_inverse=True)
+    class_ids, class_idx = np.unique(classes, return_inverse=True)
+    n_cells = len(cluster_ids) * len(class_ids)
+    table = np.bincount(
+        cluster_idx.ravel() * len(class_ids) + class_idx.ravel(), minlength=n_cells
+    )
+    return table.reshape(len(cluster_ids), len(class_ids)), cluster_ids, class_ids
+
+
+def count_classes(
+    labels: Sequence[int], classes: Sequence[int], n_classes: int = 5
+) -> Dict[int, List[int]]:
+    """
+    Number of samples of each class in each cluster (noise excluded).
+
+    Parameters
+    ----------
+    labels : Sequence[int]
+        Cluster of each sample (e.g. ``model.labels_``).
+    classes : Sequence[int]
+        Class of each sample (in ``range(n_classes)``).
+    n_classes : int
+        Number of classes.
+
+    Returns
+    -------
+    Dict[int, List[int]]
+        The class counts of each cluster.
+    """
+    table, cluster_ids, class_ids = contingency_table(labels, classes, True)
+    counts = np.zeros((len(cluster_ids), n_classes), dtype=np.int64)
+    counts[:, class_ids] = table
+    return dict(zip(cluster_ids.tolist(), counts.tolist()))
+
+
+def _entropy(counts: np.ndarray) -> float:
+    total = counts.sum()
+    probs = counts[counts > 0] / total
+    return float(-np.sum(probs * np.log(probs)))
+
+
+def homogeneity_completeness(
+    labels: Sequence[int], classes: Sequence[int], drop_noise: bool = False
+) -> Tuple[float, float]:
+    """
+    Homogeneity and completeness of a clustering.
+
+    They match ``sklearn.metrics.homogeneity_score`` and
+    ``completeness_score`` (with ``drop_noise=False``).
+
+    Parameters
+    ----------
+    labels : Sequence[int]
+        Cluster of each sample.
+    classes : Sequence[int]
+        Class of each sample.
+    drop_noise : bool
+        Whether to leave out the noise samples (label ``-1``).
+
+    Returns
+    -------
+    Tuple[float, float]
+        The homogeneity and the completeness.
+    """
+    table, _, _ = contingency_table(labels, classes, drop_noise)
+    total = table.sum()
+    if total == 0:
+        return 1.0, 1.0
+    cluster_counts = table.sum(axis=1)
+    class_counts = table.sum(axis=0)
+    class_entropy = _entropy(class_counts)
+    cluster_entropy = _entropy(cluster_counts)
+    rows, cols = np.nonzero(table)
+    joint = table[rows, cols] / total
+    # H(C|K) and H(K|C) from the joint distribution
+    cond_class = -np.sum(joint * np.log(table[rows, cols] / cluster_counts[rows]))
+    cond_cluster = -np.sum(joint * np.log(table[rows, cols] / class_counts[cols]))
+    homogeneity = 1.0 if class_entropy == 0 else 1 - cond_class / class_entropy
+    completeness = 1.0 if cluster_entropy == 0 else 1 - cond_cluster / cluster_entropy
+    return float(homogeneity), float(completeness)
+
+
+class _Clusters:
+    """Samples sorted by cluster (the distances of a row are reduced to
+    per-cluster sums with ``np.add.reduceat``)."""
+
+    def __init__(self, x: FloatArray, labels: Sequence[int], drop_noise: bool):
+        x = np.asarray(x, dtype=np.float64)
+        labels = np.asarray(labels)
+        if len(x) != len(labels):
+            raise ValueError("There must be a label for each sample")
+        self.samples = (
+            np.flatnonzero(labels != NOISE) if drop_noise else np.arange(len(labels))
+        )
+        self.cluster_ids, codes = np.unique(
+            labels[self.samples], return_inverse=True
+        )
+        n_samples = len(self.samples)
+        if not 2 <= len(self.cluster_ids) <= n_samples - 1:
+            raise ValueError(
+                f"Number of labels is {len(self.cluster_ids)}. Valid values are "
+                f"2 to n_samples - 1 (inclusive)"
+            )
+        order = np.argsort(codes, kind="stable")
+        self.codes = codes.ravel()
+        # Position of each (kept) sample in the sorted matrix
+        self.position = np.empty(n_samples, dtype=np.int64)
+        self.position[order] = np.arange(n_samples)
+        self.sorted_x = x[self.samples[order]]
+        self.sq_norms = np.einsum("ij,ij->i", self.sorted_x, self.sorted_x)
+        self.counts = np.bincount(self.codes)
+        self.starts = np.concatenate([[0], np.cumsum(self.counts)[:-1]])
+
+    def __len__(self) -> int:
+        return len(self.samples)
+
+    def block_size(self, block_size: Optional[int]) -> int:
+        """Rows per block (bounded by ``WORKING_MEMORY`` by default)."""
+        if block_size is None:
+            block_size = WORKING_MEMORY // (8 * len(self))
+        return max(int(block_size), 1)
+
+    def silhouette(self, rows: IntArray) -> FloatArray:
+        """Silhouette of some rows (indices of the kept samples)."""
+        pos = self.position[rows]
+        block = self.sorted_x[pos]
+        dist = self.sq_norms[pos, None] + self.sq_norms[None, :]
+        dist -= 2 * (block @ self.sorted_x.T)
+        np.maximum(dist, 0, out=dist)
+        np.sqrt(dist, out=dist)
+        dist[np.arange(len(rows)), pos] = 0
+        sums = np.add.reduceat(dist, self.starts, axis=1)
+        del dist
+
+        own = self.codes[rows]
+        own_count = self.counts[own]
+        row_idx = np.arange(len(rows))
+        intra = sums[row_idx, own] / np.maximum(own_count - 1, 1)
+        sums[row_idx, own] = np.inf
+        inter = np.min(sums / self.counts, axis=1)
+        scale = np.maximum(intra, inter)
+        sil = np.divide(
+            inter - intra, scale, out=np.zeros(len(rows)), where=scale > 0
+        )
+        # The silhouette of the samples alone in their cluster is 0
+        sil[own_count == 1] = 0
+        return sil
+
+
+def silhouette_samples(
+    x: FloatArray,
+    labels: Sequence[int],
+    drop_noise: bool = False,
+    block_size: Optional[int] = None,
+) -> FloatArray:
+    """
+    Silhouette coefficient of each sample (euclidean distance).
+
+    It matches ``sklearn.metrics.silhouette_samples`` (with
+    ``drop_noise=False``) with bounded memory.
+
+    Parameters
+    ----------
+    x : FloatArray
+        The (n_samples, n_features) matrix.
+    labels : Sequence[int]
+        Cluster of each sample.
+    drop_noise : bool
+        Whether to leave out the noise samples (label ``-1``). Their
+        coefficient is NaN and they are not part of any cluster.
+    block_size : Optional[int]
+        Rows whose distances are computed at once (by default the block of
+        distances takes ``WORKING_MEMORY`` bytes).
+
+    Returns
+    -------
+    FloatArray
+        The coefficient of each sample.
+    """
+    clusters = _Clusters(x, labels, drop_noise)
+    block_size = clusters.block_size(block_size)
+    sil = np.full(len(labels), np.nan)
+    for start in range(0, len(clusters), block_size):
+        rows = np.arange(start, min(start + block_size, len(clusters)))
+        sil[clusters.samples[rows]] = clusters.silhouette(rows)
+    return sil
+
+
+def silhouette_score(
+    x: FloatArray,
+    labels: Sequence[int],
+    drop_noise: bool = False,
+    block_size: Optional[int] = None,
+) -> float:
+    """
+    Mean silhouette coefficient (see ``silhouette_samples``).
+
+    Parameters
+    ----------
+    x : FloatArray
+        The (n_samples, n_features) matrix.
+    labels : Sequence[int]
+        Cluster of each sample.
+    drop_noise : bool
+        Whether to leave out the noise samples (label ``-1``).
+    block_size : Optional[int]
+        Rows whose distances are computed at once.
+
+    Returns
+    -------
+    float
+        The mean coefficient (of the samples that are not left out).
+    """
+    return float(np.nanmean(silhouette_samples(x, labels, drop_noise, block_size)))
+
+
+def silhouette_estimate(
+    x: FloatArray,
+    labels: Sequence[int],
+    sample_size: int = 2000,
+    confidence: float = 0.95,
+    drop_noise: bool = False,
+    block_size: Optional[int] = None,
+    seed: int = 0,
+) -> SilhouetteEstimate:
+    """
+    Estimates the mean silhouette coefficient from a sample of the rows.
+
+    The rows are sampled without replacement from each cluster
+    (proportionally to its size, at least 2 per cluster when possible) and
+    their exact coefficients are computed. The mean is the stratified mean
+    and the interval uses its normal approximation (with the finite
+    population correction).
+
+    Parameters
+    ----------
+    x : FloatArray
+        The (n_samples, n_features) matrix.
+    labels : Sequence[int]
+        Cluster of each sample.
+    sample_size : int
+        Approximate number of sampled rows.
+    confidence : float
+        Confidence level of the interval.
+    drop_noise : bool
+        Whether to leave out the noise samples (label ``-1``).
+    block_size : Optional[int]
+        Rows whose distances are computed at once.
+    seed : int
+        Random seed.
+
+    Returns
+    -------
+    SilhouetteEstimate
+        The estimated mean, the bounds of its interval and the number of
+        sampled rows.
+    """
+    clusters = _Clusters(x, labels, drop_noise)
+    block_size = clusters.block_size(block_size)
+    rng = np.random.default_rng(seed)
+    n_total = len(clusters)
+    # Rows of each cluster (in the order of the kept samples)
+    members = np.split(
+        np.argsort(clusters.codes, kind="stable"), np.cumsum(clusters.counts)[:-1]
+    )
+    strata = []
+    for rows, count in zip(members, clusters.counts):
+        n_rows = min(count, max(2, round(sample_size * count / n_total)))
+        strata.append(np.sort(rng.choice(rows, n_rows, replace=False)))
+    sampled = np.concatenate(strata)
+    sil = np.empty(len(sampled))
+    for start in range(0, len(sampled), block_size):
+        sil[start : start + block_size] = clusters.silhouette(
+            sampled[start : start + block_size]
+        )
+
+    mean = 0.0
+    variance = 0.0
+    start = 0
+    for rows, count in zip(strata, clusters.counts):
+        values = sil[start : start + len(rows)]
+        start += len(rows)
+        weight = count / n_total
+        mean += weight * values.mean()
+        if len(rows) > 1:
+            fpc = 1 - len(rows) / count
+            variance += weight**2 * fpc * values.var(ddof=1) / len(rows)
+    margin = NormalDist().inv_cdf(0.5 + confidence / 2) * np.sqrt(variance)
+    return SilhouetteEstimate(
+        float(mean), float(mean - margin), float(mean + margin), len(sampled)
+    )
@@ -2,11 +2,26 @@
 This contains necessary functions to handle the data.
 """
 import json
+import logging
+import os
 from pathlib import Path
-from typing import List
+from typing import Iterable, Iterator, List, Optional, Union
 
 import numpy as np
 
+from compact_traj import CompactTraj, load_compact
+from instrumentation import get_instrument
+from metadata_index import DEFAULT_INDEX_FILE, MetadataIndex, load_index
+from traj_resample import preprocess, sampled_mean_dt
+from traj_store import DEFAULT_STORE_FILE, TrajStore, file_digest
+
+SELECTED_CLASSES = {"car", "taxi", "bus", "walk", "bike", "subway", "train"}
+JOINED_CLASSES = {"taxi": "car", "subway": "train"}
+MAX_MEAN_DT = 3
+MIN_LENGTH = 100
+
+DEFAULT_METADATA_FILE = Path("trajectories/metadata.json")
+
 
 def load_trajs_metadata(metadata_file: Path) -> List[dict]:
     """
@@ -27,7 +42,26 @@ def load_trajs_metadata(metadata_file: Path) -> List[dict]:
     return metadata
 
 
-def load_trajs_data(metadata: List[dict]) -> List[dict]:
+def load_traj_file(file_path: Union[str, Path]) -> Union[np.ndarray, CompactTraj]:
+    """
+    Loads the data of a trajectory file (text or compact ``.npz`` file).
+
+    Parameters
+    ----------
+    file_path : Union[str, Path]
+        Path to the trajectory file.
+
+    Returns
+    -------
+    Union[np.ndarray, CompactTraj]
+        The trajectory.
+    """
+    if str(file_path).endswith(".npz"):
+        return load_compact(file_path)
+    return np.loadtxt(file_path, ndmin=2)
+
+
+def load_trajs_data(metadata: List[dict], compact: bool = False) -> List[dict]:
     """
     Loads all the data from the trajectories file.
 
@@ -35,42 +69,286 @@ def load_trajs_data(metadata: List[dict]) -> List[dict]:
     ----------
     metadata : List[dict]
         The metadata of each trajectory.
+    compact : bool
+        Whether to keep the data as compact trajectories (see
+        ``compact_traj``), which takes about half the memory.
 
     Returns
     -------
     List[dict]
         The metadata of each trajectory with the trajectory data included.
     """
-    for i, traj_md in enumerate(metadata):
-        print(f"{(i+1)/len(metadata):.2%}", end="\r")
-        traj_md["traj_data"] = np.loadtxt(traj_md["file_path"], ndmin=2)
+    inst = get_instrument()
+    with inst.stage("load_trajs_data"):
+        for i, traj_md in enumerate(metadata):
+            inst.progress("load_trajs_data", i + 1, len(metadata))
+            traj_data = load_traj_file(traj_md["file_path"])
+            if compact and not isinstance(traj_data, CompactTraj):
+                traj_data = CompactTraj.from_array(traj_data)
+            traj_md["traj_data"] = traj_data
+            inst.count("trajectories_read")
+            inst.count("points_read", len(traj_md["traj_data"]))
+            inst.count("bytes_read", os.path.getsize(traj_md["file_path"]))
     return metadata
 
 
-def get_selected_data() -> List[dict]:
+def preprocess_trajs_data(
+    data: List[dict],
+    resample_interval: Optional[float] = None,
+    compress_tol: Optional[float] = None,
+) -> List[dict]:
     """
-    Loads the selected data from the metadata file.
+    Resamples and/or compresses loaded trajectories (see ``traj_resample``)
+    and updates their ``length`` and ``mean_dt`` (the time step before the
+    compression).
+
+    Trajectories already processed at ingest (``data_parser --resample`` or
+    ``--compress``) do not need this.
+
+    Parameters
+    ----------
+    data : List[dict]
+        The metadata of each trajectory with the trajectory data included.
+    resample_interval : Optional[float]
+        Time interval of the resampling (None to skip it).
+    compress_tol : Optional[float]
+        Tolerance of the compression (None to skip it).
+
+    Returns
+    -------
+    List[dict]
+        The metadata with the processed trajectory data.
+    """
+    for traj_md in data:
+        traj = preprocess(traj_md["traj_data"], resample_interval)
+        # Trajectories shorter than the interval end with a single point
+        traj_md["mean_dt"] = sampled_mean_dt(traj, len(traj))
+        traj = preprocess(traj, compress_tol=compress_tol)
+        traj_md["traj_data"] = traj
+        traj_md["length"] = len(traj)
+    return data
+
+
+def load_trajs_store(store_file: Path) -> List[dict]:
+    """
+    Loads all the data from a trajectory store (see ``traj_store``).
+
+    The trajectory data are zero-copy views of the memory-mapped store, so
+    nothing is read from disk until they are used.
+
+    Parameters
+    ----------
+    store_file : Path
+        Path to the store file.
 
     Returns
     -------
     List[dict]
         The metadata of each trajectory with the trajectory data included.
     """
-    metadata_file = Path("trajectories/metadata.json")
-    metadata = load_trajs_metadata(metadata_file)
-    classes = {"car", "taxi", "bus", "walk", "bike", "subway", "train"}
-    data = [traj_md for traj_md in metadata if traj_md["class"] in classes]
+    return TrajStore(store_file).metadata()
+
+
+def select_metadata(metadata: List[dict]) -> List[dict]:
+    """
+    Selects the trajectories used in the experiments and joins similar
+    classes.
+
+    Parameters
+    ----------
+    metadata : List[dict]
+        The metadata of each trajectory.
+
+    Returns
+    -------
+    List[dict]
+        The metadata of the selected trajectories.
+    """
+    data = [traj_md for traj_md in metadata if traj_md["class"] in SELECTED_CLASSES]
     final_data = []
     for traj_md in data:
         # Filter trajs: dt <= 3s and len >= 100
-        if traj_md["mean_dt"] > 3 or traj_md["length"] < 100:
+        if traj_md["mean_dt"] > MAX_MEAN_DT or traj_md["length"] < MIN_LENGTH:
             continue
 
         # Join similar classes
-        if traj_md["class"] == "taxi":
-            traj_md["class"] = "car"
-        if traj_md["class"] == "subway":
-            traj_md["class"] = "train"
+        traj_md["class"] = JOINED_CLASSES.get(traj_md["class"], traj_md["class"])
         final_data.append(traj_md)
-    final_data = load_trajs_data(final_data)
+    return final_data
+
+
+def select_index(index: MetadataIndex) -> MetadataIndex:
+    """
+    Selects the trajectories used in the experiments from a columnar index
+    (same selection as ``select_metadata``) and joins similar classes.
+
+    Parameters
+    ----------
+    index : MetadataIndex
+        The columnar metadata index.
+
+    Returns
+    -------
+    MetadataIndex
+        The index of the selected trajectories.
+    """
+    selected_codes = index.class_codes(sorted(SELECTED_CLASSES))
+    mask = np.isin(index["class_code"], selected_codes)
+    mask &= index["mean_dt"] <= MAX_MEAN_DT
+    mask &= index["length"] >= MIN_LENGTH
+    return index[mask].remap_classes(JOINED_CLASSES)
+
+
+def get_selected_index(index_file: Path = DEFAULT_INDEX_FILE) -> MetadataIndex:
+    """
+    Loads the columnar index of the selected trajectories.
+
+    Parameters
+    ----------
+    index_file : Path
+        Path to the index file.
+
+    Returns
+    -------
+    MetadataIndex
+        The index of the selected trajectories.
+    """
+    return select_index(load_index(index_file))
+
+
+def store_is_current(
+    store_file: Path = DEFAULT_STORE_FILE,
+    metadata_file: Path = DEFAULT_METADATA_FILE,
+) -> bool:
+    """
+    Whether the trajectory store exists and was built from the current
+    metadata file (see ``traj_store.convert_trajs_folder``).
+
+    Parameters
+    ----------
+    store_file : Path
+        Path to the store file.
+    metadata_file : Path
+        Path to the json metadata file.
+
+    Returns
+    -------
+    bool
+        Whether the store can be used.
+    """
+    if not Path(store_file).exists():
+        return False
+    if not Path(metadata_file).exists():
+        return True
+    if TrajStore(store_file).source_digest == file_digest(metadata_file):
+        return True
+    logging.warning(
+        "Ignoring '%s', it was not built from the current '%s' (rebuild it "
+        "with traj_store.py)",
+        store_file,
+        metadata_file,
+    )
+    return False
+
+
+def _index_is_current(index_file: Path, metadata_file: Path) -> bool:
+    """Whether the index exists and is not older than the metadata file."""
+    if not index_file.exists():
+        return False
+    if not metadata_file.exists():
+        return True
+    return index_file.stat().st_mtime >= metadata_file.stat().st_mtime
+
+
+def get_selected_metadata(
+    store_file: Path = DEFAULT_STORE_FILE,
+    index_file: Path = DEFAULT_INDEX_FILE,
+    metadata_file: Path = DEFAULT_METADATA_FILE,
+) -> List[dict]:
+    """
+    Loads the metadata of the selected trajectories without reading their
+    data. When the trajectory store is current (see ``store_is_current``)
+    the trajectory data are included as (lazy) memory-mapped views.
+
+    Otherwise the selection is done over the columnar index (see
+    ``metadata_index``), without parsing the json metadata file, which is
+    only read when the index is missing or older than it.
+
+    Parameters
+    ----------
+    store_file : Path
+        Path to the store file.
+    index_file : Path
+        Path to the columnar index file.
+    metadata_file : Path
+        Path to the json metadata file.
+
+    Returns
+    -------
+    List[dict]
+        The metadata of the selected trajectories.
+    """
+    if store_is_current(store_file, metadata_file):
+        return select_metadata(load_trajs_store(store_file))
+    if _index_is_current(Path(index_file), Path(metadata_file)):
+        return get_selected_index(index_file).to_metadata()
+    return select_metadata(load_trajs_metadata(metadata_file))
+
+
+def iter_trajs_data(metadata: Iterable[dict]) -> Iterator[np.ndarray]:
+    """
+    Lazily loads the data of each trajectory.
+
+    Unlike ``load_trajs_data`` the data are not kept in the metadata, so
+    only the trajectory being used is in memory.
+
+    Parameters
+    ----------
+    metadata : Iterable[dict]
+        The metadata of each trajectory.
+
+    Yields
+    ------
+    np.ndarray
+        The data of each trajectory.
+    """
+    for traj_md in metadata:
+        if "traj_data" in traj_md:
+            yield traj_md["traj_data"]
+        else:
+            yield load_traj_file(traj_md["file_path"])
+
+
+def get_selected_data(
+    store_file: Path = DEFAULT_STORE_FILE,
+    compact: bool = False,
+    index_file: Path = DEFAULT_INDEX_FILE,
+    metadata_file: Path = DEFAULT_METADATA_FILE,
+) -> List[dict]:
+    """
+    Loads the selected data from the trajectory store or, if it does not
+    exist or is stale, from the trajectory files of the selected trajectories (see
+    ``get_selected_metadata``).
+
+    Parameters
+    ----------
+    store_file : Path
+        Path to the store file.
+    compact : bool
+        Whether to load the trajectory files as compact trajectories (the
+        store data are memory-mapped and not resident anyway).
+    index_file : Path
+        Path to the columnar index file.
+    metadata_file : Path
+        Path to the json metadata file.
+
+    Returns
+    -------
+    List[dict]
+        The metadata of each trajectory with the trajectory data included.
+    """
+    final_data = get_selected_metadata(store_file, index_file, metadata_file)
+    # The store metadata already include the (memory-mapped) data
+    if final_data and "traj_data" not in final_data[0]:
+        final_data = load_trajs_data(final_data, compact)
     return final_data
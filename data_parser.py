@@ -9,14 +9,37 @@ each trajectory) with the following keys:
     - id: the trajectory id
     - file_path: the path to the trajectory file
     - class: the class of the trajectory
+    - mean_dt, length, duration: time step (before the compression, if
+      any), number of points and duration
+    - min_lat, max_lat, min_lon, max_lon: bounding box
+    - distance: total distance traveled
+
+The same metadata is also saved as a columnar index (see ``metadata_index``).
+
+A manifest file records the input files of each processed user and the
+metadata produced for them, so later runs only process the new or modified
+users (and an interrupted run resumes where it stopped). It is a JSON Lines
+file: a header with the manifest version and a line per user, appended as
+soon as the user is processed.
 """
+import argparse
 import json
 import logging
+import os
+import warnings
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 from pathlib import Path
-from typing import List, NamedTuple, Tuple
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
 
 import numpy as np
+import numpy.typing as npt
+
+import feature_est as fe
+from compact_traj import CompactTraj, save_compact
+from instrumentation import Instrument, get_instrument, sink_for_path, using
+from metadata_index import save_index
+from traj_resample import preprocess, sampled_mean_dt
 
 logging.basicConfig(
     level=logging.INFO,
@@ -24,9 +47,6 @@ logging.basicConfig(
     datefmt="%H:%M:%S",
 )
 
-metadata: List[dict] = []
-
-
 LabelData = NamedTuple(
     "LabelData", [("start_dt", datetime), ("end_dt", datetime), ("clsf", str)]
 )
@@ -36,7 +56,32 @@ Register = Tuple[float, float, datetime]
 """Register data (GPS point and time) in the form: lat, lon, time"""
 
 
-def process_usr_trajs(usr_folder: Path) -> None:
+Registers = NamedTuple(
+    "Registers",
+    [
+        ("lat", npt.NDArray[np.float64]),
+        ("lon", npt.NDArray[np.float64]),
+        ("time", npt.NDArray[np.datetime64]),
+    ],
+)
+"""Columns of several registers (GPS points and times in seconds)"""
+
+PLT_HEADER_LINES = 6
+PLT_DAYS_EPOCH = np.datetime64("1899-12-30T00:00:00", "s")
+"""Origin of the fractional-day column (field 5) of the PLT files"""
+SECONDS_PER_DAY = 86400
+
+MANIFEST_VERSION = 2
+"""Version of the manifest (and of the metadata keys it holds). Manifests of
+other versions are ignored, so every user is processed again."""
+
+
+def process_usr_trajs(
+    usr_folder: Path,
+    compact: bool = False,
+    resample_interval: Optional[float] = None,
+    compress_tol: Optional[float] = None,
+) -> List[dict]:
     """
     Processes the trajectories of a user.
 
@@ -44,61 +89,153 @@ def process_usr_trajs(usr_folder: Path) -> None:
     ----------
     usr_folder : Path
         The path to the user folder.
+    compact : bool
+        Whether to save the trajectories as compact ``.npz`` files (see
+        ``compact_traj``) instead of text files.
+    resample_interval : Optional[float]
+        If given, the trajectories are resampled at this time interval (see
+        ``traj_resample.resample``).
+    compress_tol : Optional[float]
+        If given, the redundant points (within this tolerance) are removed
+        (see ``traj_resample.compress``).
+
+    Returns
+    -------
+    List[dict]
+        The metadata of each trajectory of the user.
     """
+    usr_metadata: List[dict] = []
     labels_file = usr_folder / "labels.txt"
     if not labels_file.exists():
-        return
+        return usr_metadata
 
     labels = load_labels(labels_file)
-    all_regs = load_registers(usr_folder)
+    regs = load_registers(usr_folder)
 
     logging.info("Processing trajectories")
     dest_folder = Path(f"./trajectories/{usr_folder.name}")
     dest_folder.mkdir(parents=True, exist_ok=True)
 
-    label_idx = 0
+    inst = get_instrument()
+    for label_idx, traj in split_trajs(regs, labels):
+        if resample_interval is not None or compress_tol is not None:
+            inst.count("points_before_preprocess", len(traj))
+            traj = preprocess(traj, resample_interval)
+            n_sampled = len(traj)
+            traj = preprocess(traj, compress_tol=compress_tol)
+            if len(traj) < 2:
+                continue
+        else:
+            n_sampled = len(traj)
+        inst.count("trajectories_written")
+        label = labels[label_idx]
+        traj_id = f"{usr_folder.name}_{label_idx}"
+        if compact:
+            file_path = str(dest_folder / f"{label_idx}_{label.clsf}.npz")
+            save_compact(file_path, CompactTraj.from_array(traj))
+        else:
+            file_path = str(dest_folder / f"{label_idx}_{label.clsf}.txt")
+            np.savetxt(file_path, traj)
+        usr_metadata.append(
+            {
+                "id": traj_id,
+                "file_path": file_path,
+                "class": label.clsf,
+                "mean_dt": sampled_mean_dt(traj, n_sampled),
+                "length": len(traj),
+                "duration": traj[-1, 2] - traj[0, 2],
+                "min_lat": np.min(traj[:, 0]),
+                "max_lat": np.max(traj[:, 0]),
+                "min_lon": np.min(traj[:, 1]),
+                "max_lon": np.max(traj[:, 1]),
+                "distance": fe.distance(traj),
+            }
+        )
+    return usr_metadata
+
+
+def split_trajs(
+    regs: Registers, labels: List[LabelData]
+) -> List[Tuple[int, npt.NDArray[np.float64]]]:
+    """
+    Splits the registers of a user into the trajectories of its labels.
+
+    The labels are visited in file order with a cursor over the registers
+    (sorted by time): each label takes the registers inside its bounds that
+    come after the ones taken by the previous label, so a register is never
+    assigned to two overlapping labels. The bounds of every label are found
+    with ``np.searchsorted`` and each trajectory is built in a vectorized
+    pass that also removes registers with repeated times.
+
+    A trajectory is only kept if it has at least 2 points and there are
+    registers after the end of its label. A single point trajectory is
+    carried over to the trajectory of the next label.
+
+    Parameters
+    ----------
+    regs : Registers
+        The registers of the user.
+    labels : List[LabelData]
+        The labels of the user.
+
+    Returns
+    -------
+    List[Tuple[int, npt.NDArray[np.float64]]]
+        The label index and the trajectory (Nx3 matrix whose time column is
+        in seconds since the label start) of each trajectory.
+    """
+    times = regs.time
+    if np.any(times[1:] < times[:-1]):
+        order = np.argsort(times, kind="stable")
+        regs = Registers(regs.lat[order], regs.lon[order], times[order])
+        times = regs.time
+
+    starts = np.array([label.start_dt for label in labels], dtype="datetime64[s]")
+    ends = np.array([label.end_dt for label in labels], dtype="datetime64[s]")
+    first_in = np.searchsorted(times, starts, side="left")
+    first_after_start = np.searchsorted(times, starts, side="right")
+    first_after_end = np.searchsorted(times, ends, side="right")
+
+    trajs = []
+    carry = np.empty((0, 3))
     regs_idx = 0
-    label = labels[label_idx]
-    traj: List[List[float]] = []
-    while regs_idx < len(all_regs):
-        print(f"{(regs_idx + 1) / len(all_regs):.2%}", end="\r")
-        lat, long, reg_dt = all_regs[regs_idx]
-
-        # Register inside label bounds
-        if label.start_dt <= reg_dt <= label.end_dt:
-            time = (reg_dt - label.start_dt).seconds
-            if not traj or time != traj[-1][-1]:
-                traj.append([lat, long, time])
-
-        # Register outside label bounds
-        elif label.start_dt < reg_dt:
-            # Save the trajectory if it has at least 2 points
-            if len(traj) > 1:
-                traj_id = f"{usr_folder.name}_{label_idx}"
-                file_path = str(dest_folder / f"{label_idx}_{label.clsf}.txt")
-                npy_traj = np.array(traj)
-                np.savetxt(file_path, npy_traj)
-                metadata.append(
-                    {
-                        "id": traj_id,
-                        "file_path": file_path,
-                        "class": label.clsf,
-                        "mean_dt": np.mean(np.diff(npy_traj[:, 2])),
-                        "length": len(traj),
-                    }
-                )
-                traj = []
-
-            # Move to the next label
-            label_idx += 1
-            if label_idx >= len(labels):
-                break
-            label = labels[label_idx]
-            continue  # Don't increment regs_idx yet
-        regs_idx += 1
-
-
-def load_registers(usr_folder: Path) -> List[Register]:
+    for label_idx in range(len(labels)):
+        if starts[label_idx] <= ends[label_idx]:
+            low = max(regs_idx, first_in[label_idx])
+            high = max(low, first_after_end[label_idx])
+        else:
+            low = high = max(regs_idx, first_after_start[label_idx])
+        if high >= len(times):
+            # There is no register after the label end
+            break
+
+        # Seconds since the label start (ignoring whole days)
+        rel_time = (times[low:high] - starts[label_idx]).astype(np.int64)
+        rel_time %= SECONDS_PER_DAY
+        keep = np.empty(len(rel_time), dtype=bool)
+        keep[1:] = rel_time[1:] != rel_time[:-1]
+        if len(keep):
+            keep[0] = not len(carry) or rel_time[0] != carry[-1, 2]
+        traj = np.concatenate(
+            [
+                carry,
+                np.column_stack(
+                    [regs.lat[low:high], regs.lon[low:high], rel_time]
+                )[keep],
+            ]
+        )
+
+        # Save the trajectory if it has at least 2 points
+        if len(traj) > 1:
+            trajs.append((label_idx, traj))
+            carry = np.empty((0, 3))
+        else:
+            carry = traj
+        regs_idx = high
+    return trajs
+
+
+def load_registers(usr_folder: Path) -> Registers:
     """
     Loads all the registers of a user.
 
@@ -109,19 +246,53 @@ def load_registers(usr_folder: Path) -> List[Register]:
 
     Returns
     -------
-    List[Register]
-        The list of registers (all together).
+    Registers
+        The registers (all together).
     """
     logging.info("Loading registers")
-    all_regs = []
     trajs_folder = usr_folder / "Trajectory"
     sorted_paths = sorted(trajs_folder.iterdir())
-    for i, plt in enumerate(sorted_paths):
-        print(f"{(i + 1) / len(sorted_paths):.2%}", end="\r")
-        with open(plt, "r", encoding="utf-8") as reg:
-            registers = [parse_register(line) for line in reg.readlines()[6:]]
-            all_regs += registers
-    return all_regs
+    plt_regs = []
+    inst = get_instrument()
+    with inst.stage("load_registers"):
+        for i, plt in enumerate(sorted_paths):
+            inst.progress("load_registers", i + 1, len(sorted_paths))
+            plt_regs.append(load_plt(plt))
+    if not plt_regs:
+        return Registers(np.empty(0), np.empty(0), np.empty(0, dtype="datetime64[s]"))
+    return Registers(*(np.concatenate(col) for col in zip(*plt_regs)))
+
+
+def load_plt(plt: Path) -> Registers:
+    """
+    Loads the registers of a PLT file.
+
+    The numeric columns are parsed in bulk and the time of each register is
+    taken from the fractional-day column (rounded to seconds), which avoids
+    parsing the date and time strings of every line.
+
+    Parameters
+    ----------
+    plt : Path
+        The path to the PLT file.
+
+    Returns
+    -------
+    Registers
+        The registers of the file.
+    """
+    with warnings.catch_warnings():
+        # Some PLT files contain only the header
+        warnings.filterwarnings("ignore", "loadtxt: input contained no data")
+        data = np.loadtxt(
+            plt, delimiter=",", skiprows=PLT_HEADER_LINES, usecols=(0, 1, 4), ndmin=2
+        )
+    seconds = np.rint(data[:, 2] * SECONDS_PER_DAY).astype(np.int64)
+    times = PLT_DAYS_EPOCH + seconds.astype("timedelta64[s]")
+    inst = get_instrument()
+    inst.count("points_read", len(data))
+    inst.count("bytes_read", plt.stat().st_size)
+    return Registers(data[:, 0], data[:, 1], times)
 
 
 def parse_register(line: str) -> Register:
@@ -185,26 +356,294 @@ def parse_label(line: str) -> LabelData:
     return LabelData(start_dt, end_dt, clsf)
 
 
-def main():
-    """Main function. Processes all the users."""
-    dataset_folder = Path("./geolife_dataset")
+def _process_usr(usr: Path, progress: str, options: dict) -> List[dict]:
+    logging.info("Processing user: %s - %s", usr.name, progress)
+    return process_usr_trajs(usr, **options)
+
+
+def _process_usr_counted(
+    usr: Path, progress: str, options: dict
+) -> Tuple[List[dict], Dict[str, int]]:
+    """Processes a user in a worker process, where the counters of the
+    instrument of the parent process are not reachable, and returns them."""
+    with using(Instrument(sinks=[])) as inst:
+        usr_md = _process_usr(usr, progress, options)
+    return usr_md, inst.counters
+
+
+def _map_usrs(
+    usr_folders: List[Path], workers: Optional[int], options: dict
+) -> Iterator[List[dict]]:
+    progress = [f"{(i + 1) / len(usr_folders):.2%}" for i in range(len(usr_folders))]
+    all_options = [options] * len(usr_folders)
+    if workers == 1:
+        yield from map(_process_usr, usr_folders, progress, all_options)
+        return
+    inst = get_instrument()
+    # Results are returned in user order, so the merge is deterministic
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for usr_md, counters in executor.map(
+            _process_usr_counted, usr_folders, progress, all_options
+        ):
+            for name, value in counters.items():
+                inst.count(name, value)
+            yield usr_md
+
+
+def usr_fingerprint(usr_folder: Path) -> Dict[str, List[int]]:
+    """
+    Gets the modification time and size of the input files of a user.
+
+    Parameters
+    ----------
+    usr_folder : Path
+        The path to the user folder.
+
+    Returns
+    -------
+    Dict[str, List[int]]
+        The mtime (in ns) and size of the labels and PLT files of the user
+        by their path relative to the user folder.
+    """
+    files = [usr_folder / "labels.txt"]
+    trajs_folder = usr_folder / "Trajectory"
+    if trajs_folder.exists():
+        files += sorted(trajs_folder.iterdir())
+    fingerprint = {}
+    for file in files:
+        if file.exists():
+            stat = file.stat()
+            fingerprint[file.relative_to(usr_folder).as_posix()] = [
+                stat.st_mtime_ns,
+                stat.st_size,
+            ]
+    return fingerprint
+
+
+def load_manifest(manifest_file: Path) -> Dict[str, dict]:
+    """
+    Loads the manifest of a previous (maybe interrupted) run.
+
+    A manifest of another version (or an unversioned one) is ignored. A line
+    that cannot be decoded (a run killed while appending it) is skipped.
+
+    Parameters
+    ----------
+    manifest_file : Path
+        The path to the manifest file.
+
+    Returns
+    -------
+    Dict[str, dict]
+        The fingerprint (``files``), the options (``options``) and the
+        trajectories metadata (``metadata``) of each processed user.
+    """
+    if not manifest_file.exists():
+        return {}
+    manifest: Dict[str, dict] = {}
+    with open(manifest_file, "r", encoding="utf-8") as m_file:
+        try:
+            header = json.loads(m_file.readline())
+        except json.JSONDecodeError:
+            header = None
+        if not isinstance(header, dict) or header.get("version") != MANIFEST_VERSION:
+            logging.warning("Ignoring the manifest of another version")
+            return {}
+        for line in m_file:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            manifest[entry.pop("user")] = entry
+    return manifest
+
+
+def save_manifest(manifest: Dict[str, dict], manifest_file: Path) -> None:
+    """
+    Saves the manifest (atomically).
+
+    Parameters
+    ----------
+    manifest : Dict[str, dict]
+        The manifest.
+    manifest_file : Path
+        The path to the manifest file.
+    """
+    manifest_file.parent.mkdir(parents=True, exist_ok=True)
+    tmp_file = manifest_file.with_name(f"{manifest_file.name}.tmp")
+    with open(tmp_file, "w", encoding="utf-8") as m_file:
+        m_file.write(json.dumps({"version": MANIFEST_VERSION}) + "\n")
+        for usr_name, entry in manifest.items():
+            m_file.write(_manifest_line(usr_name, entry))
+    os.replace(tmp_file, manifest_file)
+
+
+def append_manifest(usr_name: str, entry: dict, manifest_file: Path) -> None:
+    """
+    Appends the entry of a processed user to a saved manifest.
+
+    Parameters
+    ----------
+    usr_name : str
+        The user.
+    entry : dict
+        The fingerprint, options and metadata of the user.
+    manifest_file : Path
+        The path to the manifest file.
+    """
+    with open(manifest_file, "a", encoding="utf-8") as m_file:
+        m_file.write(_manifest_line(usr_name, entry))
+
+
+def _manifest_line(usr_name: str, entry: dict) -> str:
+    return json.dumps({"user": usr_name, **entry}, ensure_ascii=False) + "\n"
+
+
+def main(
+    workers: Optional[int] = 1,
+    incremental: bool = True,
+    dataset_folder: Path = Path("./geolife_dataset"),
+    compact: bool = False,
+    resample_interval: Optional[float] = None,
+    compress_tol: Optional[float] = None,
+):
+    """
+    Main function. Processes all the users.
+
+    Parameters
+    ----------
+    workers : Optional[int]
+        Number of worker processes the user folders are distributed over.
+        ``1`` processes them sequentially and ``None`` uses all the cores.
+        The output does not depend on this value.
+    incremental : bool
+        Whether to skip the users whose files did not change since the last
+        run. Each user is appended to the manifest once processed, so an
+        interrupted run resumes where it stopped.
+    dataset_folder : Path
+        Folder of the GeoLife dataset (one folder per user).
+    compact : bool
+        Whether to save the trajectories as compact ``.npz`` files (see
+        ``compact_traj``).
+    resample_interval : Optional[float]
+        If given, the trajectories are resampled at this time interval
+        (whole seconds if ``compact``).
+    compress_tol : Optional[float]
+        If given, the redundant points of the trajectories are removed.
+
+    Users processed with other ``compact``, ``resample_interval`` or
+    ``compress_tol`` values are processed again.
+    """
+    if compact and resample_interval is not None and resample_interval % 1:
+        raise ValueError("Compact trajectories need a whole-second interval")
+    options = {
+        "compact": compact,
+        "resample_interval": resample_interval,
+        "compress_tol": compress_tol,
+    }
+    dataset_folder = Path(dataset_folder)
     if not dataset_folder.exists():
         raise FileNotFoundError(f"Dataset folder not found. Path: '{dataset_folder}'")
 
     usr_folders = list(sorted(dataset_folder.iterdir()))
-    for i, usr in enumerate(usr_folders):
-        logging.info(
-            "Processing user: %s - %s", usr.name, f"{(i + 1) / len(usr_folders):.2%}"
-        )
-        process_usr_trajs(usr)
+    manifest_file = Path("./trajectories/manifest.jsonl")
+    manifest = load_manifest(manifest_file) if incremental else {}
+    fingerprints = {usr.name: usr_fingerprint(usr) for usr in usr_folders}
+    pending = [
+        usr
+        for usr in usr_folders
+        if manifest.get(usr.name, {}).get("files") != fingerprints[usr.name]
+        or manifest[usr.name].get("options") != options
+    ]
+    logging.info(
+        "Users to process: %d (%d unchanged)",
+        len(pending),
+        len(usr_folders) - len(pending),
+    )
+
+    # Remove the outputs of the users that are no longer (or will be again)
+    # processed
+    kept_usrs = set(fingerprints) - {usr.name for usr in pending}
+    for usr_name in list(manifest):
+        if usr_name not in kept_usrs:
+            for traj_md in manifest.pop(usr_name)["metadata"]:
+                Path(traj_md["file_path"]).unlink(missing_ok=True)
+    # Written once per run, the processed users are appended to it
+    save_manifest(manifest, manifest_file)
+
+    for usr, usr_md in zip(pending, _map_usrs(pending, workers, options)):
+        manifest[usr.name] = {
+            "files": fingerprints[usr.name],
+            "options": options,
+            "metadata": usr_md,
+        }
+        append_manifest(usr.name, manifest[usr.name], manifest_file)
+    metadata = [
+        traj_md for usr in usr_folders for traj_md in manifest[usr.name]["metadata"]
+    ]
 
     logging.info("Saving metadata")
     metadata_file = Path("./trajectories/metadata.json")
     metadata_file.parent.mkdir(parents=True, exist_ok=True)
     with open(metadata_file, "w", encoding="utf-8") as doc:
         json.dump(metadata, doc, indent=4, ensure_ascii=False)
+    save_index(metadata, Path("./trajectories/metadata_index.npz"))
     logging.info("Done")
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "-j",
+        "--workers",
+        type=int,
+        default=1,
+        help="number of worker processes (0 uses all the cores)",
+    )
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="process every user, even the unchanged ones",
+    )
+    parser.add_argument(
+        "--dataset",
+        type=Path,
+        default=Path("./geolife_dataset"),
+        help="folder of the GeoLife dataset",
+    )
+    parser.add_argument(
+        "--metrics",
+        type=Path,
+        default=None,
+        help="export the metrics (counters and stage times) to a json or csv file",
+    )
+    parser.add_argument(
+        "--compact",
+        action="store_true",
+        help="save the trajectories as compact .npz files (float32/int32)",
+    )
+    parser.add_argument(
+        "--resample",
+        type=float,
+        default=None,
+        metavar="SECONDS",
+        help="resample the trajectories at a uniform time interval",
+    )
+    parser.add_argument(
+        "--compress",
+        type=float,
+        default=None,
+        metavar="TOL",
+        help="remove the redundant points (within TOL degrees)",
+    )
+    args = parser.parse_args()
+    sinks = [] if args.metrics is None else [sink_for_path(args.metrics)]
+    with using(Instrument(get_instrument().sinks + sinks)):
+        main(
+            args.workers or None,
+            incremental=not args.full,
+            dataset_folder=args.dataset,
+            compact=args.compact,
+            resample_interval=args.resample,
+            compress_tol=args.compress,
+        )
@@ -0,0 +1,432 @@
+"""
+Parallel runner of the classifier experiments of ``supervised_feat.ipynb``.
+
+An experiment is a declarative (json-like) config::
+
+    {
+        "name": "pca_random_forest",
+        "model": "random_forest",
+        "params": {"criterion": "entropy", "random_state": 0},
+        "steps": [["pca", {"n_components": 15}]],
+    }
+
+where ``model`` and the preprocessing ``steps`` are names of ``ESTIMATORS``.
+The train/validation/test splits are computed once (the stratified, seeded
+scheme of the notebook) and the feature matrix is written to a ``.npy`` file
+of the working folder that the worker processes memory-map, so it is shared
+instead of copied to each of them.
+
+Each finished experiment is appended to ``results.jsonl`` (validation and
+test accuracy, test AUC, fit and predict times), keyed by a hash of its
+config, the feature matrix, the classes and the seed. A new run skips the
+experiments already in it.
+
+Usage::
+
+    python experiment_runner.py --work-dir experiments -j 4
+"""
+import argparse
+import hashlib
+import importlib
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from feature_pipeline import RF_PARAMS
+
+FEATURES_FILE = "features.npy"
+SPLITS_FILE = "splits.npz"
+RESULTS_FILE = "results.jsonl"
+
+ESTIMATORS = {
+    "knn": ("sklearn.neighbors", "KNeighborsClassifier"),
+    "svm": ("sklearn.svm", "SVC"),
+    "tree": ("sklearn.tree", "DecisionTreeClassifier"),
+    "random_forest": ("sklearn.ensemble", "RandomForestClassifier"),
+    "scaler": ("sklearn.preprocessing", "StandardScaler"),
+    "pca": ("sklearn.decomposition", "PCA"),
+}
+"""Module and class of each estimator name"""
+
+NOTEBOOK_EXPERIMENTS: List[dict] = [
+    {"name": "knn", "model": "knn", "params": {"weights": "distance"}},
+    {
+        "name": "knn_20",
+        "model": "knn",
+        "params": {"weights": "distance", "n_neighbors": 20},
+    },
+    {
+        "name": "svm_poly",
+        "model": "svm",
+        "params": {"kernel": "poly", "degree": 3, "gamma": "scale", "random_state": 0},
+        "steps": [["scaler", {}]],
+    },
+    {
+        "name": "svm_sigmoid",
+        "model": "svm",
+        "params": {"kernel": "sigmoid", "gamma": "auto", "random_state": 0},
+        "steps": [["scaler", {}]],
+    },
+    {
+        "name": "svm_rbf",
+        "model": "svm",
+        "params": {
+            "kernel": "rbf",
+            "gamma": "auto",
+            "probability": True,
+            "random_state": 0,
+        },
+        "steps": [["scaler", {}]],
+    },
+    {
+        "name": "tree",
+        "model": "tree",
+        "params": {"criterion": "entropy", "random_state": 0},
+    },
+    {"name": "random_forest", "model": "random_forest", "params": RF_PARAMS},
+    {
+        "name": "pca_random_forest",
+        "model": "random_forest",
+        "params": RF_PARAMS,
+        "steps": [["pca", {"n_components": 15}]],
+    },
+    {
+        "name": "scaled_random_forest",
+        "model": "random_forest",
+        "params": RF_PARAMS,
+        "steps": [["scaler", {}]],
+    },
+]
+"""The classifiers tried in ``supervised_feat.ipynb``"""
+
+
+def _estimator(name: str, params: dict) -> Any:
+    if name not in ESTIMATORS:
+        raise ValueError(f"Unknown estimator: '{name}'")
+    module, cls_name = ESTIMATORS[name]
+    return getattr(importlib.import_module(module), cls_name)(**params)
+
+
+def build_model(config: dict) -> Any:
+    """
+    Builds the (unfitted) model of an experiment config.
+
+    Parameters
+    ----------
+    config : dict
+        The experiment config (see the module docstring).
+
+    Returns
+    -------
+    Any
+        The estimator, or a pipeline if the config has preprocessing steps.
+    """
+    model = _estimator(config["model"], config.get("params", {}))
+    steps = config.get("steps", [])
+    if not steps:
+        return model
+    # pylint: disable=C0415
+    from sklearn.pipeline import Pipeline
+
+    pipe_steps = [
+        (f"{i}_{name}", _estimator(name, params))
+        for i, (name, params) in enumerate(steps)
+    ]
+    return Pipeline(pipe_steps + [("model", model)])
+
+
+def make_splits(
+    clss: Sequence[int], seed: int = 0
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Train, validation and test indices (the scheme of the notebook).
+
+    70% of the samples are used for training. The rest is split into the
+    validation (85%) and test (15%) sets. Both splits are stratified by
+    class.
+
+    Parameters
+    ----------
+    clss : Sequence[int]
+        The class of each sample.
+    seed : int
+        Random state of the splits.
+
+    Returns
+    -------
+    Tuple[np.ndarray, np.ndarray, np.ndarray]
+        The train, validation and test indices.
+    """
+    # pylint: disable=C0415
+    from sklearn.model_selection import train_test_split
+
+    clss = np.asarray(clss)
+    train, rest = train_test_split(
+        np.arange(len(clss)), stratify=clss, random_state=seed, test_size=0.30
+    )
+    val, test = train_test_split(
+        rest, stratify=clss[rest], random_state=seed, test_size=0.15
+    )
+    return train, val, test
+
+
+def experiment_key(config: dict, data_digest: str, seed: int) -> str:
+    """
+    Key of an experiment (results with the same key are reused).
+
+    Parameters
+    ----------
+    config : dict
+        The experiment config.
+    data_digest : str
+        Digest of the feature matrix and the classes.
+    seed : int
+        Random state of the splits.
+
+    Returns
+    -------
+    str
+        The key.
+    """
+    payload = json.dumps([config, data_digest, seed], sort_keys=True)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def _data_digest(feat_vectors: np.ndarray, clss: np.ndarray) -> str:
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(str(feat_vectors.shape).encode("utf-8"))
+    digest.update(np.ascontiguousarray(feat_vectors, dtype=np.float64))
+    digest.update(np.ascontiguousarray(clss, dtype=np.int64))
+    return digest.hexdigest()
+
+
+def _auc(model: Any, x_test: np.ndarray, y_test: np.ndarray) -> Optional[float]:
+    """One-vs-rest AUC (None if the model has no probabilities or a class is
+    missing from the test labels, where the AUC is undefined)."""
+    # pylint: disable=C0415
+    from sklearn.metrics import roc_auc_score
+
+    try:
+        proba = model.predict_proba(x_test)
+    except AttributeError:
+        # E.g. SVC without probability=True
+        return None
+    if len(np.unique(y_test)) < len(model.classes_):
+        return None
+    if proba.shape[1] == 2:
+        return float(roc_auc_score(y_test, proba[:, 1]))
+    return float(
+        roc_auc_score(y_test, proba, multi_class="ovr", labels=model.classes_)
+    )
+
+
+def _run_experiment(work_dir: Path, config: dict) -> dict:
+    """Fits and scores the model of a config (in a worker process)."""
+    feat_vectors = np.load(work_dir / FEATURES_FILE, mmap_mode="r")
+    with np.load(work_dir / SPLITS_FILE) as splits:
+        clss, train, val, test = (
+            splits[name] for name in ("clss", "train", "val", "test")
+        )
+
+    model = build_model(config)
+    start = time.perf_counter()
+    model.fit(feat_vectors[train], clss[train])
+    fit_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    val_pred = model.predict(feat_vectors[val])
+    test_pred = model.predict(feat_vectors[test])
+    predict_seconds = time.perf_counter() - start
+    return {
+        "name": config.get("name", config["model"]),
+        "val_accuracy": float(np.mean(val_pred == clss[val])),
+        "test_accuracy": float(np.mean(test_pred == clss[test])),
+        "test_auc": _auc(model, feat_vectors[test], clss[test]),
+        "fit_seconds": fit_seconds,
+        "predict_seconds": predict_seconds,
+    }
+
+
+def load_results(work_dir: Path) -> Dict[str, dict]:
+    """
+    Results of the finished experiments of a working folder.
+
+    Parameters
+    ----------
+    work_dir : Path
+        The working folder.
+
+    Returns
+    -------
+    Dict[str, dict]
+        The result of each experiment key.
+    """
+    results_file = Path(work_dir) / RESULTS_FILE
+    if not results_file.exists():
+        return {}
+    results = {}
+    with open(results_file, "r", encoding="utf-8") as r_file:
+        for line in r_file:
+            if line.strip():
+                result = json.loads(line)
+                results[result["key"]] = result
+    return results
+
+
+def _append_result(work_dir: Path, result: dict) -> None:
+    with open(work_dir / RESULTS_FILE, "a", encoding="utf-8") as r_file:
+        r_file.write(json.dumps(result) + "\n")
+
+
+def run_experiments(
+    configs: List[dict],
+    feat_vectors: np.ndarray,
+    clss: Sequence[int],
+    work_dir: Path = Path("experiments"),
+    workers: Optional[int] = 1,
+    seed: int = 0,
+) -> List[dict]:
+    """
+    Runs the experiments that are not finished yet.
+
+    Parameters
+    ----------
+    configs : List[dict]
+        The experiment configs (see the module docstring).
+    feat_vectors : np.ndarray
+        The feature matrix.
+    clss : Sequence[int]
+        The class of each vector.
+    work_dir : Path
+        Folder of the shared feature matrix, the splits and the results.
+    workers : Optional[int]
+        Number of worker processes the experiments are distributed over.
+        ``1`` runs them sequentially and ``None`` (or ``0``) uses all the
+        cores. The results do not depend on this value.
+    seed : int
+        Random state of the splits.
+
+    Returns
+    -------
+    List[dict]
+        The result of each config (in the order of ``configs``): its
+        ``name``, ``val_accuracy``, ``test_accuracy``, ``test_auc`` (None if
+        the model has no probabilities or a class is missing from the test
+        split), ``fit_seconds``,
+        ``predict_seconds``, ``key`` and ``config``.
+    """
+    workers = workers or None
+    work_dir = Path(work_dir)
+    work_dir.mkdir(parents=True, exist_ok=True)
+    clss = np.asarray(clss, dtype=np.int64)
+    if len(feat_vectors) != len(clss):
+        raise ValueError("There must be a class for each feature vector")
+    data_digest = _data_digest(feat_vectors, clss)
+    keys = [experiment_key(config, data_digest, seed) for config in configs]
+    results = load_results(work_dir)
+    pending = [
+        (key, config)
+        for key, config in dict(zip(keys, configs)).items()
+        if key not in results
+    ]
+
+    if pending:
+        features = np.lib.format.open_memmap(
+            work_dir / FEATURES_FILE, mode="w+", shape=feat_vectors.shape
+        )
+        features[:] = feat_vectors
+        features.flush()
+        del features
+        train, val, test = make_splits(clss, seed)
+        np.savez(work_dir / SPLITS_FILE, clss=clss, train=train, val=val, test=test)
+
+    def finish(key: str, config: dict, result: dict) -> None:
+        result.update(key=key, config=config)
+        _append_result(work_dir, result)
+        results[key] = result
+
+    if workers == 1:
+        for key, config in pending:
+            finish(key, config, _run_experiment(work_dir, config))
+    elif pending:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                executor.submit(_run_experiment, work_dir, config): (key, config)
+                for key, config in pending
+            }
+            for future in as_completed(futures):
+                finish(*futures[future], future.result())
+    return [results[key] for key in keys]
+
+
+def format_results(results: List[dict]) -> str:
+    """
+    Text table of the results of some experiments.
+
+    Parameters
+    ----------
+    results : List[dict]
+        The results (see ``run_experiments``).
+
+    Returns
+    -------
+    str
+        The table.
+    """
+    lines = [
+        f"{'name':<24}{'val_acc':>9}{'test_acc':>9}{'test_auc':>9}"
+        f"{'fit_s':>9}{'predict_s':>10}"
+    ]
+    for result in results:
+        auc = result["test_auc"]
+        lines.append(
+            f"{result['name']:<24}{result['val_accuracy']:>9.4f}"
+            f"{result['test_accuracy']:>9.4f}"
+            f"{'-' if auc is None else f'{auc:.4f}':>9}"
+            f"{result['fit_seconds']:>9.2f}{result['predict_seconds']:>10.2f}"
+        )
+    return "\n".join(lines)
+
+
+def main():
+    """Runs the experiments of the notebook over the cached feature vectors."""
+    # pylint: disable=C0415
+    from data_handler import get_selected_data
+    from feature_cache import get_cached_feat_vectors
+
+    parser = argparse.ArgumentParser(description="Classifier experiments")
+    parser.add_argument("--work-dir", type=Path, default=Path("experiments"))
+    parser.add_argument(
+        "--configs",
+        type=Path,
+        default=None,
+        help="json file with the list of experiment configs (the ones of "
+        "supervised_feat.ipynb by default)",
+    )
+    parser.add_argument(
+        "-j",
+        "--workers",
+        type=int,
+        default=1,
+        help="number of worker processes (0 to use all the cores)",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    configs = NOTEBOOK_EXPERIMENTS
+    if args.configs is not None:
+        with open(args.configs, "r", encoding="utf-8") as c_file:
+            configs = json.load(c_file)
+    feat_vectors, _, clss = get_cached_feat_vectors(get_selected_data())
+    results = run_experiments(
+        configs, feat_vectors, clss, args.work_dir, args.workers or None, args.seed
+    )
+    print(format_results(results))
+
+
+if __name__ == "__main__":
+    main()
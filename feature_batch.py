@@ -0,0 +1,161 @@
+"""
+Batched feature estimation over many trajectories at once.
+
+The trajectories are packed into a single concatenated Nx3 array (``points``)
+and an ``offsets`` index of length ``n_traj + 1`` so that the i-th trajectory
+is ``points[offsets[i]:offsets[i + 1]]``. Every feature in
+``feature_vec.feat_name`` is then computed with segment-wise vectorized
+reductions instead of one small NumPy call per trajectory and feature.
+"""
+
+from typing import List, Tuple
+
+import numpy as np
+import numpy.typing as npt
+from numpy.linalg import norm
+
+import feature_est as fe
+
+FloatArray = npt.NDArray[np.float64]
+IntArray = npt.NDArray[np.int64]
+
+MIN_TRAJ_LEN = 4
+"""Minimum number of points needed to estimate every feature."""
+
+
+def pack_trajs(trajs: List[FloatArray]) -> Tuple[FloatArray, IntArray]:
+    """
+    Packs a list of trajectories into a concatenated array and offsets.
+
+    Parameters
+    ----------
+    trajs : List[FloatArray]
+        Trajectories (Nx3 arrays).
+
+    Returns
+    -------
+    Tuple[FloatArray, IntArray]
+        The concatenated points and the offsets index (``n_traj + 1``).
+    """
+    lengths = np.fromiter((len(traj) for traj in trajs), dtype=np.int64)
+    offsets = np.zeros(len(trajs) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    if not trajs:
+        return np.empty((0, 3)), offsets
+    points = np.concatenate([np.asarray(traj, dtype=np.float64) for traj in trajs])
+    return points, offsets
+
+
+def _valid_mask(offsets: IntArray, order: int) -> npt.NDArray[np.bool_]:
+    """
+    Mask of the positions of a global ``order``-th difference that do not
+    cross a trajectory boundary.
+    """
+    size = int(offsets[-1]) - order
+    mask = np.ones(size, dtype=bool)
+    for k in range(1, order + 1):
+        ends = offsets[1:] - k
+        mask[ends[(ends >= 0) & (ends < size)]] = False
+    return mask
+
+
+def _segment_sum(values: FloatArray, offsets: IntArray) -> FloatArray:
+    return np.add.reduceat(values, offsets[:-1])
+
+
+def batch_feat_vectors(
+    points: FloatArray, offsets: IntArray, threashold: float
+) -> FloatArray:
+    """
+    Computes the feature vectors of many packed trajectories.
+
+    Parameters
+    ----------
+    points : FloatArray
+        Concatenated points of all the trajectories.
+    offsets : IntArray
+        Offsets index of the trajectories.
+    threashold : float
+        Threashold used by the velocity change rate and the stop rate.
+
+    Returns
+    -------
+    FloatArray
+        A (n_traj, 51) matrix following the ``feature_vec.feat_name`` layout.
+    """
+    offsets = np.asarray(offsets, dtype=np.int64)
+    lengths = np.diff(offsets)
+    if np.any(lengths < MIN_TRAJ_LEN):
+        raise ValueError(
+            f"Every trajectory needs at least {MIN_TRAJ_LEN} points to "
+            "estimate its features"
+        )
+    n_traj = len(lengths)
+    if n_traj == 0:
+        return np.empty((0, 51))
+    idx = np.arange(n_traj)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # Global differences (positions crossing a boundary are garbage and
+        # are dropped with the valid masks below).
+        delta = np.diff(points, axis=0)
+        _delta_r = norm(delta[:, :2], axis=1)
+        _delta_t = delta[:, 2]
+        vel = _delta_r / _delta_t
+        acc = np.diff(vel) / _delta_t[1:]
+        acc_chg_rate = np.diff(acc) / _delta_t[2:]
+        ang = np.arctan2(delta[:, 1], delta[:, 0])
+        trng_ang = np.diff(ang)
+        hding_chg_rate = trng_ang / _delta_t[1:]
+
+        vel_subs = np.abs(vel[1:] - vel[:-1])
+        vel_den = vel[:-1].copy()
+        vel_den[vel_den == 0] = np.inf
+        v_rate = vel_subs / vel_den
+
+    mask_1 = _valid_mask(offsets, 1)
+    mask_2 = _valid_mask(offsets, 2)
+    mask_3 = _valid_mask(offsets, 3)
+    offsets_1 = offsets - np.arange(n_traj + 1)
+    offsets_2 = offsets - 2 * np.arange(n_traj + 1)
+    offsets_3 = offsets - 3 * np.arange(n_traj + 1)
+
+    dist = _segment_sum(_delta_r[mask_1], offsets_1)
+    vel = vel[mask_1]
+    v_rate = v_rate[mask_2]
+    seg_1 = np.repeat(idx, lengths - 1)
+    seg_2 = np.repeat(idx, lengths - 2)
+    vel_chg = np.bincount(seg_2, weights=v_rate > threashold, minlength=n_traj)
+    stops = np.bincount(seg_1, weights=vel < threashold, minlength=n_traj)
+
+    vectors = np.empty((n_traj, 51))
+    vectors[:, 0] = dist
+    vectors[:, 1:9] = fe.segment_summary_stats(vel, offsets_1)
+    vectors[:, 9] = vel_chg / dist
+    vectors[:, 10] = stops / dist
+    vectors[:, 11:19] = fe.segment_summary_stats(acc[mask_2], offsets_2)
+    vectors[:, 19:27] = fe.segment_summary_stats(acc_chg_rate[mask_3], offsets_3)
+    vectors[:, 27:35] = fe.segment_summary_stats(ang[mask_1], offsets_1)
+    vectors[:, 35:43] = fe.segment_summary_stats(trng_ang[mask_2], offsets_2)
+    vectors[:, 43:51] = fe.segment_summary_stats(hding_chg_rate[mask_2], offsets_2)
+    return vectors
+
+
+def get_batch_feat_vectors(trajs: List[FloatArray], threashold: float) -> FloatArray:
+    """
+    Packs the trajectories and computes all their feature vectors at once.
+
+    Parameters
+    ----------
+    trajs : List[FloatArray]
+        Trajectories (Nx3 arrays).
+    threashold : float
+        Threashold used by the velocity change rate and the stop rate.
+
+    Returns
+    -------
+    FloatArray
+        A (n_traj, 51) matrix following the ``feature_vec.feat_name`` layout.
+    """
+    points, offsets = pack_trajs(trajs)
+    return batch_feat_vectors(points, offsets, threashold)
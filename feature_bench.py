@@ -0,0 +1,400 @@
+"""
+Micro-benchmarks of the feature estimation kernels.
+
+Every public trajectory and statistic function of ``feature_est`` (the
+fused ``summary_stats_many`` and ``segment_summary_stats`` included),
+``convert_traj_into_vector`` and the batch paths (``get_feat_vectors`` and
+``stream_feat_vectors`` of ``feature_vec`` and
+``feature_batch.batch_feat_vectors``) are timed over synthetic trajectories
+of 10² to 10⁶ points and batches of 10 to 10⁵ trajectories. The results are
+written as json, and they can be compared against a stored baseline to fail
+when a kernel regresses. Each result has the time per call, the throughput
+and two allocation measures from ``tracemalloc``: the peak allocated bytes
+and the number of allocated blocks still held when the call returns (its
+result included). ``tracemalloc`` does not count the blocks allocated and
+freed during the call, so the temporaries of a kernel show in its peak
+bytes only.
+
+Usage::
+
+    python feature_bench.py --out baseline.json
+    python feature_bench.py --compare baseline.json --threshold 0.25
+"""
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+import feature_est as fe
+from feature_batch import batch_feat_vectors
+from feature_vec import convert_traj_into_vector, get_feat_vectors, stream_feat_vectors
+
+TRAJ_SIZES = (100, 1_000, 10_000, 100_000, 1_000_000)
+"""Number of points of the single-trajectory benchmarks."""
+BATCH_SIZES = (10, 100, 1_000, 10_000, 100_000)
+"""Number of trajectories of the batch benchmarks."""
+BATCH_TRAJ_LEN = 100
+"""Number of points of each trajectory of the batch benchmarks."""
+
+TRAJ_KERNELS: Dict[str, Callable[[np.ndarray], object]] = {
+    "delta_r": fe.delta_r,
+    "delta_t": fe.delta_t,
+    "distance": fe.distance,
+    "velocity": fe.velocity,
+    "vel_change_rate": lambda traj: fe.vel_change_rate(traj, 1),
+    "stop_rate": lambda traj: fe.stop_rate(traj, 1),
+    "acceleration": fe.acceleration,
+    "acceleration_change_rate": fe.acceleration_change_rate,
+    "angle": fe.angle,
+    "turning_angle": fe.turning_angle,
+    "heading_change_rate": fe.heading_change_rate,
+    "rate_hcr": fe.rate_hcr,
+    "convert_traj_into_vector": lambda traj: convert_traj_into_vector(traj, 1),
+}
+"""Kernels over a single trajectory (Nx3 matrix)."""
+
+STATS_KERNELS: Dict[str, Callable[[np.ndarray], object]] = {
+    "mean": fe.mean,
+    "median": fe.median,
+    "min_val": fe.min_val,
+    "max_val": fe.max_val,
+    "standard_dev": fe.standard_dev,
+    "variance": fe.variance,
+    "coef_var": fe.coef_var,
+    "percentile": lambda values: fe.percentile(values, 25),
+    "iqr": fe.iqr,
+    "summary_stats": fe.summary_stats,
+}
+"""Kernels over a signal (the velocity of a trajectory)."""
+
+SIGNALS_KERNELS: Dict[str, Callable[[List[np.ndarray]], object]] = {
+    "summary_stats_many": fe.summary_stats_many,
+}
+"""Kernels over the six signals of a trajectory (see
+``convert_traj_into_vector``)."""
+
+BATCH_KERNELS: Dict[str, Callable[[List[dict]], object]] = {
+    "get_feat_vectors": get_feat_vectors,
+    "stream_feat_vectors": stream_feat_vectors,
+}
+"""Kernels over a list of trajectories (``data_handler`` metadata)."""
+
+PACKED_KERNELS: Dict[str, Callable[[Dict[str, np.ndarray]], object]] = {
+    "segment_summary_stats": lambda packed: fe.segment_summary_stats(
+        packed["velocity"], packed["velocity_offsets"]
+    ),
+    "batch_feat_vectors": lambda packed: batch_feat_vectors(
+        packed["points"], packed["offsets"], 1
+    ),
+}
+"""Kernels over packed trajectories (``points`` and ``offsets``) or their
+packed velocities (``velocity`` and ``velocity_offsets``)."""
+
+
+def random_traj(n_points: int, rng: np.random.Generator) -> np.ndarray:
+    """
+    Synthetic random-walk trajectory with irregular sampling.
+
+    Parameters
+    ----------
+    n_points : int
+        Number of points.
+    rng : np.random.Generator
+        Random generator.
+
+    Returns
+    -------
+    np.ndarray
+        The trajectory (Nx3 matrix).
+    """
+    points = 39.9 + np.cumsum(rng.normal(scale=1e-4, size=(n_points, 2)), axis=0)
+    times = np.cumsum(rng.integers(1, 6, size=n_points)).astype(np.float64)
+    return np.column_stack([points, times])
+
+
+def time_call(func: Callable[[], object], min_time: float = 0.2) -> Tuple[float, int]:
+    """
+    Best time of a call, repeating it for at least ``min_time`` seconds.
+
+    Parameters
+    ----------
+    func : Callable[[], object]
+        The call.
+    min_time : float
+        Minimum total time spent in the calls.
+
+    Returns
+    -------
+    Tuple[float, int]
+        The best time (in seconds) and the number of calls.
+    """
+    best, total, calls = np.inf, 0.0, 0
+    while total < min_time or calls < 3:
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = min(best, elapsed)
+        total += elapsed
+        calls += 1
+    return best, calls
+
+
+def allocations(func: Callable[[], object]) -> Tuple[int, int]:
+    """
+    Peak memory and allocated blocks of a call (NumPy buffers are traced as
+    well).
+
+    Parameters
+    ----------
+    func : Callable[[], object]
+        The call.
+
+    Returns
+    -------
+    Tuple[int, int]
+        The peak allocated bytes and the number of blocks allocated by the
+        call that are still held when it returns (its result included).
+    """
+    tracemalloc.start()
+    try:
+        result = func()
+        _, peak = tracemalloc.get_traced_memory()
+        snapshot = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+    del result
+    snapshot = snapshot.filter_traces([tracemalloc.Filter(False, __file__)])
+    return peak, sum(stat.count for stat in snapshot.statistics("filename"))
+
+
+def peak_memory(func: Callable[[], object]) -> int:
+    """
+    Peak memory allocated by a call (see ``allocations``).
+
+    Parameters
+    ----------
+    func : Callable[[], object]
+        The call.
+
+    Returns
+    -------
+    int
+        The peak allocated bytes.
+    """
+    return allocations(func)[0]
+
+
+def _result(kernel, size, unit, items, func, min_time) -> dict:
+    seconds, calls = time_call(func, min_time)
+    peak, blocks = allocations(func)
+    return {
+        "kernel": kernel,
+        "size": size,
+        "unit": unit,
+        "seconds": seconds,
+        "throughput": items / seconds if seconds > 0 else float("inf"),
+        "calls": calls,
+        "peak_bytes": peak,
+        "alloc_blocks": blocks,
+    }
+
+
+def run_benchmarks(
+    traj_sizes: Sequence[int] = TRAJ_SIZES,
+    batch_sizes: Sequence[int] = BATCH_SIZES,
+    kernels: Optional[Sequence[str]] = None,
+    min_time: float = 0.2,
+    seed: int = 0,
+) -> dict:
+    """
+    Runs the benchmarks.
+
+    Parameters
+    ----------
+    traj_sizes : Sequence[int]
+        Number of points of the single-trajectory benchmarks.
+    batch_sizes : Sequence[int]
+        Number of trajectories of the batch benchmarks.
+    kernels : Optional[Sequence[str]]
+        Names of the benchmarked kernels (all by default).
+    min_time : float
+        Minimum time spent timing each kernel and size.
+    seed : int
+        Random seed.
+
+    Returns
+    -------
+    dict
+        The environment (``meta``) and a list with the ``results`` of each
+        kernel and size: the best time per call, the throughput (points or
+        trajectories per second), the peak allocated bytes and the blocks
+        held by the call (see ``allocations``).
+    """
+    # pylint: disable=W0640
+    rng = np.random.default_rng(seed)
+    selected = set(kernels) if kernels is not None else None
+
+    def wanted(name: str) -> bool:
+        return selected is None or name in selected
+
+    results = []
+    for size in traj_sizes:
+        traj = random_traj(size, rng)
+        velocity = fe.velocity(traj)
+        derivs = fe.derivatives(traj)
+        signals = [
+            fe.velocity(derivs),
+            fe.acceleration(derivs),
+            fe.acceleration_change_rate(derivs),
+            fe.angle(derivs),
+            fe.turning_angle(derivs),
+            fe.heading_change_rate(derivs),
+        ]
+        for name, kernel in TRAJ_KERNELS.items():
+            if wanted(name):
+                results.append(
+                    _result(name, size, "points", size, lambda: kernel(traj), min_time)
+                )
+        for name, kernel in STATS_KERNELS.items():
+            if wanted(name):
+                results.append(
+                    _result(
+                        name, size, "points", size, lambda: kernel(velocity), min_time
+                    )
+                )
+        for name, kernel in SIGNALS_KERNELS.items():
+            if wanted(name):
+                results.append(
+                    _result(
+                        name, size, "points", size, lambda: kernel(signals), min_time
+                    )
+                )
+
+    for size in batch_sizes:
+        trajs = [random_traj(BATCH_TRAJ_LEN, rng) for _ in range(size)]
+        data = [
+            {"id": str(i), "class": "walk", "traj_data": traj}
+            for i, traj in enumerate(trajs)
+        ]
+        for name, kernel in BATCH_KERNELS.items():
+            if wanted(name):
+                results.append(
+                    _result(name, size, "trajs", size, lambda: kernel(data), min_time)
+                )
+        packed = {
+            "points": np.concatenate(trajs),
+            "offsets": np.arange(size + 1) * BATCH_TRAJ_LEN,
+            "velocity": np.concatenate([fe.velocity(traj) for traj in trajs]),
+            "velocity_offsets": np.arange(size + 1) * (BATCH_TRAJ_LEN - 1),
+        }
+        for name, kernel in PACKED_KERNELS.items():
+            if wanted(name):
+                results.append(
+                    _result(
+                        name, size, "trajs", size, lambda: kernel(packed), min_time
+                    )
+                )
+
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "min_time": min_time,
+        },
+        "results": results,
+    }
+
+
+def compare(results: dict, baseline: dict, threshold: float = 0.2) -> List[dict]:
+    """
+    Kernels slower than the baseline.
+
+    Parameters
+    ----------
+    results : dict
+        The current results (see ``run_benchmarks``).
+    baseline : dict
+        The baseline results.
+    threshold : float
+        Allowed relative slowdown (0.2 means 20% slower).
+
+    Returns
+    -------
+    List[dict]
+        Kernel, size, baseline and current times and relative slowdown of
+        each regression. Kernels missing in the baseline are ignored.
+    """
+    base_times = {
+        (res["kernel"], res["size"]): res["seconds"] for res in baseline["results"]
+    }
+    regressions = []
+    for res in results["results"]:
+        base = base_times.get((res["kernel"], res["size"]))
+        if base is None or base <= 0:
+            continue
+        slowdown = res["seconds"] / base - 1
+        if slowdown > threshold:
+            regressions.append(
+                {
+                    "kernel": res["kernel"],
+                    "size": res["size"],
+                    "baseline": base,
+                    "seconds": res["seconds"],
+                    "slowdown": slowdown,
+                }
+            )
+    return regressions
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    """Runs the benchmarks (and the comparison) from the command line."""
+    parser = argparse.ArgumentParser(description="Feature kernels benchmarks")
+    parser.add_argument("--out", type=Path, default=None, help="json results file")
+    parser.add_argument(
+        "--compare", type=Path, default=None, help="baseline results file"
+    )
+    parser.add_argument(
+        "--threshold", type=float, default=0.2, help="allowed relative slowdown"
+    )
+    parser.add_argument("--traj-sizes", type=int, nargs="+", default=TRAJ_SIZES)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=BATCH_SIZES)
+    parser.add_argument("--kernels", nargs="+", default=None)
+    parser.add_argument("--min-time", type=float, default=0.2)
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(
+        args.traj_sizes, args.batch_sizes, args.kernels, args.min_time
+    )
+    if args.out is not None:
+        with open(args.out, "w", encoding="utf-8") as r_file:
+            json.dump(results, r_file, indent=2)
+    for res in results["results"]:
+        print(
+            f"{res['kernel']:>26} {res['size']:>8} {res['unit']:<6} "
+            f"{res['seconds'] * 1e3:10.3f} ms {res['throughput']:14.1f}/s "
+            f"{res['peak_bytes'] / 2**20:9.2f} MiB {res['alloc_blocks']:8d} blocks"
+        )
+
+    if args.compare is None:
+        return 0
+    with open(args.compare, "r", encoding="utf-8") as b_file:
+        baseline = json.load(b_file)
+    regressions = compare(results, baseline, args.threshold)
+    for reg in regressions:
+        print(
+            f"REGRESSION {reg['kernel']} ({reg['size']}): "
+            f"{reg['baseline'] * 1e3:.3f} ms -> {reg['seconds'] * 1e3:.3f} ms "
+            f"(+{reg['slowdown']:.0%})"
+        )
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,237 @@
+"""
+Persistent on-disk cache of feature vectors.
+
+The vectors are stored as rows of an append-only float64 file (memory-mapped
+when read) next to a json index. Each entry is keyed by the trajectory id,
+the threashold and a content hash of the trajectory points, so vectors of
+several threasholds live side by side, and the whole cache is tied to the
+version of the ``feature_vec.feat_name`` layout. Only new or changed
+trajectories are computed and their vectors appended to the file; entries
+that have not been used in the last ``max_unused_runs`` runs are evicted and
+the file is only rewritten once most of its rows are evicted.
+"""
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from data_handler import iter_trajs_data, load_traj_file
+from feature_vec import FEATURES_VERSION, feat_name, get_classes, iter_feat_chunks
+
+DEFAULT_CACHE_DIR = Path("trajectories/feature_cache")
+INDEX_FILE = "index.json"
+VECTORS_FILE = "vectors.f8"
+ROW_BYTES = len(feat_name) * 8
+
+
+def layout_version() -> str:
+    """
+    Version of the feature vector layout.
+
+    Returns
+    -------
+    str
+        A hash of ``FEATURES_VERSION`` and the ``feat_name`` layout.
+    """
+    layout = f"{FEATURES_VERSION}\n" + "\n".join(feat_name)
+    return hashlib.sha1(layout.encode("utf-8")).hexdigest()
+
+
+def points_hash(traj) -> str:
+    """
+    Content hash of the points of a trajectory (as a float64 Nx3 matrix).
+
+    Parameters
+    ----------
+    traj : fe.Trajectory
+        The trajectory.
+
+    Returns
+    -------
+    str
+        The content hash.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(np.ascontiguousarray(traj, dtype=np.float64))
+    return digest.hexdigest()
+
+
+def traj_hash(traj_md: dict, file_hashes: Dict[str, list], run: int = 0) -> str:
+    """
+    Content hash of the data of a trajectory (see ``points_hash``).
+
+    The loaded (or memory-mapped) data are hashed when present. Otherwise
+    the trajectory file is loaded and hashed, unless its modification time
+    and size are the ones recorded in ``file_hashes``.
+
+    Parameters
+    ----------
+    traj_md : dict
+        The metadata of the trajectory.
+    file_hashes : Dict[str, list]
+        Modification time, size, hash and last use run of the trajectory
+        files already hashed (updated).
+    run : int
+        The current run.
+
+    Returns
+    -------
+    str
+        The content hash.
+    """
+    if "traj_data" in traj_md:
+        return points_hash(traj_md["traj_data"])
+    file_path = traj_md["file_path"]
+    stat = os.stat(file_path)
+    known = file_hashes.get(file_path)
+    if known is None or known[:2] != [stat.st_mtime_ns, stat.st_size]:
+        known = [stat.st_mtime_ns, stat.st_size, points_hash(load_traj_file(file_path))]
+    file_hashes[file_path] = known[:3] + [run]
+    return known[2]
+
+
+def _entry_key(traj_id: str, threashold: float, _hash: str) -> str:
+    return f"{traj_id}|{float(threashold)!r}|{_hash}"
+
+
+def _load_index(cache_dir: Path) -> dict:
+    index_file = cache_dir / INDEX_FILE
+    empty_index = {
+        "version": layout_version(),
+        "run": 0,
+        "n_rows": 0,
+        "entries": {},
+        "files": {},
+    }
+    if not index_file.exists():
+        return empty_index
+    with open(index_file, "r", encoding="utf-8") as i_file:
+        index = json.load(i_file)
+    if index["version"] != empty_index["version"]:
+        # Other layout: every entry is invalid
+        empty_index["run"] = index["run"]
+        return empty_index
+    return index
+
+
+def _read_rows(cache_dir: Path, n_rows: int) -> np.ndarray:
+    if not n_rows:
+        return np.empty((0, len(feat_name)))
+    return np.memmap(
+        cache_dir / VECTORS_FILE, dtype="<f8", mode="r", shape=(n_rows, len(feat_name))
+    )
+
+
+def _append_rows(cache_dir: Path, n_rows: int, vectors: np.ndarray) -> None:
+    vectors_file = cache_dir / VECTORS_FILE
+    with open(vectors_file, "r+b" if vectors_file.exists() else "wb") as v_file:
+        # Rows written after the last saved index (interrupted run) are dropped
+        v_file.truncate(n_rows * ROW_BYTES)
+        v_file.seek(n_rows * ROW_BYTES)
+        v_file.write(np.ascontiguousarray(vectors, dtype="<f8").tobytes())
+
+
+def _compact(cache_dir: Path, index: dict) -> None:
+    """Rewrites the vectors file with the rows of the remaining entries."""
+    entries: Dict[str, list] = index["entries"]
+    rows = [entry[0] for entry in entries.values()]
+    vectors = np.array(_read_rows(cache_dir, index["n_rows"])[rows])
+    tmp_file = cache_dir / f"{VECTORS_FILE}.tmp"
+    tmp_file.write_bytes(np.ascontiguousarray(vectors, dtype="<f8").tobytes())
+    os.replace(tmp_file, cache_dir / VECTORS_FILE)
+    for row, entry in enumerate(entries.values()):
+        entry[0] = row
+    index["n_rows"] = len(rows)
+
+
+def _save_index(cache_dir: Path, index: dict) -> None:
+    tmp_index = cache_dir / f"{INDEX_FILE}.tmp"
+    with open(tmp_index, "w", encoding="utf-8") as i_file:
+        json.dump(index, i_file)
+    os.replace(tmp_index, cache_dir / INDEX_FILE)
+
+
+def get_cached_feat_vectors(
+    data: List[dict],
+    cache_dir: Path = DEFAULT_CACHE_DIR,
+    threashold: float = 1,
+    max_unused_runs: int = 3,
+    chunk_size: int = 1024,
+) -> Tuple[np.ndarray, list, list]:
+    """
+    Get the feature vectors and their classes using the on-disk cache.
+
+    Parameters
+    ----------
+    data : List[dict]
+        The list of trajectories (their data can be missing, see
+        ``data_handler.iter_trajs_data``).
+    cache_dir : Path
+        Folder of the cache.
+    threashold : float
+        Threashold used by the velocity change rate and the stop rate.
+    max_unused_runs : int
+        Entries not used in this number of runs are evicted.
+    chunk_size : int
+        Number of trajectories whose features are computed at once.
+
+    Returns
+    -------
+    Tuple[np.ndarray, list, list]
+        The feature matrix and the list of class masks and classes.
+    """
+    cache_dir = Path(cache_dir)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    index = _load_index(cache_dir)
+    index["run"] += 1
+    run = index["run"]
+    entries: Dict[str, list] = index["entries"]
+    files: Dict[str, list] = index["files"]
+
+    keys = [
+        _entry_key(traj_md["id"], threashold, traj_hash(traj_md, files, run))
+        for traj_md in data
+    ]
+    rows = np.array(
+        [entries[key][0] if key in entries else -1 for key in keys], dtype=np.int64
+    )
+
+    vectors = np.empty((len(data), len(feat_name)))
+    hits = rows >= 0
+    cached = _read_rows(cache_dir, index["n_rows"])
+    vectors[hits] = cached[rows[hits]]
+    del cached
+    missing = np.flatnonzero(~hits)
+    start = 0
+    missing_md = (data[i] for i in missing)
+    for chunk in iter_feat_chunks(iter_trajs_data(missing_md), chunk_size, threashold):
+        vectors[missing[start : start + len(chunk)]] = chunk
+        start += len(chunk)
+
+    # New vectors are appended (the same key can appear more than once)
+    new_keys = dict.fromkeys(keys[i] for i in missing)
+    first = {key: i for i, key in reversed(list(enumerate(keys)))}
+    if new_keys:
+        _append_rows(cache_dir, index["n_rows"], vectors[[first[k] for k in new_keys]])
+        for row, key in enumerate(new_keys, start=index["n_rows"]):
+            entries[key] = [row, run]
+        index["n_rows"] += len(new_keys)
+    for key in keys:
+        entries[key][1] = run
+
+    # Evict the unused entries, and the rows once they are most of the file
+    index["entries"] = entries = {
+        key: entry for key, entry in entries.items() if run - entry[1] < max_unused_runs
+    }
+    index["files"] = {
+        path: known for path, known in files.items() if run - known[3] < max_unused_runs
+    }
+    if 2 * len(entries) < index["n_rows"]:
+        _compact(cache_dir, index)
+    _save_index(cache_dir, index)
+
+    clss_mask, clss = get_classes(data)
+    return vectors, clss_mask, clss
@@ -2,55 +2,172 @@
 Contains all the functions to estimate the features of a given trajectory.
 """
 
+from functools import cached_property
+from typing import List, Union
+
 import numpy as np
 import numpy.typing as npt
 from numpy.linalg import norm
 
+from compact_traj import CompactTraj
+
 FloatArray = npt.NDArray[np.float64]
+IntArray = npt.NDArray[np.int64]
+
+
+class TrajDerivatives:
+    """
+    Lazily evaluated derivatives of a trajectory.
+
+    Each intermediate signal is computed the first time it is requested and
+    memoized, so estimating several features of the same trajectory computes
+    every ``np.diff``/``norm`` exactly once. The returned arrays are shared
+    between callers and must not be modified in place.
+
+    Parameters
+    ----------
+    traj : Union[FloatArray, CompactTraj]
+        Trajectory. Compact trajectories are differenced in their own
+        precision and the derivatives are computed in float64.
+    """
+
+    def __init__(self, traj: Union[FloatArray, CompactTraj]):
+        self.traj = traj
+
+    @cached_property
+    def delta_pos(self) -> FloatArray:
+        """Position (lat, lon) difference between two consecutive points."""
+        if isinstance(self.traj, CompactTraj):
+            return self.traj.delta_pos()
+        return np.diff(self.traj[:, :2], axis=0)
+
+    @cached_property
+    def delta_r(self) -> FloatArray:
+        """Position difference between two consecutive points."""
+        return norm(self.delta_pos, axis=1)
+
+    @cached_property
+    def delta_t(self) -> FloatArray:
+        """Time difference between two consecutive points."""
+        if isinstance(self.traj, CompactTraj):
+            return self.traj.delta_t()
+        return np.diff(self.traj[:, 2], axis=0)
+
+    @cached_property
+    def distance(self) -> float:
+        """Total distance traveled."""
+        return np.sum(self.delta_r)
+
+    @cached_property
+    def velocity(self) -> FloatArray:
+        """Velocity of the trajectory at each point."""
+        return self.delta_r / self.delta_t
+
+    @cached_property
+    def velocity_rate(self) -> FloatArray:
+        """Relative velocity change between two consecutive points."""
+        vel = self.velocity
+        subs = np.abs(vel[1:] - vel[:-1])
+        prev_vel = vel[:-1].copy()
+        prev_vel[prev_vel == 0] = np.inf
+        return subs / prev_vel
+
+    @cached_property
+    def acceleration(self) -> FloatArray:
+        """Acceleration of the trajectory at each point."""
+        return np.diff(self.velocity) / self.delta_t[1:]
+
+    @cached_property
+    def acceleration_change_rate(self) -> FloatArray:
+        """Acceleration change rate."""
+        return np.diff(self.acceleration) / self.delta_t[2:]
+
+    @cached_property
+    def angle(self) -> FloatArray:
+        """Angle of the trajectory at each point."""
+        return np.arctan2(self.delta_pos[:, 1], self.delta_pos[:, 0])
+
+    @cached_property
+    def turning_angle(self) -> FloatArray:
+        """Turning angle of the trajectory at each point."""
+        return np.diff(self.angle)
+
+    @cached_property
+    def heading_change_rate(self) -> FloatArray:
+        """Heading change rate of the trajectory at each point."""
+        return self.turning_angle / self.delta_t[1:]
+
+    @cached_property
+    def rate_hcr(self) -> FloatArray:
+        """Rate of change of heading change rate."""
+        return np.diff(self.heading_change_rate) / self.delta_t[2:]
+
+
+Trajectory = Union[FloatArray, CompactTraj, TrajDerivatives]
+"""A trajectory array (or compact trajectory) or its (memoized) derivatives."""
+
+
+def derivatives(traj: Trajectory) -> TrajDerivatives:
+    """
+    Gets the derivatives object of a trajectory.
 
+    Parameters
+    ----------
+    traj : Trajectory
+        Trajectory or its derivatives.
 
-def delta_r(traj: FloatArray) -> FloatArray:
+    Returns
+    -------
+    TrajDerivatives
+        The given derivatives or a new derivatives object of the trajectory.
+    """
+    if isinstance(traj, TrajDerivatives):
+        return traj
+    return TrajDerivatives(traj)
+
+
+def delta_r(traj: Trajectory) -> FloatArray:
     """
     Position difference between two consecutive points.
 
     Parameters
     ----------
-    traj : FloatArray
-        Trajectory.
+    traj : Trajectory
+        Trajectory or its derivatives.
 
     Returns
     -------
     FloatArray
         Position difference between two consecutive points.
     """
-    return norm(np.diff(traj[:, :2], axis=0), axis=1)
+    return derivatives(traj).delta_r
 
 
-def delta_t(traj: FloatArray) -> FloatArray:
+def delta_t(traj: Trajectory) -> FloatArray:
     """
     Time difference between two consecutive points.
 
     Parameters
     ----------
-    traj : FloatArray
-        Trajectory.
+    traj : Trajectory
+        Trajectory or its derivatives.
 
     Returns
     -------
     FloatArray
         Time difference between two consecutive points.
     """
-    return np.diff(traj[:, 2], axis=0)
+    return derivatives(traj).delta_t
 
 
-def distance(traj: FloatArray) -> float:
+def distance(traj: Trajectory) -> float:
     """
     Total distance traveled.
 
     Parameters
     ----------
-    traj : FloatArray
-        Trajectory.
+    traj : Trajectory
+        Trajectory or its derivatives.
 
     Returns
     -------
@@ -58,179 +175,166 @@ def distance(traj: FloatArray) -> float:
         Total distance traveled.
     """
 
-    return np.sum(delta_r(traj))
+    return derivatives(traj).distance
 
 
-def velocity(traj: FloatArray) -> FloatArray:
+def velocity(traj: Trajectory) -> FloatArray:
     """
     Velocity of the trajectory at each point.
 
     Parameters
     ----------
-    traj : FloatArray
-        Trajectory.
+    traj : Trajectory
+        Trajectory or its derivatives.
 
     Returns
     -------
     FloatArray
         Velocity of the trajectory at each point.
     """
-    return delta_r(traj) / delta_t(traj)
+    return derivatives(traj).velocity
 
 
-def _velocity_rate(traj: FloatArray) -> FloatArray:
-    vel = velocity(traj)
-    subs = np.abs(vel[1:] - vel[:-1])
-    vel[vel == 0] = np.inf
-    return subs / vel[:-1]
+def _velocity_rate(traj: Trajectory) -> FloatArray:
+    return derivatives(traj).velocity_rate
 
 
-def vel_change_rate(traj: FloatArray, threashold: float) -> float:
+def vel_change_rate(traj: Trajectory, threashold: float) -> float:
     """
     Velocity change rate.
 
     Parameters
     ----------
-    traj : FloatArray
-        Trajectory.
+    traj : Trajectory
+        Trajectory or its derivatives.
 
     Returns
     -------
     float
         Velocity change rate.
     """
-    v_rate = _velocity_rate(traj)
-    return np.sum(v_rate > threashold) / distance(traj)
+    derivs = derivatives(traj)
+    return np.sum(derivs.velocity_rate > threashold) / derivs.distance
 
 
-def stop_rate(traj: FloatArray, threashold: float) -> float:
+def stop_rate(traj: Trajectory, threashold: float) -> float:
     """
     Stop rate.
 
     Parameters
     ----------
-    traj : FloatArray
-        Trajectory.
+    traj : Trajectory
+        Trajectory or its derivatives.
 
     Returns
     -------
     float
         Stop rate.
     """
-    vel = velocity(traj)
-    return np.sum(vel < threashold) / distance(traj)
+    derivs = derivatives(traj)
+    return np.sum(derivs.velocity < threashold) / derivs.distance
 
 
-def acceleration(traj: FloatArray) -> FloatArray:
+def acceleration(traj: Trajectory) -> FloatArray:
     """
     Acceleration of the trajectory at each point.
 
     Parameters
     ----------
-    traj : FloatArray
-        Trajectory.
+    traj : Trajectory
+        Trajectory or its derivatives.
 
     Returns
     -------
     FloatArray
         Acceleration of the trajectory at each point.
     """
-    vel = velocity(traj)
-    _delta_t = delta_t(traj)
-    return np.diff(vel) / _delta_t[1:]
+    return derivatives(traj).acceleration
 
 
-def acceleration_change_rate(traj: FloatArray) -> FloatArray:
+def acceleration_change_rate(traj: Trajectory) -> FloatArray:
     """
     Acceleration change rate.
 
     Parameters
     ----------
-    traj : FloatArray
-        Trajectory.
+    traj : Trajectory
+        Trajectory or its derivatives.
 
     Returns
     -------
     FloatArray
         Acceleration change rate.
     """
-    acc = acceleration(traj)
-    _delta_t = delta_t(traj)
-    return np.diff(acc) / _delta_t[2:]
+    return derivatives(traj).acceleration_change_rate
 
 
-def angle(traj: FloatArray) -> FloatArray:
+def angle(traj: Trajectory) -> FloatArray:
     """
     Angle of the trajectory at each point.
 
     Parameters
     ----------
-    traj : FloatArray
-        Trajectory.
+    traj : Trajectory
+        Trajectory or its derivatives.
 
     Returns
     -------
     FloatArray
         Angle of the trajectory at each point.
     """
-    delta_y = np.diff(traj[:, 1])
-    delta_x = np.diff(traj[:, 0])
-    return np.arctan2(delta_y, delta_x)
+    return derivatives(traj).angle
 
 
-def turning_angle(traj: FloatArray) -> FloatArray:
+def turning_angle(traj: Trajectory) -> FloatArray:
     """
     Turning angle of the trajectory at each point.
 
     Parameters
     ----------
-    traj : FloatArray
-        Trajectory.
+    traj : Trajectory
+        Trajectory or its derivatives.
 
     Returns
     -------
     FloatArray
         Turning angle of the trajectory at each point.
     """
-    return np.diff(angle(traj))
+    return derivatives(traj).turning_angle
 
 
-def heading_change_rate(traj: FloatArray) -> FloatArray:
+def heading_change_rate(traj: Trajectory) -> FloatArray:
     """
     Heading change rate of the trajectory at each point.
 
     Parameters
     ----------
-    traj : FloatArray
-        Trajectory.
+    traj : Trajectory
+        Trajectory or its derivatives.
 
     Returns
     -------
     FloatArray
         Heading change rate of the trajectory at each point.
     """
-    t_angle = turning_angle(traj)
-    _delta_t = delta_t(traj)
-    return t_angle / _delta_t[1:]
+    return derivatives(traj).heading_change_rate
 
 
-def rate_hcr(traj: FloatArray) -> FloatArray:
+def rate_hcr(traj: Trajectory) -> FloatArray:
     """
     Rate of change of heading change rate.
 
     Parameters
     ----------
-    traj : FloatArray
-        Trajectory.
+    traj : Trajectory
+        Trajectory or its derivatives.
 
     Returns
     -------
     FloatArray
         Rate of change of heading change rate.
     """
-    hcr = heading_change_rate(traj)
-    _delta_t = delta_t(traj)
-    return np.diff(hcr) / _delta_t[2:]
+    return derivatives(traj).rate_hcr
 
 
 # General features
@@ -267,7 +371,7 @@ def median(values: FloatArray) -> float:
     float
         Median of the values.
     """
-    return values[len(values) // 2]
+    return float(np.median(values))
 
 
 def min_val(values: FloatArray) -> float:
@@ -389,3 +493,165 @@ def iqr(values: FloatArray) -> float:
         Interquartile range.
     """
     return percentile(values, 75) - percentile(values, 25)
+
+
+# Fused statistics
+
+STATS_NAMES = [
+    "mean",
+    "median",
+    "min",
+    "max",
+    "std",
+    "var",
+    "coef_var",
+    "iqr",
+]
+"""Statistics returned by the fused kernels (in order)."""
+
+PACKED_STATS_MAX_POINTS = 8192
+"""Points up to which ``summary_stats_many`` packs the signals (longer
+signals are cheaper with the linear selection of ``summary_stats``)."""
+
+
+def _lerp(below, above, frac):
+    """Linear interpolation between two order statistics (as ``np.percentile``)."""
+    return np.where(
+        frac >= 0.5,
+        above - (above - below) * (1 - frac),
+        below + (above - below) * frac,
+    )
+
+
+def summary_stats(values: FloatArray) -> FloatArray:
+    """
+    All the statistics of a signal in one selection and one moment pass.
+
+    The order statistics (min, max, median and quartiles) are taken from a
+    single ``np.partition`` call and the variance reuses the mean.
+
+    Parameters
+    ----------
+    values : FloatArray
+        Values of the signal.
+
+    Returns
+    -------
+    FloatArray
+        The mean, median, min, max, standard deviation, variance,
+        coefficient of variation and interquartile range (see
+        ``STATS_NAMES``).
+    """
+    count = len(values)
+    if not count:
+        raise ValueError("Statistics of an empty signal")
+    virtual_idx = (count - 1) * np.array([0.25, 0.5, 0.75])
+    low = np.floor(virtual_idx).astype(np.int64)
+    high = np.minimum(low + 1, count - 1)
+    kth = np.unique(np.concatenate([[0, count - 1], low, high]))
+    part = np.partition(values, kth)
+    q25, q50, q75 = _lerp(part[low], part[high], virtual_idx - low)
+
+    _mean = np.mean(values)
+    dev = values - _mean
+    _var = np.dot(dev, dev) / count
+    _std = np.sqrt(_var)
+    abs_mean = np.abs(_mean)
+    _coef_var = _std / abs_mean if abs_mean != 0 else 0.0
+    return np.array(
+        [_mean, q50, part[0], part[-1], _std, _var, _coef_var, q75 - q25]
+    )
+
+
+def segment_summary_stats(values: FloatArray, offsets: IntArray) -> FloatArray:
+    """
+    All the statistics of each segment of a packed signal.
+
+    Parameters
+    ----------
+    values : FloatArray
+        Concatenated values of all the segments.
+    offsets : IntArray
+        Offsets index of the segments (``n_segments + 1``). No segment can be
+        empty.
+
+    Returns
+    -------
+    FloatArray
+        A (n_segments, 8) matrix with the statistics of each segment (see
+        ``STATS_NAMES``).
+    """
+    starts = offsets[:-1]
+    counts = np.diff(offsets)
+    if np.any(counts <= 0):
+        raise ValueError("Statistics of an empty signal")
+    seg_ids = np.repeat(np.arange(len(counts)), counts)
+
+    _mean = np.add.reduceat(values, starts) / counts
+    dev = values - _mean[seg_ids]
+    _var = np.add.reduceat(dev * dev, starts) / counts
+    _std = np.sqrt(_var)
+    abs_mean = np.abs(_mean)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        _coef_var = np.where(abs_mean != 0, _std / abs_mean, 0.0)
+
+    # Sorted by value, then (stable) by segment: the segment ids are small
+    # integers, sorted with a radix sort when they fit in 16 bits
+    order = np.argsort(values)
+    seg_dtype = np.int16 if len(counts) <= np.iinfo(np.int16).max else np.int64
+    order = order[np.argsort(seg_ids[order].astype(seg_dtype), kind="stable")]
+    sorted_vals = values[order]
+    quartiles = []
+    for prob in (0.25, 0.5, 0.75):
+        virtual_idx = (counts - 1) * prob
+        low = np.floor(virtual_idx).astype(np.int64)
+        high = np.minimum(low + 1, counts - 1)
+        quartiles.append(
+            _lerp(
+                sorted_vals[starts + low],
+                sorted_vals[starts + high],
+                virtual_idx - low,
+            )
+        )
+    q25, q50, q75 = quartiles
+    return np.column_stack(
+        [
+            _mean,
+            q50,
+            sorted_vals[starts],
+            sorted_vals[offsets[1:] - 1],
+            _std,
+            _var,
+            _coef_var,
+            q75 - q25,
+        ]
+    )
+
+
+def summary_stats_many(signals: List[FloatArray]) -> FloatArray:
+    """
+    All the statistics of several signals in one call.
+
+    The signals are packed into one array and their statistics are computed
+    together by ``segment_summary_stats`` (one sort instead of a call per
+    signal). Above ``PACKED_STATS_MAX_POINTS`` points the sort costs more
+    than a selection per signal, so ``summary_stats`` is used.
+
+    Parameters
+    ----------
+    signals : List[FloatArray]
+        Values of each signal (e.g. the six signals of a trajectory).
+
+    Returns
+    -------
+    FloatArray
+        A (n_signals, 8) matrix with the statistics of each signal (see
+        ``STATS_NAMES``).
+    """
+    if not signals:
+        return np.empty((0, len(STATS_NAMES)))
+    offsets = np.zeros(len(signals) + 1, dtype=np.int64)
+    np.cumsum([len(signal) for signal in signals], out=offsets[1:])
+    if offsets[-1] > PACKED_STATS_MAX_POINTS:
+        return np.array([summary_stats(signal) for signal in signals])
+    return segment_summary_stats(np.concatenate(signals), offsets)
@@ -0,0 +1,293 @@
+"""
+Online (incremental) feature estimation for live GPS streams.
+
+The estimator receives the points of a trajectory one at a time (or in small
+batches) and keeps running state for every feature, so the feature vector
+(``feature_vec.feat_name`` layout) can be produced at any moment in O(1) per
+point. Means and variances are computed with Welford's algorithm and the
+order statistics (median and interquartile range) are approximated with the
+P² algorithm (Jain & Chlamtac, 1985).
+"""
+import math
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+MIN_POINTS = 4
+"""Minimum number of points needed to estimate every feature."""
+
+
+def _div(num: float, den: float) -> float:
+    """Division with the NumPy semantics for zero denominators."""
+    if den != 0:
+        return num / den
+    if num == 0 or math.isnan(num):
+        return math.nan
+    return math.copysign(math.inf, num) * math.copysign(1.0, den)
+
+
+class P2Quantile:
+    """
+    Approximate quantile of a stream with the P² algorithm.
+
+    The first five values are kept and the exact (linear interpolated)
+    quantile is returned until then.
+
+    Parameters
+    ----------
+    prob : float
+        Quantile to estimate (between 0 and 1).
+    """
+
+    def __init__(self, prob: float):
+        self.prob = prob
+        self.heights: List[float] = []
+        self.pos = [1, 2, 3, 4, 5]
+        self.desired = [1, 1 + 2 * prob, 1 + 4 * prob, 3 + 2 * prob, 5]
+        self.incr = [0, prob / 2, prob, (1 + prob) / 2, 1]
+
+    def add(self, value: float) -> None:
+        """
+        Adds a value.
+
+        Parameters
+        ----------
+        value : float
+            The new value.
+        """
+        heights = self.heights
+        if len(heights) < 5:
+            heights.append(value)
+            heights.sort()
+            return
+
+        if value < heights[0]:
+            heights[0] = value
+            k = 0
+        elif value >= heights[4]:
+            heights[4] = value
+            k = 3
+        else:
+            k = 0
+            while value >= heights[k + 1]:
+                k += 1
+        for i in range(k + 1, 5):
+            self.pos[i] += 1
+        for i in range(5):
+            self.desired[i] += self.incr[i]
+
+        pos = self.pos
+        for i in range(1, 4):
+            diff = self.desired[i] - pos[i]
+            if (diff >= 1 and pos[i + 1] - pos[i] > 1) or (
+                diff <= -1 and pos[i - 1] - pos[i] < -1
+            ):
+                step = 1 if diff > 0 else -1
+                new_height = self._parabolic(i, step)
+                if not heights[i - 1] < new_height < heights[i + 1]:
+                    new_height = heights[i] + step * (
+                        heights[i + step] - heights[i]
+                    ) / (pos[i + step] - pos[i])
+                heights[i] = new_height
+                pos[i] += step
+
+    def _parabolic(self, i: int, step: int) -> float:
+        heights, pos = self.heights, self.pos
+        return heights[i] + step / (pos[i + 1] - pos[i - 1]) * (
+            (pos[i] - pos[i - 1] + step)
+            * (heights[i + 1] - heights[i])
+            / (pos[i + 1] - pos[i])
+            + (pos[i + 1] - pos[i] - step)
+            * (heights[i] - heights[i - 1])
+            / (pos[i] - pos[i - 1])
+        )
+
+    def value(self) -> float:
+        """
+        Current estimation of the quantile.
+
+        Returns
+        -------
+        float
+            The estimated quantile (NaN if there are no values).
+        """
+        if not self.heights:
+            return math.nan
+        if len(self.heights) < 5 or self.pos[4] == 5:
+            return float(np.percentile(self.heights, self.prob * 100))
+        return self.heights[2]
+
+
+class RunningStats:
+    """
+    Running statistics of a signal (same statistics as
+    ``fe.segment_summary_stats``).
+    """
+
+    def __init__(self):
+        self.count = 0
+        self._mean = 0.0
+        self._m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self.quantiles = (P2Quantile(0.25), P2Quantile(0.5), P2Quantile(0.75))
+
+    def add(self, value: float) -> None:
+        """
+        Adds a value (Welford's update).
+
+        Parameters
+        ----------
+        value : float
+            The new value.
+        """
+        self.count += 1
+        delta = value - self._mean
+        self._mean += delta / self.count
+        self._m2 += delta * (value - self._mean)
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        for quantile in self.quantiles:
+            quantile.add(value)
+
+    def stats(self) -> List[float]:
+        """
+        Current statistics.
+
+        Returns
+        -------
+        List[float]
+            The mean, median, min, max, standard deviation, variance,
+            coefficient of variation and interquartile range.
+        """
+        if not self.count:
+            return [math.nan] * 8
+        var = self._m2 / self.count
+        std = math.sqrt(var)
+        abs_mean = abs(self._mean)
+        q25, median, q75 = (quantile.value() for quantile in self.quantiles)
+        return [
+            self._mean,
+            median,
+            self.min,
+            self.max,
+            std,
+            var,
+            std / abs_mean if abs_mean != 0 else 0.0,
+            q75 - q25,
+        ]
+
+
+class OnlineFeatureEstimator:
+    """
+    Incremental feature estimator of a single trajectory.
+
+    Parameters
+    ----------
+    threashold : float
+        Threashold used by the velocity change rate and the stop rate.
+    """
+
+    def __init__(self, threashold: float = 1):
+        self.threashold = threashold
+        self.n_points = 0
+        self.distance = 0.0
+        self.vel_changes = 0
+        self.stops = 0
+        self.velocity = RunningStats()
+        self.acceleration = RunningStats()
+        self.acc_change_rate = RunningStats()
+        self.angle = RunningStats()
+        self.turning_angle = RunningStats()
+        self.heading_change_rate = RunningStats()
+        self._last_point: Optional[Tuple[float, float, float]] = None
+        self._last_vel: Optional[float] = None
+        self._last_acc: Optional[float] = None
+        self._last_angle: Optional[float] = None
+
+    def add(self, lat: float, lon: float, time: float) -> None:
+        """
+        Adds a point to the trajectory.
+
+        Parameters
+        ----------
+        lat : float
+            Latitude.
+        lon : float
+            Longitude.
+        time : float
+            Time (in seconds).
+        """
+        self.n_points += 1
+        last_point = self._last_point
+        self._last_point = (lat, lon, time)
+        if last_point is None:
+            return
+
+        delta_x, delta_y = lat - last_point[0], lon - last_point[1]
+        delta_t = time - last_point[2]
+        delta_r = math.hypot(delta_x, delta_y)
+        self.distance += delta_r
+
+        vel = _div(delta_r, delta_t)
+        self.velocity.add(vel)
+        self.stops += vel < self.threashold
+        if self._last_vel is not None:
+            last_vel = self._last_vel
+            v_rate = _div(abs(vel - last_vel), last_vel if last_vel != 0 else math.inf)
+            self.vel_changes += v_rate > self.threashold
+            acc = _div(vel - last_vel, delta_t)
+            self.acceleration.add(acc)
+            if self._last_acc is not None:
+                self.acc_change_rate.add(_div(acc - self._last_acc, delta_t))
+            self._last_acc = acc
+        self._last_vel = vel
+
+        ang = math.atan2(delta_y, delta_x)
+        self.angle.add(ang)
+        if self._last_angle is not None:
+            trng_ang = ang - self._last_angle
+            self.turning_angle.add(trng_ang)
+            self.heading_change_rate.add(_div(trng_ang, delta_t))
+        self._last_angle = ang
+
+    def add_points(self, points: np.ndarray) -> None:
+        """
+        Adds several points (Nx3 matrix) to the trajectory.
+
+        Parameters
+        ----------
+        points : np.ndarray
+            The points (lat, lon and time in seconds).
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+        for lat, lon, time in points.tolist():
+            self.add(lat, lon, time)
+
+    def vector(self) -> np.ndarray:
+        """
+        Current feature vector.
+
+        Returns
+        -------
+        np.ndarray
+            The feature vector (``feature_vec.feat_name`` layout).
+        """
+        if self.n_points < MIN_POINTS:
+            raise ValueError(
+                f"At least {MIN_POINTS} points are needed to estimate the "
+                f"features, got {self.n_points}"
+            )
+        return np.array(
+            [
+                self.distance,
+                *self.velocity.stats(),
+                _div(self.vel_changes, self.distance),
+                _div(self.stops, self.distance),
+                *self.acceleration.stats(),
+                *self.acc_change_rate.stats(),
+                *self.angle.stats(),
+                *self.turning_angle.stats(),
+                *self.heading_change_rate.stats(),
+            ]
+        )
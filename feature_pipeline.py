@@ -0,0 +1,298 @@
+"""
+Serving pipeline of the feature-based classifier.
+
+Goes from raw Nx3 trajectories, through the batched feature estimation
+(``feature_batch``), to a persisted Random Forest (the best model of
+``supervised_feat.ipynb``) that is loaded once and reused for every call.
+
+Running this module benchmarks the pipeline (trajectories per second) at
+several batch sizes.
+"""
+import argparse
+import pickle
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+import feature_batch as fb
+from feature_vec import classes, stream_feat_vectors
+
+DEFAULT_MODEL_FILE = Path("feature_model.pkl")
+
+RF_PARAMS = {
+    "criterion": "entropy",
+    "max_features": "log2",
+    "bootstrap": False,
+    "random_state": 0,
+}
+"""Parameters of the Random Forest of ``supervised_feat.ipynb``."""
+
+
+class FeaturePipeline:
+    """
+    Feature extraction and classification of trajectories.
+
+    Parameters
+    ----------
+    model : Any
+        A fitted classifier with ``predict_proba`` (and ``classes_``).
+    class_names : List[str]
+        Name of each class code.
+    threashold : float
+        Threashold used by the velocity change rate and the stop rate.
+    """
+
+    def __init__(self, model: Any, class_names: List[str], threashold: float = 1):
+        self.model = model
+        self.class_names = list(class_names)
+        self.threashold = threashold
+
+    @classmethod
+    def train(
+        cls,
+        feat_vectors: np.ndarray,
+        clss: Sequence[int],
+        class_names: Optional[List[str]] = None,
+        threashold: float = 1,
+        **rf_params,
+    ) -> "FeaturePipeline":
+        """
+        Trains the Random Forest over some feature vectors.
+
+        Parameters
+        ----------
+        feat_vectors : np.ndarray
+            The feature vectors.
+        clss : Sequence[int]
+            The class code of each vector.
+        class_names : Optional[List[str]]
+            Name of each class code. By default ``feature_vec.classes``.
+        threashold : float
+            Threashold used to compute the vectors.
+        **rf_params
+            Parameters of the Random Forest (``RF_PARAMS`` by default).
+
+        Returns
+        -------
+        FeaturePipeline
+            The trained pipeline.
+        """
+        # pylint: disable=C0415
+        from sklearn.ensemble import RandomForestClassifier
+
+        if class_names is None:
+            class_names = list(classes)
+        model = RandomForestClassifier(**{**RF_PARAMS, **rf_params})
+        model.fit(feat_vectors, clss)
+        return cls(model, class_names, threashold)
+
+    @classmethod
+    def train_from_data(cls, data: List[dict], **rf_params) -> "FeaturePipeline":
+        """
+        Trains the pipeline over the selected data (see
+        ``data_handler.get_selected_data``).
+
+        Parameters
+        ----------
+        data : List[dict]
+            The trajectories (their data can be missing).
+        **rf_params
+            Parameters of the Random Forest.
+
+        Returns
+        -------
+        FeaturePipeline
+            The trained pipeline.
+        """
+        feat_vectors, _, _ = stream_feat_vectors(data)
+        clss = [classes[traj_md["class"]] for traj_md in data]
+        return cls.train(feat_vectors, clss, **rf_params)
+
+    def save(self, model_file: Path = DEFAULT_MODEL_FILE) -> None:
+        """
+        Persists the pipeline.
+
+        Parameters
+        ----------
+        model_file : Path
+            Path to the model file.
+        """
+        with open(model_file, "wb") as m_file:
+            pickle.dump(self, m_file)
+
+    @classmethod
+    def load(cls, model_file: Path = DEFAULT_MODEL_FILE) -> "FeaturePipeline":
+        """
+        Loads a persisted pipeline.
+
+        Parameters
+        ----------
+        model_file : Path
+            Path to the model file.
+
+        Returns
+        -------
+        FeaturePipeline
+            The loaded pipeline.
+        """
+        with open(model_file, "rb") as m_file:
+            pipeline = pickle.load(m_file)
+        if not isinstance(pipeline, cls):
+            raise TypeError(f"Not a feature pipeline: '{model_file}'")
+        return pipeline
+
+    def features(self, trajs: List[np.ndarray]) -> np.ndarray:
+        """
+        Feature vectors of several trajectories (computed at once).
+
+        Parameters
+        ----------
+        trajs : List[np.ndarray]
+            The trajectories (Nx3 matrices).
+
+        Returns
+        -------
+        np.ndarray
+            The (n_trajs, 51) feature matrix.
+        """
+        return fb.get_batch_feat_vectors(trajs, self.threashold)
+
+    def predict_many(
+        self, trajs: List[np.ndarray], batch_size: Optional[int] = None
+    ) -> Tuple[List[str], np.ndarray]:
+        """
+        Classifies several trajectories.
+
+        The features and the model are computed once per batch.
+
+        Parameters
+        ----------
+        trajs : List[np.ndarray]
+            The trajectories (Nx3 matrices).
+        batch_size : Optional[int]
+            Number of trajectories per batch. By default all of them.
+
+        Returns
+        -------
+        Tuple[List[str], np.ndarray]
+            The predicted class name of each trajectory and the probability
+            of each class (columns ordered as ``model.classes_``).
+        """
+        batch_size = batch_size or max(len(trajs), 1)
+        probas = []
+        for start in range(0, len(trajs), batch_size):
+            vectors = self.features(trajs[start : start + batch_size])
+            probas.append(self.model.predict_proba(vectors))
+        if not probas:
+            return [], np.empty((0, len(self.model.classes_)))
+        proba = np.concatenate(probas)
+        codes = np.asarray(self.model.classes_)[np.argmax(proba, axis=1)]
+        return [self.class_names[code] for code in codes], proba
+
+    def predict(self, traj: np.ndarray) -> str:
+        """
+        Classifies a trajectory.
+
+        Parameters
+        ----------
+        traj : np.ndarray
+            The trajectory (Nx3 matrix).
+
+        Returns
+        -------
+        str
+            The predicted class name.
+        """
+        return self.predict_many([traj])[0][0]
+
+
+def benchmark(
+    pipeline: FeaturePipeline,
+    trajs: List[np.ndarray],
+    batch_sizes: Sequence[int] = (1, 10, 100, 1000),
+) -> Dict[int, float]:
+    """
+    Throughput of the pipeline at several batch sizes.
+
+    Parameters
+    ----------
+    pipeline : FeaturePipeline
+        The pipeline.
+    trajs : List[np.ndarray]
+        The trajectories to classify.
+    batch_sizes : Sequence[int]
+        The batch sizes.
+
+    Returns
+    -------
+    Dict[int, float]
+        Trajectories per second of each batch size.
+    """
+    results = {}
+    for batch_size in batch_sizes:
+        start = time.perf_counter()
+        pipeline.predict_many(trajs, batch_size)
+        results[batch_size] = len(trajs) / (time.perf_counter() - start)
+    return results
+
+
+def random_trajs(n_trajs: int, length: int, seed: int = 0) -> Tuple[list, list]:
+    """
+    Synthetic trajectories of three speed profiles (used by the benchmark).
+
+    Parameters
+    ----------
+    n_trajs : int
+        Number of trajectories.
+    length : int
+        Number of points of each trajectory.
+    seed : int
+        Random seed.
+
+    Returns
+    -------
+    Tuple[list, list]
+        The trajectories and their class codes.
+    """
+    rng = np.random.default_rng(seed)
+    trajs, clss = [], []
+    for i in range(n_trajs):
+        clss.append(i % 3)
+        steps = rng.normal(scale=1e-5 * 10 ** (i % 3), size=(length, 2))
+        times = np.cumsum(rng.integers(1, 4, size=length)).astype(np.float64)
+        trajs.append(np.column_stack([39.9 + np.cumsum(steps, axis=0), times]))
+    return trajs, clss
+
+
+def main():
+    """Benchmarks the pipeline."""
+    parser = argparse.ArgumentParser(description="Feature pipeline benchmark")
+    parser.add_argument(
+        "--model",
+        type=Path,
+        default=None,
+        help="persisted pipeline (by default one is trained on synthetic data)",
+    )
+    parser.add_argument("--trajs", type=int, default=2000)
+    parser.add_argument("--length", type=int, default=300)
+    parser.add_argument(
+        "--batch-sizes", type=int, nargs="+", default=[1, 10, 100, 1000]
+    )
+    args = parser.parse_args()
+
+    trajs, _ = random_trajs(args.trajs, args.length)
+    if args.model is None:
+        train_trajs, train_clss = random_trajs(300, args.length, seed=1)
+        pipeline = FeaturePipeline.train(
+            fb.get_batch_feat_vectors(train_trajs, 1), train_clss
+        )
+    else:
+        pipeline = FeaturePipeline.load(args.model)
+    for batch_size, tps in benchmark(pipeline, trajs, args.batch_sizes).items():
+        print(f"batch size {batch_size:>6}: {tps:10.1f} trajectories/s")
+
+
+if __name__ == "__main__":
+    main()
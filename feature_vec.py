@@ -1,9 +1,26 @@
-from typing import List, Tuple
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from itertools import islice
+from multiprocessing import shared_memory
+from typing import (
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+)
 
 import numpy as np
 
+import feature_batch as fb
 import feature_est as fe
-from data_handler import get_selected_data
+from data_handler import get_selected_data, iter_trajs_data
+from instrumentation import get_instrument
 
 classes = {'walk': 0,
            'car': 1,
@@ -11,6 +28,9 @@ classes = {'walk': 0,
            'bus': 3,
            'bike': 4}
 
+FEATURES_VERSION = 2
+"""Version of the feature estimation (bump it when a feature changes)"""
+
 feat_name = [
     'distance',
     'mean_velocity',
@@ -65,82 +85,314 @@ feat_name = [
     'iqr_heading_change_rate',
 ]
 
-def convert_traj_into_vector(traj: np.ndarray, threashold: float) -> np.ndarray:
-    vel = fe.velocity(traj)
-    acc = fe.acceleration(traj)
-    acc_chg_rate = fe.acceleration_change_rate(traj)
-    ang = fe.angle(traj)
-    trng_ang = fe.turning_angle(traj)
-    hding_chg_rate = fe.heading_change_rate(traj)
-    traj_vect = np.array(
+# Feature registry
+
+DERIVATIVE_DEPS: Dict[str, List[str]] = {
+    "delta_pos": [],
+    "delta_r": ["delta_pos"],
+    "delta_t": [],
+    "distance": ["delta_r"],
+    "velocity": ["delta_r", "delta_t"],
+    "velocity_rate": ["velocity"],
+    "acceleration": ["velocity", "delta_t"],
+    "acceleration_change_rate": ["acceleration", "delta_t"],
+    "angle": ["delta_pos"],
+    "turning_angle": ["angle"],
+    "heading_change_rate": ["turning_angle", "delta_t"],
+    "rate_hcr": ["heading_change_rate", "delta_t"],
+}
+"""Intermediate signals (``fe.TrajDerivatives``) each one is computed from"""
+
+FeatureSpec = NamedTuple(
+    "FeatureSpec",
+    [
+        ("signals", Tuple[str, ...]),
+        ("stat", Optional[str]),
+        ("func", Optional[Callable]),
+    ],
+)
+"""A feature: a statistic (``fe.STATS_NAMES``) of an intermediate signal or
+a function of the derivatives and the threashold (``stat`` is None) that
+uses some signals"""
+
+STATS_SIGNALS = {
+    "velocity": "velocity",
+    "acceleration": "acceleration",
+    "acc_change_rate": "acceleration_change_rate",
+    "angle": "angle",
+    "turning_angle": "turning_angle",
+    "heading_change_rate": "heading_change_rate",
+}
+"""Intermediate signal of each ``feat_name`` suffix"""
+
+FEATURES: Dict[str, FeatureSpec] = {
+    "distance": FeatureSpec(("distance",), None, lambda d, _: fe.distance(d)),
+    "velocity_change_rate": FeatureSpec(
+        ("velocity_rate", "distance"), None, fe.vel_change_rate
+    ),
+    "stop_rate": FeatureSpec(("velocity", "distance"), None, fe.stop_rate),
+    **{
+        f"{stat}_{suffix}": FeatureSpec((signal,), stat, None)
+        for suffix, signal in STATS_SIGNALS.items()
+        for stat in fe.STATS_NAMES
+    },
+}
+"""Registry of every ``feat_name`` entry"""
+
+
+def _check_features(features: Sequence[str]) -> None:
+    unknown = [name for name in features if name not in FEATURES]
+    if unknown:
+        raise ValueError(f"Unknown features: {unknown}")
+
+
+def required_signals(features: Sequence[str]) -> Set[str]:
+    """
+    Intermediate signals needed to compute some features.
+
+    Parameters
+    ----------
+    features : Sequence[str]
+        Names of the features (see ``feat_name``).
+
+    Returns
+    -------
+    Set[str]
+        The needed ``fe.TrajDerivatives`` signals (with their dependencies).
+    """
+    _check_features(features)
+    pending = [signal for name in features for signal in FEATURES[name].signals]
+    needed: Set[str] = set()
+    while pending:
+        signal = pending.pop()
+        if signal not in needed:
+            needed.add(signal)
+            pending.extend(DERIVATIVE_DEPS[signal])
+    return needed
+
+
+def feature_indices(features: Sequence[str]) -> List[int]:
+    """
+    Columns of some features in the full feature vectors.
+
+    Parameters
+    ----------
+    features : Sequence[str]
+        Names of the features.
+
+    Returns
+    -------
+    List[int]
+        The index of each feature in ``feat_name``.
+    """
+    _check_features(features)
+    return [feat_name.index(name) for name in features]
+
+
+def compute_features(
+    traj: fe.Trajectory, features: Sequence[str], threashold: float
+) -> np.ndarray:
+    """
+    Computes only the requested features of a trajectory.
+
+    Only the intermediate signals the features depend on are computed (see
+    ``required_signals``), and the statistics of each signal are computed
+    once even if several of them are requested.
+
+    Parameters
+    ----------
+    traj : fe.Trajectory
+        The trajectory or its derivatives.
+    features : Sequence[str]
+        Names of the features (see ``feat_name``).
+    threashold : float
+        Threashold used by the velocity change rate and the stop rate.
+
+    Returns
+    -------
+    np.ndarray
+        The value of each feature, in the requested order.
+    """
+    _check_features(features)
+    derivs = fe.derivatives(traj)
+    signal_stats: Dict[str, np.ndarray] = {}
+    values = np.empty(len(features))
+    for i, name in enumerate(features):
+        spec = FEATURES[name]
+        if spec.stat is None:
+            values[i] = spec.func(derivs, threashold)
+            continue
+        signal = spec.signals[0]
+        if signal not in signal_stats:
+            signal_stats[signal] = fe.summary_stats(getattr(derivs, signal))
+        values[i] = signal_stats[signal][fe.STATS_NAMES.index(spec.stat)]
+    return values
+
+
+def convert_traj_into_vector(
+    traj: fe.Trajectory,
+    threashold: float,
+    features: Optional[Sequence[str]] = None,
+) -> np.ndarray:
+    if features is not None:
+        return compute_features(traj, features, threashold)
+    derivs = fe.derivatives(traj)
+    # Mean, median, min, max, std, var, coef_var and iqr of each signal
+    stats = fe.summary_stats_many(
+        [
+            fe.velocity(derivs),
+            fe.acceleration(derivs),
+            fe.acceleration_change_rate(derivs),
+            fe.angle(derivs),
+            fe.turning_angle(derivs),
+            fe.heading_change_rate(derivs),
+        ]
+    )
+    vel_stats, acc_stats, *other_stats = stats
+    traj_vect = np.concatenate(
         [
             # Distance
-            fe.distance(traj),
+            [fe.distance(derivs)],
             # Velocity
-            fe.mean(vel),
-            fe.median(vel),
-            fe.min_val(vel),
-            fe.max_val(vel),
-            fe.standard_dev(vel),
-            fe.variance(vel),
-            fe.coef_var(vel),
-            fe.iqr(vel),
+            vel_stats,
             # Velocity change rate
-            fe.vel_change_rate(traj, threashold),
+            [fe.vel_change_rate(derivs, threashold)],
             # Stop rate
-            fe.stop_rate(traj, threashold),
+            [fe.stop_rate(derivs, threashold)],
             # Acceleration
-            fe.mean(acc),
-            fe.median(acc),
-            fe.min_val(acc),
-            fe.max_val(acc),
-            fe.standard_dev(acc),
-            fe.variance(acc),
-            fe.coef_var(acc),
-            fe.iqr(acc),
-            # Acceleration change rate
-            fe.mean(acc_chg_rate),
-            fe.median(acc_chg_rate),
-            fe.min_val(acc_chg_rate),
-            fe.max_val(acc_chg_rate),
-            fe.standard_dev(acc_chg_rate),
-            fe.variance(acc_chg_rate),
-            fe.coef_var(acc_chg_rate),
-            fe.iqr(acc_chg_rate),
-            # Angle
-            fe.mean(ang),
-            fe.median(ang),
-            fe.min_val(ang),
-            fe.max_val(ang),
-            fe.standard_dev(ang),
-            fe.variance(ang),
-            fe.coef_var(ang),
-            fe.iqr(ang),
-            # Turning angle
-            fe.mean(trng_ang),
-            fe.median(trng_ang),
-            fe.min_val(trng_ang),
-            fe.max_val(trng_ang),
-            fe.standard_dev(trng_ang),
-            fe.variance(trng_ang),
-            fe.coef_var(trng_ang),
-            fe.iqr(trng_ang),
-            # Heading change rate
-            fe.mean(hding_chg_rate),
-            fe.median(hding_chg_rate),
-            fe.min_val(hding_chg_rate),
-            fe.max_val(hding_chg_rate),
-            fe.standard_dev(hding_chg_rate),
-            fe.variance(hding_chg_rate),
-            fe.coef_var(hding_chg_rate),
-            fe.iqr(hding_chg_rate),
+            acc_stats,
+            # Acceleration change rate, angle, turning angle and heading
+            # change rate
+            *other_stats,
         ]
     )
 
     return traj_vect
 
 
-def get_feat_vectors(data: List[dict]) -> Tuple[list, list, list]:
+def balanced_chunks(lengths: Sequence[int], n_chunks: int) -> List[Tuple[int, int]]:
+    """
+    Splits a list of trajectories into contiguous chunks with a similar
+    number of points.
+
+    Parameters
+    ----------
+    lengths : Sequence[int]
+        Number of points of each trajectory.
+    n_chunks : int
+        Maximum number of chunks.
+
+    Returns
+    -------
+    List[Tuple[int, int]]
+        The (start, stop) trajectory range of each (non-empty) chunk.
+    """
+    if not len(lengths):
+        return []
+    cum_points = np.zeros(len(lengths) + 1)
+    np.cumsum(lengths, out=cum_points[1:])
+    targets = cum_points[-1] * np.arange(1, n_chunks) / n_chunks
+    # Each chunk ends at the trajectory boundary nearest to its share of
+    # points
+    after = np.searchsorted(cum_points, targets)
+    before = np.maximum(after - 1, 0)
+    closer = cum_points[after] - targets < targets - cum_points[before]
+    ends = np.where(closer, after, before)
+    bounds = np.unique(np.concatenate([[0], ends, [len(lengths)]]))
+    return list(zip(bounds[:-1].tolist(), bounds[1:].tolist()))
+
+
+def _feat_chunk(
+    points_name: str,
+    out_name: str,
+    out_shape: Tuple[int, int],
+    offsets: np.ndarray,
+    start: int,
+    features: Optional[Sequence[str]],
+) -> int:
+    """Computes the vectors of a chunk of the shared trajectories into the
+    shared output matrix. ``offsets`` are the point offsets (in the shared
+    points) of the chunk trajectories, whose first one is ``start``."""
+    points_shm = shared_memory.SharedMemory(name=points_name)
+    out_shm = shared_memory.SharedMemory(name=out_name)
+    try:
+        points = np.ndarray((offsets[-1], 3), buffer=points_shm.buf)
+        out = np.ndarray(out_shape, buffer=out_shm.buf)
+        for i, (t_start, t_stop) in enumerate(zip(offsets[:-1], offsets[1:])):
+            out[start + i] = convert_traj_into_vector(
+                points[t_start:t_stop], 1, features
+            )
+        # The views must be released before closing the blocks
+        del points, out
+    finally:
+        points_shm.close()
+        out_shm.close()
+    return len(offsets) - 1
+
+
+def _parallel_feat_vectors(
+    trajs: List[fe.Trajectory],
+    features: Optional[Sequence[str]],
+    workers: Optional[int],
+) -> List[np.ndarray]:
+    """Feature vectors of the trajectories computed on a process pool (see
+    ``get_feat_vectors``)."""
+    workers = workers or os.cpu_count() or 1
+    if features is not None:
+        _check_features(features)
+    n_feat = len(feat_name) if features is None else len(features)
+    lengths = np.fromiter((len(traj) for traj in trajs), np.int64, len(trajs))
+    offsets = np.zeros(len(trajs) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    out_shape = (len(trajs), n_feat)
+    inst = get_instrument()
+
+    points_shm = shared_memory.SharedMemory(
+        create=True, size=max(int(offsets[-1]) * 3 * 8, 1)
+    )
+    out_shm = shared_memory.SharedMemory(
+        create=True, size=max(len(trajs) * n_feat * 8, 1)
+    )
+    try:
+        points = np.ndarray((offsets[-1], 3), buffer=points_shm.buf)
+        for traj, t_start, t_stop in zip(trajs, offsets[:-1], offsets[1:]):
+            points[t_start:t_stop] = traj
+        del points
+
+        # A few chunks per worker balance the load when the trajectory
+        # lengths are skewed
+        chunks = balanced_chunks(lengths, 4 * workers)
+        done = 0
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(
+                    _feat_chunk,
+                    points_shm.name,
+                    out_shm.name,
+                    out_shape,
+                    offsets[start : stop + 1],
+                    start,
+                    features,
+                )
+                for start, stop in chunks
+            ]
+            for future in as_completed(futures):
+                done += future.result()
+                inst.progress("get_feat_vectors", done, len(trajs))
+        vectors = np.ndarray(out_shape, buffer=out_shm.buf).copy()
+    finally:
+        points_shm.close()
+        points_shm.unlink()
+        out_shm.close()
+        out_shm.unlink()
+    return list(vectors)
+
+
+def get_feat_vectors(
+    data: List[dict],
+    features: Optional[Sequence[str]] = None,
+    workers: Optional[int] = 1,
+) -> Tuple[list, list, list]:
     """
     Get the list of feature vectors and their classes.
 
@@ -148,28 +400,164 @@ def get_feat_vectors(data: List[dict]) -> Tuple[list, list, list]:
     ----------
     data : List[dict]
         The list of trajectories.
+    features : Optional[Sequence[str]]
+        Names of the computed features, in the order of the vectors. By
+        default all of them (``feat_name``).
+    workers : Optional[int]
+        Number of worker processes the trajectories are distributed over.
+        ``1`` processes them sequentially and ``None`` uses all the cores.
+        The workers read the trajectories from shared memory (as float64
+        arrays, compact trajectories are expanded) and write the vectors
+        into a shared matrix, in the order of ``data``.
 
     Returns
     -------
     Tuple[list, list, list]
         The Vectors and the list of classes and class masks.
     """
-    vectors = []
-    clss_mask = []
-    clss = []
     length = len(data)
-    classes = {n:i for i, n in enumerate(set(md["class"] for md in data))}
-    for i,d in enumerate(data):
-        print(f"{(i+1)/length:.2%}", end="\r")
-        traj = d["traj_data"]
-        traj_vect = convert_traj_into_vector(traj, 1)
-        vectors.append(traj_vect)
-        clss_mask.append(class_mask(d))
-        clss.append(classes[d['class']])
-        
+    inst = get_instrument()
+    with inst.stage("get_feat_vectors"):
+        if workers != 1 and length > 1:
+            vectors = _parallel_feat_vectors(
+                [d["traj_data"] for d in data], features, workers
+            )
+            inst.count("points_featurized", sum(len(d["traj_data"]) for d in data))
+        else:
+            vectors = []
+            for i,d in enumerate(data):
+                inst.progress("get_feat_vectors", i + 1, length)
+                traj = d["traj_data"]
+                traj_vect = convert_traj_into_vector(traj, 1, features)
+                vectors.append(traj_vect)
+                inst.count("points_featurized", len(traj))
+        inst.count("trajectories_featurized", length)
+    clss_mask, clss = get_classes(data)
+
     return (vectors, clss_mask, clss)
 
+
+def get_classes(data: List[dict]) -> Tuple[list, list]:
+    """
+    Get the class masks and the classes of the trajectories.
+
+    Parameters
+    ----------
+    data : List[dict]
+        The list of trajectories (metadata only is needed).
+
+    Returns
+    -------
+    Tuple[list, list]
+        The list of class masks and classes.
+    """
+    classes = {n:i for i, n in enumerate(set(md["class"] for md in data))}
+    clss_mask = [class_mask(d) for d in data]
+    clss = [classes[d['class']] for d in data]
+    return clss_mask, clss
+
+
+def iter_feat_chunks(
+    trajs: Iterable[np.ndarray], chunk_size: int = 1024, threashold: float = 1
+) -> Iterator[np.ndarray]:
+    """
+    Lazily computes the feature vectors of chunks of trajectories.
+
+    Only one chunk of trajectories is kept alive at a time.
+
+    Parameters
+    ----------
+    trajs : Iterable[np.ndarray]
+        The trajectories (they can be lazily loaded).
+    chunk_size : int
+        Number of trajectories of each chunk.
+    threashold : float
+        Threashold used by the velocity change rate and the stop rate.
+
+    Yields
+    ------
+    np.ndarray
+        The (chunk_size, 51) feature matrix of each chunk (the last one can
+        be smaller).
+    """
+    trajs = iter(trajs)
+    while True:
+        chunk = list(islice(trajs, chunk_size))
+        if not chunk:
+            return
+        yield fb.get_batch_feat_vectors(chunk, threashold)
+
+
+def stream_feat_vectors(
+    data: List[dict],
+    chunk_size: int = 1024,
+    out: Optional[np.ndarray] = None,
+) -> Tuple[np.ndarray, list, list]:
+    """
+    Get the feature vectors and their classes with bounded memory.
+
+    The trajectories are loaded lazily from the metadata (see
+    ``data_handler.iter_trajs_data``) and their features are computed by
+    chunks and written into a preallocated matrix, so the memory used does
+    not depend on the number of trajectories (besides the output).
+
+    Parameters
+    ----------
+    data : List[dict]
+        The list of trajectories (their data can be missing).
+    chunk_size : int
+        Number of trajectories processed at once.
+    out : Optional[np.ndarray]
+        The (n_traj, 51) matrix where the vectors are written. It can be a
+        ``np.memmap`` to keep the output on disk as well. By default a new
+        matrix is allocated.
+
+    Returns
+    -------
+    Tuple[np.ndarray, list, list]
+        The feature matrix and the list of class masks and classes.
+    """
+    if out is None:
+        out = np.empty((len(data), len(feat_name)))
+    if out.shape != (len(data), len(feat_name)):
+        raise ValueError(
+            f"Output shape must be {(len(data), len(feat_name))}, got {out.shape}"
+        )
+    start = 0
+    for vectors in iter_feat_chunks(iter_trajs_data(data), chunk_size):
+        out[start : start + len(vectors)] = vectors
+        start += len(vectors)
+    clss_mask, clss = get_classes(data)
+    return out, clss_mask, clss
+
 def class_mask(traj: dict) -> np.ndarray:
     mask = np.zeros(5)
     mask[classes[traj['class']]] = 1
     return mask
+
+
+def clamp_data(trajs: List[np.ndarray], hist_size: int = 75) -> np.ndarray:
+    """
+    Gets the last n points of each trajectory (as ``clamp_data`` in
+    ``lstm.ipynb``), the input of the LSTM models.
+
+    Trajectories with less than ``hist_size`` points are padded with zeros
+    at the beginning.
+
+    Parameters
+    ----------
+    trajs : List[np.ndarray]
+        The trajectories.
+    hist_size : int
+        Number of points kept of each trajectory.
+
+    Returns
+    -------
+    np.ndarray
+        A (n_trajs, hist_size, 3) array.
+    """
+    batch = np.zeros((len(trajs), hist_size, 3), dtype=np.float32)
+    for i, traj in enumerate(trajs):
+        last_points = traj[-hist_size:]
+        batch[i, hist_size - len(last_points) :] = last_points
+    return batch
@@ -0,0 +1,198 @@
+"""
+Sliding-window feature extraction over a single trajectory.
+
+The feature vector (``feature_vec.feat_name`` layout) of every window of
+``window`` points, taken every ``stride`` points, is computed in one pass:
+
+    - The signals of a window are slices of the signals of the whole
+      trajectory, so they are computed once.
+    - The distance, the counts (velocity changes and stops) and the moments
+      (mean, std, var, coef_var) come from prefix sums, O(1) per window.
+    - The order statistics (min, max, median and iqr) come from a sorted
+      window that is updated as the window slides (one insertion and one
+      removal per point). When the stride leaves the windows sparse, each
+      window is sorted instead.
+
+Compared to ``convert_traj_into_vector`` on every window, which is
+O(n * window), the cost is O(n log window) plus the shifting of the sorted
+window (fast memory moves).
+"""
+from bisect import bisect_left, insort
+from typing import List
+
+import numpy as np
+
+import feature_est as fe
+from feature_batch import MIN_TRAJ_LEN
+from feature_vec import feat_name
+
+ORDER_PROBS = (0.25, 0.5, 0.75)
+
+
+def window_starts(n_points: int, window: int, stride: int = 1) -> np.ndarray:
+    """
+    First point of each window.
+
+    Parameters
+    ----------
+    n_points : int
+        Number of points of the trajectory.
+    window : int
+        Number of points of each window.
+    stride : int
+        Number of points between the starts of consecutive windows.
+
+    Returns
+    -------
+    np.ndarray
+        The start of each window (windows that do not fit are dropped).
+    """
+    if window < MIN_TRAJ_LEN:
+        raise ValueError(f"Windows need at least {MIN_TRAJ_LEN} points, got {window}")
+    if stride < 1:
+        raise ValueError(f"The stride must be positive, got {stride}")
+    if n_points < window:
+        return np.empty(0, dtype=np.int64)
+    return np.arange(0, n_points - window + 1, stride, dtype=np.int64)
+
+
+def _window_sums(values: np.ndarray, starts: np.ndarray, size: int) -> np.ndarray:
+    """Sum of ``values[start:start + size]`` for each start."""
+    prefix = np.zeros(len(values) + 1)
+    np.cumsum(values, out=prefix[1:])
+    return prefix[starts + size] - prefix[starts]
+
+
+def _sliding_picks(
+    values: np.ndarray, starts: np.ndarray, size: int, picks: np.ndarray
+) -> np.ndarray:
+    """Values at the ``picks`` positions of each sorted window, with a
+    sorted window updated point by point."""
+    vals = values.tolist()
+    picks = picks.tolist()
+    picked = np.empty((len(starts), len(picks)))
+    stop = starts[-1] + size
+    is_start = np.zeros(stop, dtype=bool)
+    is_start[starts] = True
+    sorted_win = sorted(vals[:size])
+    picked_idx = 0
+    for start in range(stop - size + 1):
+        if is_start[start]:
+            picked[picked_idx] = [sorted_win[i] for i in picks]
+            picked_idx += 1
+        if start + size < stop:
+            # Slide the window one point
+            del sorted_win[bisect_left(sorted_win, vals[start])]
+            insort(sorted_win, vals[start + size])
+    return picked
+
+
+def _rolling_order_stats(
+    values: np.ndarray, starts: np.ndarray, size: int
+) -> List[np.ndarray]:
+    """Min, max and quartiles of ``values[start:start + size]`` for each
+    start."""
+    virtual_idx = (size - 1) * np.array(ORDER_PROBS)
+    low = np.floor(virtual_idx).astype(np.int64)
+    high = np.minimum(low + 1, size - 1)
+    picks = np.concatenate([[0, size - 1], low, high])
+    if len(starts) * size <= 2 * len(values):
+        # Sparse windows (large stride): sorting each one is cheaper than
+        # sliding through every point
+        windows = values[starts[:, None] + np.arange(size)]
+        picked = np.sort(windows, axis=1)[:, picks]
+    else:
+        picked = _sliding_picks(values, starts, size, picks)
+
+    n_quart = len(ORDER_PROBS)
+    below, above = picked[:, 2 : 2 + n_quart], picked[:, 2 + n_quart :]
+    quartiles = fe._lerp(below, above, virtual_idx - low)  # pylint: disable=W0212
+    return [picked[:, 0], picked[:, 1], *quartiles.T]
+
+
+def _window_stats(values: np.ndarray, starts: np.ndarray, size: int) -> np.ndarray:
+    """The ``fe.STATS_NAMES`` statistics of each window of a signal."""
+    # Non-finite samples (e.g. the velocity of repeated timestamps) would
+    # poison every later prefix sum and break the sorted window: they are
+    # replaced by zeros and the windows holding them are computed directly
+    raw_values = values
+    finite = np.isfinite(values)
+    bad_windows = np.empty(0, dtype=np.int64)
+    if not finite.all():
+        n_bad = _window_sums((~finite).astype(np.float64), starts, size)
+        bad_windows = np.flatnonzero(n_bad > 0)
+        values = np.where(finite, values, 0.0)
+    # Shift by the mean of the signal to reduce the cancellation of the
+    # prefix sums of squares
+    shift = np.mean(values) if len(values) else 0.0
+    centered = values - shift
+    sums = _window_sums(centered, starts, size)
+    sq_sums = _window_sums(centered * centered, starts, size)
+    _min, _max, q25, q50, q75 = _rolling_order_stats(values, starts, size)
+    # The prefix sums are rounded: the exact extremes of each window bound
+    # the mean and make the variance of constant windows exactly zero
+    _mean = np.clip(sums / size + shift, _min, _max)
+    _var = np.maximum(sq_sums / size - (sums / size) ** 2, 0.0)
+    _var[_min == _max] = 0.0
+    _std = np.sqrt(_var)
+    abs_mean = np.abs(_mean)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        _coef_var = np.where(abs_mean != 0, _std / abs_mean, 0.0)
+    stats = np.column_stack([_mean, q50, _min, _max, _std, _var, _coef_var, q75 - q25])
+    for i in bad_windows:
+        stats[i] = fe.summary_stats(raw_values[starts[i] : starts[i] + size])
+    return stats
+
+
+def window_feat_vectors(
+    traj: fe.Trajectory, window: int, stride: int = 1, threashold: float = 1
+) -> np.ndarray:
+    """
+    Feature vectors of the sliding windows of a trajectory.
+
+    The vector of each window is the one ``convert_traj_into_vector`` gives
+    for ``traj[start:start + window]`` (up to the rounding of the prefix
+    sums).
+
+    Parameters
+    ----------
+    traj : fe.Trajectory
+        The trajectory (or its derivatives).
+    window : int
+        Number of points of each window (at least 4).
+    stride : int
+        Number of points between the starts of consecutive windows.
+    threashold : float
+        Threashold used by the velocity change rate and the stop rate.
+
+    Returns
+    -------
+    np.ndarray
+        The (n_windows, 51) feature matrix (see ``window_starts``).
+    """
+    derivs = fe.derivatives(traj)
+    starts = window_starts(len(derivs.delta_t) + 1, window, stride)
+    vectors = np.empty((len(starts), len(feat_name)))
+    if not len(starts):
+        return vectors
+
+    distance = _window_sums(derivs.delta_r, starts, window - 1)
+    vel_changes = _window_sums(
+        (derivs.velocity_rate > threashold).astype(np.float64), starts, window - 2
+    )
+    stops = _window_sums(
+        (derivs.velocity < threashold).astype(np.float64), starts, window - 1
+    )
+    with np.errstate(divide="ignore", invalid="ignore"):
+        vectors[:, 0] = distance
+        vectors[:, 9] = vel_changes / distance
+        vectors[:, 10] = stops / distance
+    vectors[:, 1:9] = _window_stats(derivs.velocity, starts, window - 1)
+    vectors[:, 11:19] = _window_stats(derivs.acceleration, starts, window - 2)
+    vectors[:, 19:27] = _window_stats(
+        derivs.acceleration_change_rate, starts, window - 3
+    )
+    vectors[:, 27:35] = _window_stats(derivs.angle, starts, window - 1)
+    vectors[:, 35:43] = _window_stats(derivs.turning_angle, starts, window - 2)
+    vectors[:, 43:51] = _window_stats(derivs.heading_change_rate, starts, window - 2)
+    return vectors
@@ -0,0 +1,342 @@
+"""
+Progress reporting and stage instrumentation.
+
+The loading and feature functions report their progress, time their stages
+and count what they process (points, trajectories, bytes read) through the
+current ``Instrument`` instead of printing every item. The events are
+forwarded to pluggable sinks:
+
+    - ``ProgressSink``: rate-limited progress line on the terminal (default)
+    - ``JsonSink`` / ``CsvSink``: export the collected metrics to a file
+
+``NullInstrument`` disables everything (its methods do nothing).
+
+Example::
+
+    with using(Instrument([JsonSink("metrics.json")])) as inst:
+        data = get_selected_data()
+    # metrics.json has the counters and the time of every stage
+"""
+import csv
+import json
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, TextIO
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def max_rss() -> Optional[int]:
+    """
+    Peak resident memory of the process.
+
+    Returns
+    -------
+    Optional[int]
+        The peak resident memory in bytes (None if it is not available).
+    """
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+class Sink:
+    """Receiver of the instrumentation events (it ignores all of them)."""
+
+    def on_progress(self, stage: str, done: int, total: int) -> None:
+        """Progress of a stage (already rate-limited by the instrument)."""
+
+    def on_stage(self, stage: str, seconds: float, peak_bytes: Optional[int]) -> None:
+        """End of a stage."""
+
+    def export(self, metrics: dict) -> None:
+        """Final metrics (see ``Instrument.metrics``)."""
+
+
+class ProgressSink(Sink):
+    """
+    Progress line on a text stream (overwritten in place).
+
+    Parameters
+    ----------
+    stream : Optional[TextIO]
+        The stream (``sys.stderr`` by default).
+    """
+
+    def __init__(self, stream: Optional[TextIO] = None):
+        self.stream = stream
+
+    def on_progress(self, stage: str, done: int, total: int) -> None:
+        stream = self.stream or sys.stderr
+        end = "\n" if done >= total else ""
+        stream.write(f"\r{stage}: {done / total:.2%}{end}")
+        stream.flush()
+
+
+class JsonSink(Sink):
+    """
+    Exports the metrics to a json file.
+
+    Parameters
+    ----------
+    path : Path
+        Path to the json file.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+
+    def export(self, metrics: dict) -> None:
+        with open(self.path, "w", encoding="utf-8") as m_file:
+            json.dump(metrics, m_file, indent=2)
+
+
+class CsvSink(Sink):
+    """
+    Exports the metrics to a csv file (columns: kind, name, field, value).
+
+    Parameters
+    ----------
+    path : Path
+        Path to the csv file.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+
+    def export(self, metrics: dict) -> None:
+        with open(self.path, "w", encoding="utf-8", newline="") as m_file:
+            writer = csv.writer(m_file)
+            writer.writerow(["kind", "name", "field", "value"])
+            for name, value in metrics["counters"].items():
+                writer.writerow(["counter", name, "value", value])
+            for name, stage in metrics["stages"].items():
+                for field, value in stage.items():
+                    writer.writerow(["stage", name, field, value])
+            writer.writerow(["process", "max_rss", "bytes", metrics["max_rss_bytes"]])
+
+
+def sink_for_path(path: Path) -> Sink:
+    """
+    Export sink of a metrics file (by its extension).
+
+    Parameters
+    ----------
+    path : Path
+        Path to a ``.json`` or ``.csv`` file.
+
+    Returns
+    -------
+    Sink
+        The sink.
+    """
+    suffix = Path(path).suffix.lower()
+    if suffix == ".json":
+        return JsonSink(path)
+    if suffix == ".csv":
+        return CsvSink(path)
+    raise ValueError(f"Unknown metrics format: '{path}' (use .json or .csv)")
+
+
+class Instrument:
+    """
+    Collects progress, stage times and counters and forwards them to sinks.
+
+    Parameters
+    ----------
+    sinks : Optional[List[Sink]]
+        The sinks (a ``ProgressSink`` by default).
+    progress_interval : float
+        Minimum time (in seconds) between progress events of a stage.
+    trace_memory : bool
+        Whether to trace the peak memory of each stage with ``tracemalloc``
+        (slower). Otherwise only the peak resident memory of the process is
+        recorded.
+    """
+
+    def __init__(
+        self,
+        sinks: Optional[List[Sink]] = None,
+        progress_interval: float = 0.5,
+        trace_memory: bool = False,
+    ):
+        self.sinks = [ProgressSink()] if sinks is None else list(sinks)
+        self.progress_interval = progress_interval
+        self.trace_memory = trace_memory
+        self.counters: Dict[str, int] = {}
+        self.stages: Dict[str, dict] = {}
+        self._last_progress: Dict[str, float] = {}
+
+    def progress(self, stage: str, done: int, total: int) -> None:
+        """
+        Reports the progress of a stage (rate-limited).
+
+        Parameters
+        ----------
+        stage : str
+            Name of the stage.
+        done : int
+            Number of processed items.
+        total : int
+            Total number of items.
+        """
+        now = time.monotonic()
+        last = self._last_progress.get(stage)
+        if done < total and last is not None and now - last < self.progress_interval:
+            return
+        self._last_progress[stage] = now
+        for sink in self.sinks:
+            sink.on_progress(stage, done, total)
+
+    def count(self, name: str, value: int = 1) -> None:
+        """
+        Increments a counter.
+
+        Parameters
+        ----------
+        name : str
+            Name of the counter (e.g. ``points``).
+        value : int
+            The increment.
+        """
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """
+        Times a stage (stages with the same name are accumulated).
+
+        Parameters
+        ----------
+        name : str
+            Name of the stage.
+        """
+        tracing = self.trace_memory and not tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.start()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            peak = None
+            if tracing:
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+            stats = self.stages.setdefault(
+                name, {"calls": 0, "seconds": 0.0, "peak_bytes": None}
+            )
+            stats["calls"] += 1
+            stats["seconds"] += seconds
+            if peak is not None:
+                stats["peak_bytes"] = max(stats["peak_bytes"] or 0, peak)
+            self._last_progress.pop(name, None)
+            for sink in self.sinks:
+                sink.on_stage(name, seconds, peak)
+
+    def metrics(self) -> dict:
+        """
+        Collected metrics.
+
+        Returns
+        -------
+        dict
+            The ``counters``, the calls, total time and peak traced memory
+            of each stage (``stages``) and the peak resident memory of the
+            process (``max_rss_bytes``).
+        """
+        return {
+            "counters": dict(self.counters),
+            "stages": {name: dict(stats) for name, stats in self.stages.items()},
+            "max_rss_bytes": max_rss(),
+        }
+
+    def close(self) -> None:
+        """Exports the metrics to the sinks."""
+        metrics = self.metrics()
+        for sink in self.sinks:
+            sink.export(metrics)
+
+
+class NullInstrument(Instrument):
+    """Instrument that ignores every event."""
+
+    def __init__(self):
+        super().__init__(sinks=[])
+
+    def progress(self, stage: str, done: int, total: int) -> None:
+        pass
+
+    def count(self, name: str, value: int = 1) -> None:
+        pass
+
+    def stage(self, name: str):  # pylint: disable=W0221
+        return nullcontext()
+
+    def close(self) -> None:
+        pass
+
+
+_CURRENT: Instrument = Instrument()
+
+
+def get_instrument() -> Instrument:
+    """
+    Current instrument (a rate-limited terminal progress by default).
+
+    Returns
+    -------
+    Instrument
+        The current instrument.
+    """
+    return _CURRENT
+
+
+def set_instrument(instrument: Instrument) -> Instrument:
+    """
+    Replaces the current instrument.
+
+    Parameters
+    ----------
+    instrument : Instrument
+        The new instrument.
+
+    Returns
+    -------
+    Instrument
+        The previous instrument.
+    """
+    global _CURRENT  # pylint: disable=W0603
+    previous, _CURRENT = _CURRENT, instrument
+    return previous
+
+
+@contextmanager
+def using(instrument: Instrument) -> Iterator[Instrument]:
+    """
+    Uses an instrument in a block and exports its metrics at the end.
+
+    Parameters
+    ----------
+    instrument : Instrument
+        The instrument.
+
+    Yields
+    ------
+    Instrument
+        The instrument.
+    """
+    previous = set_instrument(instrument)
+    try:
+        yield instrument
+    finally:
+        set_instrument(previous)
+        instrument.close()
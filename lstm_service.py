@@ -0,0 +1,295 @@
+"""
+Micro-batching inference service for the LSTM classifier.
+
+The model (``best_model.h5`` or ``best_model_3_cls.h5``, see ``lstm.ipynb``)
+is loaded once. Trajectories from many concurrent callers are queued and
+packed into padded micro-batches (using the last ``hist_size`` points of each
+trajectory, see ``feature_vec.clamp_data``), which are flushed when they
+reach ``max_batch_size`` trajectories or when the oldest request has waited
+``max_delay`` seconds.
+
+Running this module starts a local load generator that reports the
+throughput and the latency percentiles of the service.
+"""
+import argparse
+import asyncio
+import time
+from pathlib import Path
+from typing import Any, List, Optional, Tuple, Union
+
+import numpy as np
+
+from feature_vec import clamp_data
+
+
+def load_model(model_file: Path) -> Any:
+    """
+    Loads a keras model (TensorFlow is only needed here).
+
+    Parameters
+    ----------
+    model_file : Path
+        Path to the model file.
+
+    Returns
+    -------
+    Any
+        The loaded model.
+    """
+    from tensorflow import keras  # pylint: disable=C0415
+
+    return keras.models.load_model(model_file)
+
+
+class LSTMInferenceService:
+    """
+    Asyncio micro-batching service over a loaded model.
+
+    Parameters
+    ----------
+    model : Union[Path, str, Any]
+        Path to the model file or an already loaded model (any object with
+        a keras-like ``predict`` method).
+    hist_size : Optional[int]
+        Number of points used of each trajectory. By default it is taken
+        from the input shape of the model.
+    max_batch_size : int
+        Maximum number of trajectories of a micro-batch.
+    max_delay : float
+        Maximum time (in seconds) a request waits for its batch to fill.
+    """
+
+    def __init__(
+        self,
+        model: Union[Path, str, Any],
+        hist_size: Optional[int] = None,
+        max_batch_size: int = 64,
+        max_delay: float = 0.005,
+    ):
+        if isinstance(model, (str, Path)):
+            model = load_model(Path(model))
+        self.model = model
+        if hist_size is None:
+            hist_size = model.input_shape[1]
+        self.hist_size = hist_size
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+        self.latencies: List[float] = []
+        self.batch_sizes: List[int] = []
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._started_at = 0.0
+
+    async def start(self) -> None:
+        """Starts the batching loop."""
+        self._queue = asyncio.Queue()
+        self._started_at = time.perf_counter()
+        self._worker = asyncio.create_task(self._batch_loop())
+
+    async def stop(self) -> None:
+        """Stops the batching loop (pending requests are served first)."""
+        if self._worker is None:
+            return
+        await self._queue.put(None)
+        await self._worker
+        self._worker = None
+
+    async def __aenter__(self) -> "LSTMInferenceService":
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.stop()
+
+    async def predict(self, traj: np.ndarray) -> np.ndarray:
+        """
+        Predicts the class probabilities of a trajectory.
+
+        Parameters
+        ----------
+        traj : np.ndarray
+            The trajectory (Nx3 matrix).
+
+        Returns
+        -------
+        np.ndarray
+            The probability of each class.
+        """
+        if self._worker is None:
+            raise RuntimeError("The service is not running")
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((traj, future, time.perf_counter()))
+        return await future
+
+    async def _batch_loop(self) -> None:
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = item[2] + self.max_delay
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - time.perf_counter()
+                try:
+                    if timeout > 0:
+                        item = await asyncio.wait_for(self._queue.get(), timeout)
+                    else:
+                        item = self._queue.get_nowait()
+                except (asyncio.TimeoutError, asyncio.QueueEmpty):
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            await self._run_batch(loop, batch)
+
+    async def _run_batch(
+        self,
+        loop: asyncio.AbstractEventLoop,
+        batch: List[Tuple[np.ndarray, asyncio.Future, float]],
+    ) -> None:
+        # Each request is packed on its own, so a malformed trajectory only
+        # fails its own future
+        inputs = np.zeros((len(batch), self.hist_size, 3), dtype=np.float32)
+        valid = []
+        for traj, future, queued_at in batch:
+            try:
+                inputs[len(valid)] = clamp_data([traj], self.hist_size)[0]
+            except Exception as exc:  # pylint: disable=W0703
+                if not future.done():
+                    future.set_exception(exc)
+                continue
+            valid.append((traj, future, queued_at))
+        if not valid:
+            return
+        batch = valid
+        inputs = inputs[: len(batch)]
+        try:
+            # Run the model outside the event loop so new requests keep
+            # being queued meanwhile
+            preds = await loop.run_in_executor(
+                None, lambda: np.asarray(self.model.predict(inputs, verbose=0))
+            )
+        except Exception as exc:  # pylint: disable=W0703
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(exc)
+            return
+        done_at = time.perf_counter()
+        self.batch_sizes.append(len(batch))
+        for (_, future, queued_at), pred in zip(batch, preds):
+            self.latencies.append(done_at - queued_at)
+            if not future.done():
+                future.set_result(pred)
+
+    def stats(self) -> dict:
+        """
+        Throughput and latency statistics of the served requests.
+
+        Returns
+        -------
+        dict
+            Number of requests and batches, mean batch size, throughput
+            (requests per second since the start) and p50/p99 latencies
+            (in milliseconds).
+        """
+        elapsed = time.perf_counter() - self._started_at
+        latencies = np.array(self.latencies) * 1000
+        has_reqs = len(latencies) > 0
+        return {
+            "requests": len(latencies),
+            "batches": len(self.batch_sizes),
+            "mean_batch_size": float(np.mean(self.batch_sizes)) if has_reqs else 0.0,
+            "throughput": len(latencies) / elapsed if elapsed > 0 else 0.0,
+            "p50_ms": float(np.percentile(latencies, 50)) if has_reqs else 0.0,
+            "p99_ms": float(np.percentile(latencies, 99)) if has_reqs else 0.0,
+        }
+
+
+def random_trajs(n_trajs: int, length: int, seed: int = 0) -> List[np.ndarray]:
+    """
+    Synthetic random-walk trajectories (used by the load generator).
+
+    Parameters
+    ----------
+    n_trajs : int
+        Number of trajectories.
+    length : int
+        Number of points of each trajectory.
+    seed : int
+        Random seed.
+
+    Returns
+    -------
+    List[np.ndarray]
+        The trajectories (Nx3 matrices).
+    """
+    rng = np.random.default_rng(seed)
+    trajs = []
+    for _ in range(n_trajs):
+        points = 39.9 + np.cumsum(rng.normal(scale=1e-4, size=(length, 2)), axis=0)
+        times = np.arange(length, dtype=np.float64)
+        trajs.append(np.column_stack([points, times]))
+    return trajs
+
+
+async def run_load(
+    service: LSTMInferenceService,
+    trajs: List[np.ndarray],
+    clients: int,
+) -> dict:
+    """
+    Sends the trajectories to the service from concurrent clients.
+
+    Parameters
+    ----------
+    service : LSTMInferenceService
+        The (not started) service.
+    trajs : List[np.ndarray]
+        The trajectories to classify.
+    clients : int
+        Number of concurrent clients.
+
+    Returns
+    -------
+    dict
+        The statistics of the service (see ``LSTMInferenceService.stats``).
+    """
+
+    async def client(client_trajs: List[np.ndarray]) -> None:
+        for traj in client_trajs:
+            await service.predict(traj)
+
+    async with service:
+        await asyncio.gather(*(client(trajs[i::clients]) for i in range(clients)))
+    return service.stats()
+
+
+def main():
+    """Runs the load generator."""
+    parser = argparse.ArgumentParser(description="LSTM inference load generator")
+    parser.add_argument("--model", default="best_model.h5", help="model file")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--clients", type=int, default=64)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--max-delay", type=float, default=0.005)
+    parser.add_argument("--length", type=int, default=300, help="trajectory length")
+    args = parser.parse_args()
+
+    service = LSTMInferenceService(
+        args.model, max_batch_size=args.batch_size, max_delay=args.max_delay
+    )
+    trajs = random_trajs(args.requests, args.length)
+    stats = asyncio.run(run_load(service, trajs, args.clients))
+    print(
+        f"{stats['requests']} requests in {stats['batches']} batches "
+        f"(mean size {stats['mean_batch_size']:.1f})\n"
+        f"Throughput: {stats['throughput']:.1f} req/s\n"
+        f"Latency p50: {stats['p50_ms']:.2f} ms, p99: {stats['p99_ms']:.2f} ms"
+    )
+
+
+if __name__ == "__main__":
+    main()
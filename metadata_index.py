@@ -0,0 +1,232 @@
+"""
+Columnar index of the trajectories metadata.
+
+The metadata of every trajectory is stored as NumPy columns in a ``.npz``
+file, so trajectories can be selected with vectorized boolean masks without
+parsing the json metadata file or opening any trajectory file.
+"""
+import json
+import logging
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+
+import numpy as np
+
+DEFAULT_INDEX_FILE = Path("trajectories/metadata_index.npz")
+
+FLOAT_COLUMNS = [
+    "mean_dt",
+    "duration",
+    "min_lat",
+    "max_lat",
+    "min_lon",
+    "max_lon",
+    "distance",
+]
+INT_COLUMNS = ["length"]
+STR_COLUMNS = ["id", "file_path"]
+
+
+class MetadataIndex:
+    """
+    Metadata columns of a set of trajectories.
+
+    The class of each trajectory is stored as a code (``class_code``) into
+    ``class_names``.
+
+    Parameters
+    ----------
+    columns : Dict[str, np.ndarray]
+        The metadata columns.
+    class_names : np.ndarray
+        The name of each class code.
+    """
+
+    def __init__(self, columns: Dict[str, np.ndarray], class_names: np.ndarray):
+        self.columns = columns
+        self.class_names = class_names
+
+    def __len__(self) -> int:
+        return len(self.columns["class_code"])
+
+    def __getitem__(self, key: Union[str, np.ndarray, slice]):
+        if isinstance(key, str):
+            return self.columns[key]
+        return MetadataIndex(
+            {name: column[key] for name, column in self.columns.items()},
+            self.class_names,
+        )
+
+    @property
+    def classes(self) -> np.ndarray:
+        """Class name of each trajectory."""
+        return self.class_names[self.columns["class_code"]]
+
+    def class_codes(self, names) -> np.ndarray:
+        """
+        Codes of the given class names (-1 for unknown classes).
+
+        Parameters
+        ----------
+        names : Iterable[str]
+            Class names.
+
+        Returns
+        -------
+        np.ndarray
+            The code of each class name.
+        """
+        lookup = {name: code for code, name in enumerate(self.class_names)}
+        return np.array([lookup.get(name, -1) for name in names], dtype=np.int64)
+
+    def remap_classes(self, class_map: Dict[str, str]) -> "MetadataIndex":
+        """
+        Joins classes using a code lookup table.
+
+        Parameters
+        ----------
+        class_map : Dict[str, str]
+            New name of some classes.
+
+        Returns
+        -------
+        MetadataIndex
+            The index with the classes joined.
+        """
+        names = [class_map.get(name, name) for name in self.class_names]
+        new_names = np.array(sorted(set(names)))
+        lookup = np.searchsorted(new_names, names)
+        columns = dict(self.columns)
+        columns["class_code"] = lookup[self.columns["class_code"]]
+        return MetadataIndex(columns, new_names)
+
+    def to_metadata(self) -> List[dict]:
+        """
+        Metadata of each trajectory (as returned by
+        ``data_handler.load_trajs_metadata``).
+
+        Returns
+        -------
+        List[dict]
+            The metadata of each trajectory.
+        """
+        names = [name for name in self.columns if name != "class_code"]
+        columns = [self.columns[name].tolist() for name in names]
+        classes = self.classes.tolist()
+        metadata = []
+        for i, values in enumerate(zip(*columns)):
+            traj_md = dict(zip(names, values))
+            traj_md["class"] = classes[i]
+            metadata.append(traj_md)
+        return metadata
+
+
+def build_index(metadata: List[dict]) -> MetadataIndex:
+    """
+    Builds the columnar index of some metadata.
+
+    Missing values are stored as NaN (-1 for the lengths).
+
+    Parameters
+    ----------
+    metadata : List[dict]
+        The metadata of each trajectory.
+
+    Returns
+    -------
+    MetadataIndex
+        The columnar index.
+    """
+    class_names, class_code = np.unique(
+        np.array([traj_md["class"] for traj_md in metadata], dtype=str),
+        return_inverse=True,
+    )
+    columns: Dict[str, np.ndarray] = {"class_code": class_code.astype(np.int64)}
+    for name in STR_COLUMNS:
+        columns[name] = np.array(
+            [traj_md.get(name, "") for traj_md in metadata], dtype=str
+        )
+    for name in FLOAT_COLUMNS:
+        columns[name] = np.array(
+            [traj_md.get(name, np.nan) for traj_md in metadata], dtype=np.float64
+        )
+    for name in INT_COLUMNS:
+        columns[name] = np.array(
+            [traj_md.get(name, -1) for traj_md in metadata], dtype=np.int64
+        )
+    return MetadataIndex(columns, class_names)
+
+
+def save_index(metadata: List[dict], index_file: Path = DEFAULT_INDEX_FILE) -> None:
+    """
+    Saves the columnar index of some metadata.
+
+    Parameters
+    ----------
+    metadata : List[dict]
+        The metadata of each trajectory.
+    index_file : Path
+        Path to the index file.
+    """
+    index = build_index(metadata)
+    Path(index_file).parent.mkdir(parents=True, exist_ok=True)
+    np.savez(index_file, class_names=index.class_names, **index.columns)
+
+
+def load_index(index_file: Path = DEFAULT_INDEX_FILE) -> MetadataIndex:
+    """
+    Loads a columnar index.
+
+    Parameters
+    ----------
+    index_file : Path
+        Path to the index file.
+
+    Returns
+    -------
+    MetadataIndex
+        The columnar index.
+    """
+    with np.load(index_file) as npz:
+        columns = {name: npz[name] for name in npz.files if name != "class_names"}
+        class_names = npz["class_names"]
+    return MetadataIndex(columns, class_names)
+
+
+def convert_metadata_file(
+    metadata_file: Path = Path("trajectories/metadata.json"),
+    index_file: Optional[Path] = None,
+) -> Path:
+    """
+    Builds the index of an existing metadata file.
+
+    Parameters
+    ----------
+    metadata_file : Path
+        Path to the metadata file created by ``data_parser``.
+    index_file : Optional[Path]
+        Path of the index file. By default ``metadata_index.npz`` next to
+        the metadata file.
+
+    Returns
+    -------
+    Path
+        The path of the index file.
+    """
+    metadata_file = Path(metadata_file)
+    if index_file is None:
+        index_file = metadata_file.parent / DEFAULT_INDEX_FILE.name
+    with open(metadata_file, "r", encoding="utf-8") as md_file:
+        metadata: List[dict] = json.load(md_file)
+    logging.info("Indexing %d trajectories into '%s'", len(metadata), index_file)
+    save_index(metadata, index_file)
+    return Path(index_file)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s [%(levelname)s] %(message)s",
+        datefmt="%H:%M:%S",
+    )
+    convert_metadata_file()
@@ -0,0 +1,319 @@
+"""
+Windowed sequence dataset for training the LSTM models.
+
+Instead of keeping only the last N points of every trajectory (``clamp_data``
+in ``lstm.ipynb``), the dataset yields fixed-length windows over the whole
+trajectories, either strided or randomly sampled each epoch. Trajectories are
+read lazily (from the trajectory store or the trajectory files) when a batch
+is built, windows are bucketed by length to reduce padding, and batches are
+prefetched on a background thread, so memory is bounded by the batch size
+and not by the corpus size.
+"""
+import queue
+import threading
+from functools import lru_cache
+from typing import Callable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from data_handler import iter_trajs_data
+from feature_vec import clamp_data
+from traj_store import TrajStore
+
+Batch = Tuple[np.ndarray, np.ndarray]
+"""Input windows (batch, time, 3) and their labels."""
+
+
+class WindowDataset:
+    """
+    Fixed-length windows over a set of trajectories.
+
+    Parameters
+    ----------
+    lengths : Sequence[int]
+        Number of points of each trajectory.
+    labels : Sequence[int]
+        Label of each trajectory.
+    get_traj : Callable[[int], np.ndarray]
+        Loads a trajectory by its position.
+    window : int
+        Number of points of each window. Shorter trajectories give a single
+        (shorter) window.
+    stride : Optional[int]
+        Distance between the starts of consecutive windows. By default the
+        windows do not overlap. When the windows do not reach the end of a
+        trajectory, one more window aligned to its end is added. Ignored if
+        ``samples_per_traj`` is given.
+    samples_per_traj : Optional[int]
+        If given, this number of windows is randomly sampled from each
+        trajectory every epoch instead of using strided windows.
+    batch_size : int
+        Number of windows of each batch.
+    n_buckets : int
+        Number of length buckets (windows of similar length are batched
+        together).
+    shuffle : bool
+        Whether to shuffle the windows and the batches every epoch.
+    seed : int
+        Random seed.
+    prefetch : int
+        Number of batches prepared in advance by the background thread.
+    """
+
+    def __init__(
+        self,
+        lengths: Sequence[int],
+        labels: Sequence[int],
+        get_traj: Callable[[int], np.ndarray],
+        window: int = 100,
+        stride: Optional[int] = None,
+        samples_per_traj: Optional[int] = None,
+        batch_size: int = 64,
+        n_buckets: int = 8,
+        shuffle: bool = True,
+        seed: int = 0,
+        prefetch: int = 2,
+    ):
+        self.lengths = np.asarray(lengths, dtype=np.int64)
+        self.labels = np.asarray(labels)
+        if len(self.lengths) != len(self.labels):
+            raise ValueError("There must be a label for each trajectory")
+        self.get_traj = get_traj
+        self.window = window
+        self.stride = stride or window
+        self.samples_per_traj = samples_per_traj
+        self.batch_size = batch_size
+        self.n_buckets = n_buckets
+        self.shuffle = shuffle
+        self.prefetch = prefetch
+        self._rng = np.random.default_rng(seed)
+
+    @classmethod
+    def from_store(
+        cls,
+        store: TrajStore,
+        labels: Sequence[int],
+        indices: Optional[Sequence[int]] = None,
+        **kwargs,
+    ) -> "WindowDataset":
+        """
+        Dataset over (some of) the trajectories of a trajectory store.
+
+        Parameters
+        ----------
+        store : TrajStore
+            The trajectory store.
+        labels : Sequence[int]
+            Label of each used trajectory.
+        indices : Optional[Sequence[int]]
+            Store positions of the used trajectories (all by default).
+        **kwargs
+            Other parameters of ``WindowDataset``.
+
+        Returns
+        -------
+        WindowDataset
+            The dataset.
+        """
+        if indices is None:
+            indices = range(len(store))
+        indices = np.asarray(indices, dtype=np.int64)
+        lengths = np.diff(store.offsets)[indices]
+        return cls(lengths, labels, lambda i: store[indices[i]], **kwargs)
+
+    @classmethod
+    def from_metadata(
+        cls,
+        metadata: List[dict],
+        labels: Sequence[int],
+        cache_size: int = 256,
+        **kwargs,
+    ) -> "WindowDataset":
+        """
+        Dataset over the trajectories of some metadata (see
+        ``data_handler.get_selected_metadata``).
+
+        Trajectories without loaded data are read from their files when
+        needed (the last ``cache_size`` ones are kept).
+
+        Parameters
+        ----------
+        metadata : List[dict]
+            The metadata of each trajectory (with its ``length``).
+        labels : Sequence[int]
+            Label of each trajectory.
+        cache_size : int
+            Number of loaded trajectories kept in memory.
+        **kwargs
+            Other parameters of ``WindowDataset``.
+
+        Returns
+        -------
+        WindowDataset
+            The dataset.
+        """
+
+        @lru_cache(maxsize=cache_size)
+        def get_traj(i: int) -> np.ndarray:
+            return next(iter_trajs_data([metadata[i]]))
+
+        lengths = [traj_md["length"] for traj_md in metadata]
+        return cls(lengths, labels, get_traj, **kwargs)
+
+    def windows(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Windows of an epoch.
+
+        Returns
+        -------
+        Tuple[np.ndarray, np.ndarray, np.ndarray]
+            The trajectory, the start and the size of each window.
+        """
+        sizes = np.minimum(self.lengths, self.window)
+        n_starts = self.lengths - sizes + 1
+        if self.samples_per_traj is not None:
+            traj_idx = np.repeat(np.arange(len(self.lengths)), self.samples_per_traj)
+            starts = (self._rng.random(len(traj_idx)) * n_starts[traj_idx]).astype(
+                np.int64
+            )
+        else:
+            n_windows = self._n_windows(sizes)
+            traj_idx = np.repeat(np.arange(len(self.lengths)), n_windows)
+            first = np.repeat(np.cumsum(n_windows) - n_windows, n_windows)
+            # The last window of each trajectory ends at its last point
+            starts = np.minimum(
+                (np.arange(len(traj_idx)) - first) * self.stride,
+                n_starts[traj_idx] - 1,
+            )
+        return traj_idx, starts, sizes[traj_idx]
+
+    def batches(self) -> List[np.ndarray]:
+        """
+        Batches of an epoch (bucketed by window size).
+
+        Returns
+        -------
+        List[np.ndarray]
+            The trajectory, start and size (columns) of the windows of each
+            batch.
+        """
+        traj_idx, starts, sizes = self.windows()
+        windows = np.column_stack([traj_idx, starts, sizes])
+        if self.shuffle:
+            windows = windows[self._rng.permutation(len(windows))]
+        buckets = self._buckets(windows[:, 2])
+        # Stable sort by bucket so the (shuffled) windows of each bucket stay
+        # together
+        windows = windows[np.argsort(buckets, kind="stable")]
+        bounds = np.cumsum(np.bincount(buckets, minlength=1))
+        batches = [
+            windows[start : min(start + self.batch_size, end)]
+            for begin, end in zip(np.concatenate([[0], bounds[:-1]]), bounds)
+            for start in range(begin, end, self.batch_size)
+        ]
+        if self.shuffle:
+            batches = [batches[i] for i in self._rng.permutation(len(batches))]
+        return batches
+
+    def _n_windows(self, sizes: np.ndarray) -> np.ndarray:
+        """Number of strided windows of each trajectory (with the window
+        aligned to its end)."""
+        span = self.lengths - sizes
+        return -(-span // self.stride) + 1
+
+    def _window_sizes(self) -> np.ndarray:
+        sizes = np.minimum(self.lengths, self.window)
+        if self.samples_per_traj is not None:
+            return np.repeat(sizes, self.samples_per_traj)
+        return np.repeat(sizes, self._n_windows(sizes))
+
+    def _buckets(self, sizes: np.ndarray) -> np.ndarray:
+        """Length bucket of each window (windows of the same size always
+        share their bucket)."""
+        if not len(sizes):
+            return np.zeros(0, dtype=np.int64)
+        probs = np.linspace(0, 1, self.n_buckets + 1)[1:-1]
+        edges = np.unique(np.quantile(self._window_sizes(), probs))
+        return np.searchsorted(edges, sizes, side="right")
+
+    def __len__(self) -> int:
+        sizes = self._window_sizes()
+        counts = np.bincount(self._buckets(sizes), minlength=1)
+        return int(np.sum(-(-counts // self.batch_size)))
+
+    def load_batch(self, batch: np.ndarray) -> Batch:
+        """
+        Reads the windows of a batch.
+
+        Parameters
+        ----------
+        batch : np.ndarray
+            The trajectory, start and size of each window.
+
+        Returns
+        -------
+        Batch
+            The windows (zero padded at the beginning to the longest one)
+            and their labels.
+        """
+        windows = [
+            self.get_traj(traj)[start : start + size] for traj, start, size in batch
+        ]
+        return clamp_data(windows, int(batch[:, 2].max())), self.labels[batch[:, 0]]
+
+    def __iter__(self) -> Iterator[Batch]:
+        batches = self.batches()
+        if self.prefetch <= 0:
+            for batch in batches:
+                yield self.load_batch(batch)
+            return
+
+        ready: queue.Queue = queue.Queue(maxsize=self.prefetch)
+        stop = threading.Event()
+
+        def put(item) -> bool:
+            """Queues an item unless the consumer stopped (returns whether
+            it was queued)."""
+            while not stop.is_set():
+                try:
+                    ready.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def produce():
+            try:
+                for batch in batches:
+                    if not put(self.load_batch(batch)):
+                        return
+                put(None)
+            except Exception as exc:  # pylint: disable=W0703
+                put(exc)
+
+        producer = threading.Thread(target=produce, daemon=True)
+        producer.start()
+        try:
+            while True:
+                item = ready.get()
+                if item is None:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            stop.set()
+            producer.join()
+
+    def repeat(self) -> Iterator[Batch]:
+        """
+        Endless batches over several epochs (e.g. for ``keras.Model.fit``
+        with ``steps_per_epoch=len(dataset)``).
+
+        Yields
+        ------
+        Batch
+            The batches.
+        """
+        while True:
+            yield from self
@@ -0,0 +1,355 @@
+"""
+Synthetic GeoLife-format dataset and end-to-end ingestion scale harness.
+
+The generator writes the same tree as the GeoLife dataset: a folder per user
+with a ``Trajectory`` folder holding a PLT file per day (with the 6-line
+header) and a ``labels.txt`` file whose labels cover segments of each day
+with the GeoLife transportation modes. Each labeled segment is a random walk
+with the typical speed of its mode.
+
+The harness generates a dataset in a working folder and runs the ingestion
+path (``data_parser.main`` -> ``data_handler.get_selected_data`` ->
+``feature_vec.get_feat_vectors``), reporting the wall time, the peak memory
+and the points per second of each stage. The stages are timed without
+memory tracing; the peak traced memory needs one more (traced) run of each
+stage (``--trace-memory``).
+
+Usage::
+
+    python synthetic_dataset.py --users 20 --points-per-day 5000 --work-dir bench
+"""
+import argparse
+import json
+import os
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Callable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+import data_parser as dp
+from data_handler import get_selected_data
+from feature_bench import peak_memory
+from feature_vec import get_feat_vectors
+from instrumentation import max_rss
+
+PLT_HEADER = (
+    "Geolife trajectory\nWGS 84\nAltitude is in Feet\nReserved 3\n"
+    "0,2,255,My Track,0,0,2,8421376\n0\n"
+)
+DAYS_EPOCH = datetime(1899, 12, 30)
+
+MODE_SPEEDS = {
+    "walk": 1.4,
+    "bike": 4.0,
+    "bus": 8.0,
+    "car": 12.0,
+    "taxi": 12.0,
+    "train": 20.0,
+    "subway": 15.0,
+}
+"""Typical speed (m/s) of each transportation mode"""
+
+METERS_PER_DEGREE = 111_000
+
+
+def _day_points(
+    rng: np.random.Generator,
+    n_points: int,
+    interval: float,
+    modes: List[str],
+) -> Tuple[np.ndarray, List[Tuple[int, int, str]]]:
+    """Points (lat, lon, seconds since start) of a day and its segments."""
+    steps = np.maximum(np.rint(rng.normal(interval, interval / 4, n_points)), 1)
+    steps[0] = 0
+    seconds = np.cumsum(steps)
+
+    n_segments = min(len(modes), max(n_points // 50, 1))
+    bounds = np.sort(rng.choice(np.arange(1, n_points), n_segments - 1, replace=False))
+    bounds = np.concatenate([[0], bounds, [n_points]])
+    speeds = np.empty(n_points)
+    segments = []
+    for seg_start, seg_end in zip(bounds[:-1], bounds[1:]):
+        mode = modes[rng.integers(len(modes))]
+        speeds[seg_start:seg_end] = MODE_SPEEDS[mode]
+        segments.append((int(seg_start), int(seg_end), mode))
+
+    heading = np.cumsum(rng.normal(0, 0.2, n_points))
+    step_dist = speeds * np.concatenate([[0], np.diff(seconds)]) / METERS_PER_DEGREE
+    lat = 39.9 + rng.normal(0, 0.05) + np.cumsum(step_dist * np.cos(heading))
+    lon = 116.3 + rng.normal(0, 0.05) + np.cumsum(step_dist * np.sin(heading))
+    return np.column_stack([lat, lon, seconds]), segments
+
+
+def generate_user(
+    usr_folder: Path,
+    n_days: int,
+    points_per_day: int,
+    interval: float,
+    rng: np.random.Generator,
+    modes: Optional[List[str]] = None,
+) -> int:
+    """
+    Writes the PLT files and the labels of a synthetic user.
+
+    Parameters
+    ----------
+    usr_folder : Path
+        Folder of the user.
+    n_days : int
+        Number of days (PLT files).
+    points_per_day : int
+        Number of points of each day.
+    interval : float
+        Mean sampling interval (in seconds).
+    rng : np.random.Generator
+        Random generator.
+    modes : Optional[List[str]]
+        Transportation modes used (all by default).
+
+    Returns
+    -------
+    int
+        Number of generated points.
+    """
+    modes = modes or list(MODE_SPEEDS)
+    traj_folder = usr_folder / "Trajectory"
+    traj_folder.mkdir(parents=True, exist_ok=True)
+    first_day = datetime(2008, 1, 1) + timedelta(days=int(rng.integers(0, 1000)))
+    label_lines = ["Start Time\tEnd Time\tTransportation Mode\n"]
+    for day in range(n_days):
+        day_start = first_day + timedelta(days=day, hours=int(rng.integers(5, 12)))
+        points, segments = _day_points(rng, points_per_day, interval, modes)
+        base_days = (day_start - DAYS_EPOCH) / timedelta(days=1)
+        frac_days = base_days + points[:, 2] / 86400
+        times = np.datetime64(day_start, "s") + points[:, 2].astype("timedelta64[s]")
+        dates = np.datetime_as_string(times, unit="D")
+        clock = [str(t)[11:19] for t in times]
+        altitude = rng.integers(0, 500, points_per_day)
+        lines = [
+            f"{lat:.6f},{lon:.6f},0,{alt},{days:.10f},{date},{hms}\n"
+            for (lat, lon, _), alt, days, date, hms in zip(
+                points.tolist(), altitude.tolist(), frac_days, dates, clock
+            )
+        ]
+        plt = traj_folder / f"{day_start:%Y%m%d%H%M%S}.plt"
+        plt.write_text(PLT_HEADER + "".join(lines), encoding="utf-8")
+
+        for seg_start, seg_end, mode in segments:
+            lbl_start = day_start + timedelta(seconds=float(points[seg_start, 2]))
+            lbl_end = day_start + timedelta(seconds=float(points[seg_end - 1, 2]))
+            label_lines.append(
+                f"{lbl_start:%Y/%m/%d %H:%M:%S}\t{lbl_end:%Y/%m/%d %H:%M:%S}\t{mode}\n"
+            )
+    (usr_folder / "labels.txt").write_text("".join(label_lines), encoding="utf-8")
+    return n_days * points_per_day
+
+
+def generate_dataset(
+    dataset_folder: Path,
+    n_users: int = 10,
+    points_per_day: int = 2000,
+    interval: float = 2.0,
+    n_days: int = 2,
+    seed: int = 0,
+) -> dict:
+    """
+    Writes a synthetic GeoLife-format dataset.
+
+    Parameters
+    ----------
+    dataset_folder : Path
+        Folder of the dataset (it is created if needed).
+    n_users : int
+        Number of users.
+    points_per_day : int
+        Number of points of each PLT file.
+    interval : float
+        Mean sampling interval (in seconds).
+    n_days : int
+        Number of days (PLT files) of each user.
+    seed : int
+        Random seed.
+
+    Returns
+    -------
+    dict
+        Number of users, PLT files and points of the dataset.
+    """
+    rng = np.random.default_rng(seed)
+    dataset_folder = Path(dataset_folder)
+    n_points = 0
+    for usr in range(n_users):
+        n_points += generate_user(
+            dataset_folder / f"{usr:03d}", n_days, points_per_day, interval, rng
+        )
+    return {"users": n_users, "plt_files": n_users * n_days, "points": n_points}
+
+
+@contextmanager
+def _working_dir(folder: Path) -> Iterator[None]:
+    prev = Path.cwd()
+    os.chdir(folder)
+    try:
+        yield
+    finally:
+        os.chdir(prev)
+
+
+def _run_stage(name: str, func: Callable[[], int], trace_memory: bool) -> dict:
+    # tracemalloc slows the allocations down, so the stage is timed untraced
+    start = time.perf_counter()
+    n_points = func()
+    wall_time = time.perf_counter() - start
+    return {
+        "stage": name,
+        "wall_time": wall_time,
+        "peak_bytes": peak_memory(func) if trace_memory else None,
+        "max_rss_bytes": max_rss(),
+        "points": n_points,
+        "points_per_second": n_points / wall_time if wall_time > 0 else 0.0,
+    }
+
+
+def run_harness(
+    work_dir: Path,
+    n_users: int = 10,
+    points_per_day: int = 2000,
+    interval: float = 2.0,
+    n_days: int = 2,
+    workers: Optional[int] = 1,
+    seed: int = 0,
+    trace_memory: bool = False,
+) -> dict:
+    """
+    Generates a synthetic dataset and measures the ingestion path over it.
+
+    The outputs (``trajectories`` folder) are written in ``work_dir``. The
+    wall time is measured without memory tracing. The peak resident memory
+    of the process so far is reported after each stage (``max_rss_bytes``);
+    with ``trace_memory`` each stage is run once more under ``tracemalloc``
+    for its own peak (``peak_bytes``, worker processes of the parsing stage
+    are not traced).
+
+    Parameters
+    ----------
+    work_dir : Path
+        Working folder.
+    n_users : int
+        Number of users.
+    points_per_day : int
+        Number of points of each PLT file.
+    interval : float
+        Mean sampling interval (in seconds).
+    n_days : int
+        Number of days of each user.
+    workers : Optional[int]
+        Worker processes of the parsing stage (see ``data_parser.main``).
+    seed : int
+        Random seed.
+    trace_memory : bool
+        Whether to measure the peak traced memory of each stage (each stage
+        runs twice).
+
+    Returns
+    -------
+    dict
+        The dataset summary (``dataset``) and the wall time, peak memories,
+        points and points per second of each stage (``stages``).
+    """
+    work_dir = Path(work_dir).resolve()
+    work_dir.mkdir(parents=True, exist_ok=True)
+    dataset_folder = work_dir / "geolife_dataset"
+    summary = generate_dataset(
+        dataset_folder, n_users, points_per_day, interval, n_days, seed
+    )
+
+    selected: List[dict] = []
+
+    def parse() -> int:
+        dp.main(workers, incremental=False, dataset_folder=dataset_folder)
+        return summary["points"]
+
+    def select() -> int:
+        selected[:] = get_selected_data()
+        return sum(traj_md["length"] for traj_md in selected)
+
+    def features() -> int:
+        get_feat_vectors(selected)
+        return sum(traj_md["length"] for traj_md in selected)
+
+    with _working_dir(work_dir):
+        stages = [
+            _run_stage("parse", parse, trace_memory),
+            _run_stage("select", select, trace_memory),
+            _run_stage("features", features, trace_memory),
+        ]
+    summary["selected_trajs"] = len(selected)
+    return {"dataset": summary, "stages": stages}
+
+
+def main():
+    """Runs the scale harness."""
+    parser = argparse.ArgumentParser(description="GeoLife ingestion scale harness")
+    parser.add_argument("--work-dir", type=Path, default=Path("synthetic_run"))
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--points-per-day", type=int, default=2000)
+    parser.add_argument("--interval", type=float, default=2.0)
+    parser.add_argument("--days", type=int, default=2)
+    parser.add_argument("-j", "--workers", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--trace-memory",
+        action="store_true",
+        help="run each stage once more to trace its peak memory",
+    )
+    parser.add_argument("--out", type=Path, default=None, help="json report file")
+    parser.add_argument(
+        "--generate-only",
+        action="store_true",
+        help="only write the dataset (in WORK_DIR/geolife_dataset)",
+    )
+    args = parser.parse_args()
+
+    if args.generate_only:
+        summary = generate_dataset(
+            args.work_dir / "geolife_dataset",
+            args.users,
+            args.points_per_day,
+            args.interval,
+            args.days,
+            args.seed,
+        )
+        print(json.dumps(summary))
+        return
+
+    report = run_harness(
+        args.work_dir,
+        args.users,
+        args.points_per_day,
+        args.interval,
+        args.days,
+        args.workers or None,
+        args.seed,
+        args.trace_memory,
+    )
+    if args.out is not None:
+        with open(args.out, "w", encoding="utf-8") as r_file:
+            json.dump(report, r_file, indent=2)
+    print(json.dumps(report["dataset"]))
+    for stage in report["stages"]:
+        memory = ""
+        if stage["peak_bytes"] is not None:
+            memory += f"{stage['peak_bytes'] / 2**20:9.1f} MiB traced "
+        if stage["max_rss_bytes"] is not None:
+            memory += f"{stage['max_rss_bytes'] / 2**20:9.1f} MiB rss "
+        print(
+            f"{stage['stage']:>8}: {stage['wall_time']:8.2f} s {memory}"
+            f"{stage['points_per_second']:12.0f} points/s"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+import numpy as np
+import pytest
+
+import cluster_eval as ce
+
+metrics = pytest.importorskip("sklearn.metrics")
+
+# pylint: disable=W0621
+
+
+@pytest.fixture
+def clustering():
+    rng = np.random.default_rng(0)
+    x = np.concatenate([rng.normal(loc, 1.0, size=(60, 4)) for loc in (0, 3, 6)])
+    labels = np.repeat([0, 1, 2], 60)
+    # Noise and a singleton cluster
+    labels[::17] = -1
+    labels[5] = 7
+    classes = rng.integers(0, 5, size=len(x))
+    return x, labels, classes
+
+
+def test_contingency_table(clustering):
+    _, labels, classes = clustering
+    table, cluster_ids, class_ids = ce.contingency_table(labels, classes)
+    assert cluster_ids.tolist() == [-1, 0, 1, 2, 7]
+    assert class_ids.tolist() == [0, 1, 2, 3, 4]
+    for i, cluster in enumerate(cluster_ids):
+        for j, cls in enumerate(class_ids):
+            assert table[i, j] == np.sum((labels == cluster) & (classes == cls))
+    table, cluster_ids, _ = ce.contingency_table(labels, classes, drop_noise=True)
+    assert -1 not in cluster_ids
+    assert table.sum() == np.sum(labels != -1)
+
+
+def test_count_classes(clustering):
+    _, labels, classes = clustering
+    counts = ce.count_classes(labels, classes % 3, n_classes=4)
+    assert set(counts) == {0, 1, 2, 7}
+    assert counts[7] == [0] * (classes[5] % 3) + [1] + [0] * (3 - classes[5] % 3)
+    assert sum(map(sum, counts.values())) == np.sum(labels != -1)
+
+
+def test_homogeneity_completeness(clustering):
+    _, labels, classes = clustering
+    homogeneity, completeness = ce.homogeneity_completeness(labels, classes)
+    assert homogeneity == pytest.approx(metrics.homogeneity_score(classes, labels))
+    assert completeness == pytest.approx(metrics.completeness_score(classes, labels))
+    valid = labels != -1
+    assert ce.homogeneity_completeness(labels, classes, drop_noise=True) == (
+        pytest.approx(metrics.homogeneity_completeness_v_measure(
+            classes[valid], labels[valid]
+        )[:2])
+    )
+
+
+@pytest.mark.parametrize("block_size", [None, 1, 7])
+def test_silhouette(clustering, block_size):
+    x, labels, _ = clustering
+    sil = ce.silhouette_samples(x, labels, block_size=block_size)
+    assert sil == pytest.approx(metrics.silhouette_samples(x, labels), abs=1e-9)
+    assert ce.silhouette_score(x, labels, block_size=block_size) == pytest.approx(
+        metrics.silhouette_score(x, labels)
+    )
+
+
+def test_silhouette_noise(clustering):
+    x, labels, _ = clustering
+    valid = labels != -1
+    sil = ce.silhouette_samples(x, labels, drop_noise=True, block_size=16)
+    assert np.isnan(sil[~valid]).all()
+    assert sil[valid] == pytest.approx(
+        metrics.silhouette_samples(x[valid], labels[valid]), abs=1e-9
+    )
+
+
+def test_silhouette_bad_labels():
+    with pytest.raises(ValueError):
+        ce.silhouette_samples(np.ones((4, 2)), [0, 0, 0, 0])
+    with pytest.raises(ValueError):
+        ce.silhouette_samples(np.ones((4, 2)), [-1, -1, -1, 0], drop_noise=True)
+
+
+def test_silhouette_estimate(clustering):
+    x, labels, _ = clustering
+    exact = ce.silhouette_score(x, labels)
+    full = ce.silhouette_estimate(x, labels, sample_size=len(x))
+    assert full.n_samples == len(x)
+    assert full.mean == pytest.approx(exact)
+    assert full.low == pytest.approx(full.high)
+
+    estimate = ce.silhouette_estimate(x, labels, sample_size=60, block_size=10)
+    assert estimate.n_samples < len(x)
+    assert estimate.low < estimate.mean < estimate.high
+    assert estimate.low - 0.05 < exact < estimate.high + 0.05
@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+
+import data_handler as dh
+import feature_batch as fb
+import feature_vec as fv
+from compact_traj import CompactTraj, load_compact, save_compact
+
+# pylint: disable=W0621
+
+
+@pytest.fixture
+def traj():
+    rng = np.random.default_rng(0)
+    length = 2000
+    # Random walk in Beijing with 1-10 m steps every 1-5 s
+    steps = rng.normal(scale=5e-5, size=(length, 2))
+    points = np.array([39.9, 116.3]) + np.cumsum(steps, axis=0)
+    times = 30 + np.cumsum(rng.integers(1, 6, size=length)).astype(np.float64)
+    return np.column_stack([points, times])
+
+
+def test_roundtrip(traj, tmp_path):
+    compact = CompactTraj.from_array(traj)
+    assert compact.deltas.dtype == np.float32
+    assert compact.seconds.dtype == np.int32
+    assert compact.nbytes <= traj.nbytes / 2 + 24
+    assert len(compact) == len(traj) and compact.shape == traj.shape
+
+    expanded = np.asarray(compact)
+    assert np.array_equal(expanded[:, 2], traj[:, 2])
+    assert np.abs(expanded[:, :2] - traj[:, :2]).max() < 1e-7
+    assert np.array_equal(compact[-3:], expanded[-3:])
+
+    save_compact(tmp_path / "traj.npz", compact)
+    loaded = load_compact(tmp_path / "traj.npz")
+    assert np.array_equal(loaded.to_array(), expanded)
+
+
+@pytest.fixture
+def trip():
+    rng = np.random.default_rng(1)
+    # A 0.3 degrees drive followed by a slow walk, every second
+    drive = np.cumsum(1e-4 + rng.normal(scale=2e-5, size=(1500, 2)), axis=0)
+    walk = drive[-1] + np.cumsum(rng.normal(scale=1e-5, size=(1500, 2)), axis=0)
+    points = np.array([39.9, 116.3]) + np.concatenate([drive, walk])
+    return np.column_stack([points, np.arange(len(points), dtype=np.float64)])
+
+
+@pytest.mark.parametrize("data", ["traj", "trip"])
+def test_features_tolerance(data, request):
+    traj = request.getfixturevalue(data)
+    expected = fv.convert_traj_into_vector(traj, 1e-5)
+    compact = CompactTraj.from_array(traj)
+    assert fv.convert_traj_into_vector(compact, 1e-5) == pytest.approx(
+        expected, rel=1e-5, abs=1e-12
+    )
+    batch = fb.get_batch_feat_vectors([compact, traj], 1e-5)
+    assert batch[0] == pytest.approx(expected, rel=1e-5, abs=1e-12)
+
+
+def test_load_compact_data(traj, tmp_path):
+    np.savetxt(tmp_path / "0_walk.txt", traj)
+    save_compact(tmp_path / "1_walk.npz", CompactTraj.from_array(traj))
+    metadata = [
+        {"id": "000_0", "file_path": str(tmp_path / "0_walk.txt")},
+        {"id": "000_1", "file_path": str(tmp_path / "1_walk.npz")},
+    ]
+    loaded = dh.load_trajs_data([dict(md) for md in metadata], compact=True)
+    assert all(isinstance(md["traj_data"], CompactTraj) for md in loaded)
+    text, compact = dh.iter_trajs_data(metadata)
+    assert isinstance(text, np.ndarray) and isinstance(compact, CompactTraj)
+    assert np.array_equal(compact.to_array(), loaded[0]["traj_data"].to_array())
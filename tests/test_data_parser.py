@@ -0,0 +1,316 @@
+import json
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+import data_parser as dp
+from instrumentation import Instrument, using
+from metadata_index import load_index
+
+# pylint: disable=W0621
+
+PLT_HEADER = (
+    "Geolife trajectory\nWGS 84\nAltitude is in Feet\nReserved 3\n"
+    "0,2,255,My Track,0,0,2,8421376\n0\n"
+)
+DAYS_EPOCH = datetime(1899, 12, 30)
+
+
+def write_user(usr_folder: Path, start: datetime, n_points: int, labels: list):
+    traj_folder = usr_folder / "Trajectory"
+    traj_folder.mkdir(parents=True)
+    for day in range(2):
+        day_start = start + timedelta(days=day)
+        lines = []
+        for i in range(n_points):
+            reg_dt = day_start + timedelta(seconds=2 * i)
+            lines.append(
+                f"{39.9 + i * 1e-4:.6f},{116.3 + i * 2e-4:.6f},0,492,"
+                f"{(reg_dt - DAYS_EPOCH) / timedelta(days=1):.10f},"
+                f"{reg_dt:%Y-%m-%d},{reg_dt:%H:%M:%S}\n"
+            )
+        plt = traj_folder / f"{day_start:%Y%m%d%H%M%S}.plt"
+        plt.write_text(PLT_HEADER + "".join(lines), encoding="utf-8")
+
+    lines = ["Start Time\tEnd Time\tTransportation Mode\n"]
+    for lbl_start, lbl_end, clsf in labels:
+        lines.append(f"{lbl_start:%Y/%m/%d %H:%M:%S}\t{lbl_end:%Y/%m/%d %H:%M:%S}\t{clsf}\n")
+    (usr_folder / "labels.txt").write_text("".join(lines), encoding="utf-8")
+
+
+@pytest.fixture
+def dataset(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    dataset_folder = tmp_path / "geolife_dataset"
+    for usr in range(4):
+        start = datetime(2008, 4, 2 + usr, 10, 0, 0)
+        labels = [
+            (start + timedelta(seconds=20), start + timedelta(seconds=200), "walk"),
+            (start + timedelta(seconds=300), start + timedelta(seconds=500), "bus"),
+            (start + timedelta(days=1), start + timedelta(days=1, seconds=90), "car"),
+        ]
+        write_user(dataset_folder / f"{usr:03d}", start, 300, labels)
+    # User without labels
+    (dataset_folder / "004" / "Trajectory").mkdir(parents=True)
+    return dataset_folder
+
+
+def read_outputs(folder: Path) -> dict:
+    return {
+        str(path.relative_to(folder)): path.read_bytes()
+        for path in sorted(folder.rglob("*"))
+        if path.is_file()
+    }
+
+
+def test_process_usr_trajs(dataset):
+    usr_metadata = dp.process_usr_trajs(dataset / "000")
+    assert [md["class"] for md in usr_metadata] == ["walk", "bus", "car"]
+    assert [md["length"] for md in usr_metadata] == [91, 101, 46]
+    assert all(md["mean_dt"] == pytest.approx(2.0) for md in usr_metadata)
+    assert [md["duration"] for md in usr_metadata] == [180, 200, 90]
+    assert usr_metadata[0]["min_lat"] < usr_metadata[0]["max_lat"]
+    assert usr_metadata[0]["distance"] > 0
+    assert not dp.process_usr_trajs(dataset / "004")
+
+
+def loop_split_trajs(regs, labels):
+    """Register by register label assignment (reference implementation)."""
+    all_regs = list(zip(regs.lat.tolist(), regs.lon.tolist(), regs.time.tolist()))
+    trajs = []
+    label_idx = 0
+    regs_idx = 0
+    label = labels[label_idx]
+    traj = []
+    while regs_idx < len(all_regs):
+        lat, long, reg_dt = all_regs[regs_idx]
+        if label.start_dt <= reg_dt <= label.end_dt:
+            time = (reg_dt - label.start_dt).seconds
+            if not traj or time != traj[-1][-1]:
+                traj.append([lat, long, time])
+        elif label.start_dt < reg_dt:
+            if len(traj) > 1:
+                trajs.append((label_idx, np.array(traj)))
+                traj = []
+            label_idx += 1
+            if label_idx >= len(labels):
+                break
+            label = labels[label_idx]
+            continue
+        regs_idx += 1
+    return trajs
+
+
+def random_registers(rng, n_regs):
+    start = np.datetime64("2008-04-02T10:00:00", "s")
+    # Repeated times (steps of 0 seconds) are removed from the trajectories
+    steps = rng.choice([0, 1, 2, 5, 60], size=n_regs, p=[0.1, 0.4, 0.3, 0.15, 0.05])
+    times = start + np.cumsum(steps).astype("timedelta64[s]")
+    return dp.Registers(rng.normal(size=n_regs), rng.normal(size=n_regs), times)
+
+
+def random_labels(rng, regs, n_labels, shuffle):
+    first, last = regs.time[0], regs.time[-1]
+    span = int((last - first).astype(np.int64))
+    labels = []
+    for _ in range(n_labels):
+        lbl_start = first + np.timedelta64(int(rng.integers(-10, span)), "s")
+        lbl_end = lbl_start + np.timedelta64(int(rng.integers(-5, span // 4)), "s")
+        labels.append(dp.LabelData(lbl_start.item(), lbl_end.item(), "walk"))
+    if not shuffle:
+        labels.sort(key=lambda label: label.start_dt)
+    return labels
+
+
+def assert_same_trajs(trajs, expected):
+    assert [idx for idx, _ in trajs] == [idx for idx, _ in expected]
+    for (_, traj), (_, exp_traj) in zip(trajs, expected):
+        assert np.array_equal(traj, exp_traj)
+
+
+@pytest.mark.parametrize("shuffle", [False, True])
+def test_split_trajs_matches_loop(shuffle):
+    rng = np.random.default_rng(int(shuffle))
+    for _ in range(50):
+        regs = random_registers(rng, int(rng.integers(1, 300)))
+        labels = random_labels(rng, regs, int(rng.integers(1, 12)), shuffle)
+        assert_same_trajs(dp.split_trajs(regs, labels), loop_split_trajs(regs, labels))
+
+
+def test_split_trajs_overlapping_labels():
+    regs = random_registers(np.random.default_rng(2), 10)
+    regs = dp.Registers(
+        regs.lat, regs.lon, np.datetime64("2008-04-02T10:00:00", "s") + np.arange(10)
+    )
+    start = datetime(2008, 4, 2, 10)
+    labels = [
+        dp.LabelData(start, start + timedelta(seconds=4), "walk"),
+        dp.LabelData(start + timedelta(seconds=2), start + timedelta(seconds=7), "bus"),
+    ]
+    trajs = dp.split_trajs(regs, labels)
+    assert [idx for idx, _ in trajs] == [0, 1]
+    assert trajs[0][1][:, 2].tolist() == [0, 1, 2, 3, 4]
+    # The registers of the overlap belong to the first label only
+    assert trajs[1][1][:, 2].tolist() == [3, 4, 5]
+    assert_same_trajs(trajs, loop_split_trajs(regs, labels))
+
+
+def test_split_trajs_unsorted_registers():
+    regs = random_registers(np.random.default_rng(3), 100)
+    regs = dp.Registers(regs.lat, regs.lon, regs.time[0] + np.arange(100))
+    labels = random_labels(np.random.default_rng(4), regs, 5, False)
+    order = np.random.default_rng(5).permutation(100)
+    shuffled = dp.Registers(regs.lat[order], regs.lon[order], regs.time[order])
+    assert_same_trajs(dp.split_trajs(shuffled, labels), dp.split_trajs(regs, labels))
+
+
+def test_load_registers_matches_parse_register(dataset):
+    regs = dp.load_registers(dataset / "001")
+    expected = []
+    for plt in sorted((dataset / "001" / "Trajectory").iterdir()):
+        with open(plt, "r", encoding="utf-8") as reg:
+            expected += [dp.parse_register(line) for line in reg.readlines()[6:]]
+    assert list(zip(regs.lat.tolist(), regs.lon.tolist(), regs.time.tolist())) == expected
+
+
+def test_load_plt_empty(tmp_path):
+    plt = tmp_path / "empty.plt"
+    plt.write_text(PLT_HEADER, encoding="utf-8")
+    regs = dp.load_plt(plt)
+    assert len(regs.lat) == len(regs.lon) == len(regs.time) == 0
+
+
+def test_parallel_main_matches_serial(dataset):
+    dp.main(workers=1)
+    serial = read_outputs(Path("trajectories"))
+    assert "metadata.json" in serial
+    assert len(load_index(Path("trajectories/metadata_index.npz"))) == 12
+    for path in Path("trajectories").rglob("*.txt"):
+        path.unlink()
+    (Path("trajectories") / "metadata.json").unlink()
+
+    dp.main(workers=2, incremental=False)
+    assert read_outputs(Path("trajectories")) == serial
+
+
+def test_parallel_main_counters(dataset):
+    with using(Instrument(sinks=[])) as serial:
+        dp.main(workers=1, incremental=False)
+    with using(Instrument(sinks=[])) as parallel:
+        dp.main(workers=2, incremental=False)
+    assert serial.counters["points_read"] == 8 * 300
+    assert parallel.counters == serial.counters
+
+
+@pytest.fixture
+def count_processed(monkeypatch):
+    processed = []
+    process_usr_trajs = dp.process_usr_trajs
+
+    def counted(usr_folder, **options):
+        processed.append(usr_folder.name)
+        return process_usr_trajs(usr_folder, **options)
+
+    monkeypatch.setattr(dp, "process_usr_trajs", counted)
+    return processed
+
+
+def test_incremental_main(dataset, count_processed):
+    dp.main()
+    outputs = read_outputs(Path("trajectories"))
+    dp.main()
+    assert read_outputs(Path("trajectories")) == outputs
+
+    labels_file = dataset / "002" / "labels.txt"
+    labels_file.write_text(labels_file.read_text().splitlines()[0] + "\n")
+    dp.main()
+    assert count_processed == ["000", "001", "002", "003", "004", "002"]
+    assert not list(Path("trajectories/002").iterdir())
+    metadata = json.loads(Path("trajectories/metadata.json").read_text())
+    assert len(metadata) == 9
+
+
+def test_interrupted_main_resumes(dataset, count_processed, monkeypatch):
+    process_usr_trajs = dp.process_usr_trajs
+
+    def crash(usr_folder, **options):
+        if usr_folder.name == "002":
+            raise KeyboardInterrupt
+        return process_usr_trajs(usr_folder, **options)
+
+    monkeypatch.setattr(dp, "process_usr_trajs", crash)
+    with pytest.raises(KeyboardInterrupt):
+        dp.main()
+    assert set(dp.load_manifest(Path("trajectories/manifest.jsonl"))) == {"000", "001"}
+
+    monkeypatch.setattr(dp, "process_usr_trajs", process_usr_trajs)
+    dp.main()
+    assert count_processed == ["000", "001", "002", "003", "004"]
+    outputs = read_outputs(Path("trajectories"))
+    dp.main(incremental=False)
+    assert read_outputs(Path("trajectories")) == outputs
+
+
+def test_manifest_appended(dataset, count_processed, monkeypatch):
+    saved = []
+    save_manifest = dp.save_manifest
+
+    def counted(manifest, manifest_file):
+        saved.append(len(manifest))
+        save_manifest(manifest, manifest_file)
+
+    monkeypatch.setattr(dp, "save_manifest", counted)
+    dp.main()
+    # Written once (empty), the users are appended
+    assert saved == [0]
+    manifest_file = Path("trajectories/manifest.jsonl")
+    assert len(manifest_file.read_text().splitlines()) == 6
+
+    # A line cut by a killed run is skipped
+    with open(manifest_file, "a", encoding="utf-8") as m_file:
+        m_file.write('{"user": "003", "fil')
+    assert set(dp.load_manifest(manifest_file)) == {"000", "001", "002", "003", "004"}
+    dp.main()
+    assert saved == [0, 5]
+    assert count_processed == ["000", "001", "002", "003", "004"]
+
+
+def test_manifest_version(dataset, count_processed, monkeypatch):
+    dp.main()
+    monkeypatch.setattr(dp, "MANIFEST_VERSION", dp.MANIFEST_VERSION + 1)
+    dp.main()
+    # The manifest of the old version is ignored
+    assert count_processed == ["000", "001", "002", "003", "004"] * 2
+
+
+def test_compact_main(dataset, count_processed):
+    dp.main()
+    text_metadata = json.loads(Path("trajectories/metadata.json").read_text())
+    dp.main(compact=True)
+    # The format changed, so every user is processed again
+    assert count_processed == ["000", "001", "002", "003", "004"] * 2
+    metadata = json.loads(Path("trajectories/metadata.json").read_text())
+    assert all(md["file_path"].endswith(".npz") for md in metadata)
+    assert not list(Path("trajectories").rglob("*.txt"))
+    for text_md, compact_md in zip(text_metadata, metadata):
+        assert compact_md.pop("file_path") != text_md.pop("file_path")
+        assert compact_md == text_md
+
+
+def test_resampled_main(dataset, count_processed):
+    dp.main()
+    text_metadata = json.loads(Path("trajectories/metadata.json").read_text())
+    dp.main(resample_interval=1, compress_tol=1e-9)
+    assert count_processed == ["000", "001", "002", "003", "004"] * 2
+    metadata = json.loads(Path("trajectories/metadata.json").read_text())
+    assert [md["id"] for md in metadata] == [md["id"] for md in text_metadata]
+    for text_md, res_md in zip(text_metadata, metadata):
+        # The synthetic trajectories are slower than the feature threashold,
+        # so the compression keeps every (stop rate) point
+        assert res_md["length"] == res_md["duration"] + 1
+        assert res_md["duration"] == text_md["duration"]
+        assert res_md["distance"] == pytest.approx(text_md["distance"])
+    with pytest.raises(ValueError):
+        dp.main(compact=True, resample_interval=1.5)
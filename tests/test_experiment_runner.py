@@ -0,0 +1,99 @@
+import numpy as np
+import pytest
+
+import experiment_runner as er
+
+pytest.importorskip("sklearn")
+
+# pylint: disable=W0621
+
+CONFIGS = [
+    {"name": "knn", "model": "knn", "params": {"n_neighbors": 3}},
+    {
+        "name": "pca_tree",
+        "model": "tree",
+        "params": {"random_state": 0},
+        "steps": [["scaler", {}], ["pca", {"n_components": 2}]],
+    },
+    {
+        "name": "svm",
+        "model": "svm",
+        "params": {"random_state": 0},
+        "steps": [["scaler", {}]],
+    },
+]
+
+
+@pytest.fixture
+def dataset():
+    rng = np.random.default_rng(0)
+    clss = np.repeat([0, 1, 2], 40)
+    feat_vectors = rng.normal(size=(len(clss), 5)) + clss[:, None]
+    return feat_vectors, clss
+
+
+def test_make_splits(dataset):
+    from sklearn.model_selection import train_test_split  # pylint: disable=C0415
+
+    feat_vectors, clss = dataset
+    train, val, test = er.make_splits(clss)
+    assert len(np.unique(np.concatenate([train, val, test]))) == len(clss)
+    # Same sets as splitting the matrix as the notebook does
+    x_train, x_test, _, y_test = train_test_split(
+        feat_vectors, clss, stratify=clss, random_state=0, test_size=0.30
+    )
+    x_val, x_test, _, _ = train_test_split(
+        x_test, y_test, stratify=y_test, random_state=0, test_size=0.15
+    )
+    assert np.array_equal(feat_vectors[train], x_train)
+    assert np.array_equal(feat_vectors[val], x_val)
+    assert np.array_equal(feat_vectors[test], x_test)
+
+
+@pytest.mark.parametrize("workers", [1, 2, 0])
+def test_run_experiments(dataset, tmp_path, workers):
+    feat_vectors, clss = dataset
+    results = er.run_experiments(CONFIGS, feat_vectors, clss, tmp_path, workers)
+    assert [result["name"] for result in results] == ["knn", "pca_tree", "svm"]
+    for result in results:
+        assert 0.5 < result["val_accuracy"] <= 1
+        assert result["fit_seconds"] >= 0
+    assert results[0]["test_auc"] is not None
+    # SVC without probabilities
+    assert results[2]["test_auc"] is None
+    assert "svm" in er.format_results(results)
+
+
+def test_auc_missing_class(dataset):
+    feat_vectors, clss = dataset
+    model = er.build_model(CONFIGS[0])
+    model.fit(feat_vectors, clss)
+    assert er._auc(model, feat_vectors, clss) is not None
+    # No samples of the last class: the AUC is undefined
+    present = clss < 2
+    assert er._auc(model, feat_vectors[present], clss[present]) is None
+
+
+def test_skip_finished(dataset, tmp_path, monkeypatch):
+    feat_vectors, clss = dataset
+    results = er.run_experiments(CONFIGS[:2], feat_vectors, clss, tmp_path)
+
+    ran = []
+
+    def run_experiment(work_dir, config):
+        ran.append(config["name"])
+        return {"name": config["name"]}
+
+    monkeypatch.setattr(er, "_run_experiment", run_experiment)
+    assert er.run_experiments(CONFIGS[:2], feat_vectors, clss, tmp_path) == results
+    assert not ran
+    er.run_experiments(CONFIGS, feat_vectors, clss, tmp_path)
+    assert ran == ["svm"]
+    # Other data invalidate the results
+    er.run_experiments(CONFIGS[:1], feat_vectors[::-1], clss[::-1], tmp_path)
+    assert ran == ["svm", "knn"]
+
+
+def test_unknown_estimator():
+    with pytest.raises(ValueError):
+        er.build_model({"model": "xgboost"})
@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+
+import feature_batch as fb
+from feature_vec import convert_traj_into_vector, feat_name
+
+# pylint: disable=W0621
+
+
+@pytest.fixture
+def trajs():
+    rng = np.random.default_rng(0)
+    trajs = []
+    for length in [4, 5, 17, 100, 250]:
+        points = rng.normal(size=(length, 2)).cumsum(axis=0)
+        time = np.cumsum(rng.integers(1, 4, size=length)).astype(float)
+        trajs.append(np.column_stack([points, time - time[0]]))
+    # Stationary points make the velocity (and its rate) zero
+    trajs[2][5:9, :2] = trajs[2][4, :2]
+    return trajs
+
+
+def test_pack_trajs(trajs):
+    points, offsets = fb.pack_trajs(trajs)
+    assert points.shape == (sum(len(t) for t in trajs), 3)
+    assert list(offsets) == [0, 4, 9, 26, 126, 376]
+    assert np.array_equal(points[offsets[2] : offsets[3]], trajs[2])
+
+
+def test_batch_feat_vectors_parity(trajs):
+    expected = np.array([convert_traj_into_vector(traj, 1) for traj in trajs])
+    vectors = fb.get_batch_feat_vectors(trajs, 1)
+    assert vectors.shape == (len(trajs), len(feat_name))
+    assert vectors == pytest.approx(expected, rel=1e-9, abs=1e-12)
+
+
+def test_batch_feat_vectors_empty():
+    assert fb.get_batch_feat_vectors([], 1).shape == (0, len(feat_name))
+
+
+def test_batch_feat_vectors_short_traj(trajs):
+    with pytest.raises(ValueError):
+        fb.get_batch_feat_vectors(trajs + [trajs[0][:3]], 1)
@@ -0,0 +1,78 @@
+import json
+
+import numpy as np
+
+import feature_bench as bench
+
+
+def test_run_benchmarks():
+    results = bench.run_benchmarks(
+        traj_sizes=[100], batch_sizes=[10], min_time=0, seed=1
+    )
+    kernels = {res["kernel"] for res in results["results"]}
+    assert kernels == (
+        set(bench.TRAJ_KERNELS)
+        | set(bench.STATS_KERNELS)
+        | set(bench.SIGNALS_KERNELS)
+        | set(bench.BATCH_KERNELS)
+        | set(bench.PACKED_KERNELS)
+    )
+    for res in results["results"]:
+        assert res["seconds"] > 0
+        assert res["calls"] >= 3
+        assert res["peak_bytes"] >= 0
+        # The result is held at least
+        assert res["alloc_blocks"] >= 1
+        is_batch = res["kernel"] in {*bench.BATCH_KERNELS, *bench.PACKED_KERNELS}
+        assert res["unit"] == ("trajs" if is_batch else "points")
+    json.dumps(results)
+
+
+def test_allocations():
+    peak, blocks = bench.allocations(lambda: [np.ones(1000) for _ in range(5)])
+    assert peak >= 5 * 8000
+    assert blocks >= 6
+
+
+def test_kernel_selection():
+    results = bench.run_benchmarks([100, 1000], [], ["velocity"], min_time=0)
+    assert [(res["kernel"], res["size"]) for res in results["results"]] == [
+        ("velocity", 100),
+        ("velocity", 1000),
+    ]
+
+
+def make_results(times):
+    return {
+        "results": [
+            {"kernel": kernel, "size": 100, "seconds": seconds}
+            for kernel, seconds in times.items()
+        ]
+    }
+
+
+def test_compare():
+    baseline = make_results({"mean": 1.0, "median": 1.0, "iqr": 1.0})
+    results = make_results({"mean": 1.1, "median": 1.5, "new": 9.0})
+    regressions = bench.compare(results, baseline, threshold=0.2)
+    assert [reg["kernel"] for reg in regressions] == ["median"]
+    assert regressions[0]["slowdown"] == 0.5
+    assert not bench.compare(results, baseline, threshold=0.5)
+
+
+def test_main_compare(tmp_path):
+    out = tmp_path / "bench.json"
+    args = ["--traj-sizes", "100", "--batch-sizes", "10", "--kernels", "mean"]
+    assert bench.main([*args, "--min-time", "0", "--out", str(out)]) == 0
+    baseline = json.loads(out.read_text())
+    assert len(baseline["results"]) == 1
+
+    baseline["results"][0]["seconds"] = 1e-12
+    slow = tmp_path / "slow.json"
+    slow.write_text(json.dumps(baseline))
+    assert bench.main([*args, "--min-time", "0", "--compare", str(slow)]) == 1
+
+    baseline["results"][0]["seconds"] = 1e3
+    fast = tmp_path / "fast.json"
+    fast.write_text(json.dumps(baseline))
+    assert bench.main([*args, "--min-time", "0", "--compare", str(fast)]) == 0
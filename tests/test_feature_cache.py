@@ -0,0 +1,108 @@
+import numpy as np
+import pytest
+
+import feature_cache as fc
+import feature_vec as fv
+
+# pylint: disable=W0621
+
+
+@pytest.fixture
+def metadata():
+    rng = np.random.default_rng(0)
+    metadata = []
+    for i, cls in enumerate(["walk", "car", "bus", "walk", "bike", "train"]):
+        length = int(rng.integers(20, 200))
+        points = rng.normal(size=(length, 2)).cumsum(axis=0)
+        traj = np.column_stack([points, np.arange(length) * 2.0])
+        metadata.append({"id": f"000_{i}", "class": cls, "traj_data": traj})
+    return metadata
+
+
+@pytest.fixture
+def count_computed(monkeypatch):
+    computed = []
+
+    def iter_feat_chunks(trajs, chunk_size, threashold):
+        trajs = list(trajs)
+        computed.append(len(trajs))
+        return fv.iter_feat_chunks(trajs, chunk_size, threashold)
+
+    monkeypatch.setattr(fc, "iter_feat_chunks", iter_feat_chunks)
+    return computed
+
+
+def test_cache_hits(tmp_path, metadata, count_computed):
+    expected = fv.stream_feat_vectors(metadata)[0]
+    vectors, _, clss = fc.get_cached_feat_vectors(metadata, tmp_path)
+    assert np.array_equal(vectors, expected)
+    assert clss == fv.get_classes(metadata)[1]
+
+    vectors, _, _ = fc.get_cached_feat_vectors(metadata, tmp_path)
+    assert np.array_equal(vectors, expected)
+    assert count_computed == [6, 0]
+
+
+def test_cache_changed_and_new(tmp_path, metadata, count_computed):
+    fc.get_cached_feat_vectors(metadata[:4], tmp_path)
+    metadata[1]["traj_data"] = metadata[1]["traj_data"][:-3]
+    vectors, _, _ = fc.get_cached_feat_vectors(metadata, tmp_path)
+    assert count_computed == [4, 3]
+    assert np.array_equal(vectors, fv.stream_feat_vectors(metadata)[0])
+
+
+def test_cache_threashold_and_version(tmp_path, metadata, count_computed, monkeypatch):
+    fc.get_cached_feat_vectors(metadata, tmp_path)
+    fc.get_cached_feat_vectors(metadata, tmp_path, threashold=2)
+    # Both threasholds are cached
+    fc.get_cached_feat_vectors(metadata, tmp_path, threashold=1.0)
+    monkeypatch.setattr(fc, "FEATURES_VERSION", fv.FEATURES_VERSION + 1)
+    fc.get_cached_feat_vectors(metadata, tmp_path, threashold=2)
+    assert count_computed == [6, 6, 0, 6]
+
+
+def test_cache_appends(tmp_path, metadata, count_computed):
+    vectors_file = tmp_path / fc.VECTORS_FILE
+    fc.get_cached_feat_vectors(metadata[:4], tmp_path)
+    inode = vectors_file.stat().st_ino
+    old_rows = vectors_file.read_bytes()
+    fc.get_cached_feat_vectors(metadata[4:], tmp_path)
+    assert count_computed == [4, 2]
+    # The new rows are appended, the file is not rewritten
+    assert vectors_file.stat().st_ino == inode
+    assert vectors_file.read_bytes()[: len(old_rows)] == old_rows
+    assert vectors_file.stat().st_size == 6 * fc.ROW_BYTES
+
+
+def test_cache_loaded_and_file_data(tmp_path, metadata, count_computed, monkeypatch):
+    for i, traj_md in enumerate(metadata):
+        traj_md["file_path"] = str(tmp_path / f"{i}.txt")
+        np.savetxt(traj_md["file_path"], traj_md["traj_data"])
+        traj_md["traj_data"] = np.loadtxt(traj_md["file_path"])
+    cache_dir = tmp_path / "cache"
+    vectors, _, _ = fc.get_cached_feat_vectors(metadata, cache_dir)
+    lazy_md = [
+        {key: value for key, value in traj_md.items() if key != "traj_data"}
+        for traj_md in metadata
+    ]
+    # Same key whether the data are loaded or not
+    assert np.array_equal(fc.get_cached_feat_vectors(lazy_md, cache_dir)[0], vectors)
+    # The hashes of the unchanged files are reused (they are not parsed)
+    monkeypatch.setattr(fc, "load_traj_file", None)
+    assert np.array_equal(fc.get_cached_feat_vectors(lazy_md, cache_dir)[0], vectors)
+    assert count_computed == [6, 0, 0]
+
+
+def test_cache_eviction(tmp_path, metadata, count_computed):
+    fc.get_cached_feat_vectors(metadata, tmp_path, max_unused_runs=2)
+    fc.get_cached_feat_vectors(metadata[:2], tmp_path, max_unused_runs=2)
+    # The unused entries are still cached
+    fc.get_cached_feat_vectors(metadata, tmp_path, max_unused_runs=2)
+    for _ in range(2):
+        fc.get_cached_feat_vectors(metadata[:2], tmp_path, max_unused_runs=2)
+    # The evicted rows are dropped from the file
+    assert (tmp_path / fc.VECTORS_FILE).stat().st_size == 2 * fc.ROW_BYTES
+    vectors, _, _ = fc.get_cached_feat_vectors(metadata, tmp_path, max_unused_runs=2)
+    assert count_computed == [6, 0, 0, 0, 0, 4]
+    assert np.array_equal(vectors, fv.stream_feat_vectors(metadata)[0])
+    assert (tmp_path / fc.VECTORS_FILE).stat().st_size == 6 * fc.ROW_BYTES
@@ -72,3 +72,57 @@ def test_rate_hcr(traj):
     assert fe.rate_hcr(traj) * 180 / np.pi == pytest.approx(
         [-45 / 2 - (90 - 53.13010) / 4]
     )
+
+
+def test_derivatives_are_memoized(traj):
+    derivs = fe.TrajDerivatives(traj)
+    assert fe.derivatives(derivs) is derivs
+    assert fe.velocity(derivs) is fe.velocity(derivs)
+    assert fe.acceleration(derivs) == pytest.approx(fe.acceleration(traj))
+    assert fe.rate_hcr(derivs) == pytest.approx(fe.rate_hcr(traj))
+    assert fe.stop_rate(derivs, 2.0) == pytest.approx(fe.stop_rate(traj, 2.0))
+
+
+def test_velocity_rate_keeps_velocity(traj):
+    traj[2, :2] = traj[1, :2]
+    derivs = fe.TrajDerivatives(traj)
+    assert fe._velocity_rate(derivs) == pytest.approx([1, 0])
+    assert fe.velocity(derivs) == pytest.approx([2.5, 0.0, np.sqrt(10) / 2])
+
+
+def test_median():
+    assert fe.median(np.array([3.0, 1.0, 2.0, 10.0])) == pytest.approx(2.5)
+
+
+@pytest.mark.parametrize("size", [1, 2, 5, 100])
+def test_summary_stats(size):
+    values = np.random.default_rng(size).normal(size=size)
+    expected = [
+        fe.mean(values),
+        fe.median(values),
+        fe.min_val(values),
+        fe.max_val(values),
+        fe.standard_dev(values),
+        fe.variance(values),
+        fe.coef_var(values),
+        fe.iqr(values),
+    ]
+    assert fe.summary_stats(values) == pytest.approx(expected)
+    packed = fe.segment_summary_stats(
+        np.concatenate([values, values[::-1]]), np.array([0, size, 2 * size])
+    )
+    assert packed == pytest.approx(np.array([expected, expected]))
+
+
+@pytest.mark.parametrize("max_points", [0, fe.PACKED_STATS_MAX_POINTS])
+def test_summary_stats_many(traj, max_points, monkeypatch):
+    monkeypatch.setattr(fe, "PACKED_STATS_MAX_POINTS", max_points)
+    signals = [fe.velocity(traj), fe.angle(traj), fe.acceleration(traj)]
+    assert fe.summary_stats_many(signals) == pytest.approx(
+        np.array([fe.summary_stats(signal) for signal in signals])
+    )
+    with pytest.raises(ValueError):
+        fe.summary_stats(np.empty(0))
+    with pytest.raises(ValueError):
+        fe.summary_stats_many([signals[0], np.empty(0)])
+    assert fe.summary_stats_many([]).shape == (0, len(fe.STATS_NAMES))
@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+
+import feature_est as fe
+import feature_online as fo
+from feature_vec import convert_traj_into_vector, feat_name
+
+# pylint: disable=W0621
+
+ORDER_STATS = [
+    i for i, name in enumerate(feat_name) if name.startswith(("median", "iqr"))
+]
+
+
+@pytest.fixture
+def traj():
+    rng = np.random.default_rng(0)
+    points = rng.normal(size=(2000, 2)).cumsum(axis=0)
+    time = np.cumsum(rng.integers(1, 4, size=2000)).astype(float)
+    return np.column_stack([points, time])
+
+
+def test_online_vector_matches_batch(traj):
+    estimator = fo.OnlineFeatureEstimator(threashold=1)
+    estimator.add_points(traj[:10])
+    for lat, lon, time in traj[10:]:
+        estimator.add(lat, lon, time)
+    vector = estimator.vector()
+    expected = convert_traj_into_vector(traj, 1)
+
+    exact = np.ones(len(feat_name), dtype=bool)
+    exact[ORDER_STATS] = False
+    assert vector[exact] == pytest.approx(expected[exact], rel=1e-6)
+
+
+def test_online_order_stats_are_approximate(traj):
+    estimator = fo.OnlineFeatureEstimator()
+    estimator.add_points(traj)
+    vector = estimator.vector()
+    signals = [
+        fe.velocity(traj),
+        fe.acceleration(traj),
+        fe.acceleration_change_rate(traj),
+        fe.angle(traj),
+        fe.turning_angle(traj),
+        fe.heading_change_rate(traj),
+    ]
+    medians = vector[[i for i in ORDER_STATS if feat_name[i].startswith("median")]]
+    iqrs = vector[[i for i in ORDER_STATS if feat_name[i].startswith("iqr")]]
+    for signal, median, iqr in zip(signals, medians, iqrs):
+        q25, q50, q75 = np.percentile(signal, [25, 50, 75])
+        assert median == pytest.approx(q50, abs=0.05 * (q75 - q25))
+        assert iqr == pytest.approx(q75 - q25, rel=0.05)
+
+
+def test_online_vector_short_traj(traj):
+    estimator = fo.OnlineFeatureEstimator()
+    estimator.add_points(traj[:3])
+    with pytest.raises(ValueError):
+        estimator.vector()
+    estimator.add(*traj[3])
+    # Only one acceleration change rate: every statistic is exact
+    vector = estimator.vector()
+    assert vector[19:27] == pytest.approx(convert_traj_into_vector(traj[:4], 1)[19:27])
+
+
+def test_p2_quantile():
+    values = np.random.default_rng(1).exponential(size=5000)
+    quantile = fo.P2Quantile(0.9)
+    for i, value in enumerate(values):
+        quantile.add(value)
+        if i < 5:
+            assert quantile.value() == pytest.approx(np.percentile(values[: i + 1], 90))
+    assert quantile.value() == pytest.approx(np.percentile(values, 90), rel=0.02)
@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+
+import feature_pipeline as fp
+from feature_vec import convert_traj_into_vector
+
+# pylint: disable=W0621
+
+pytest.importorskip("sklearn")
+
+
+@pytest.fixture(scope="module")
+def pipeline():
+    trajs, clss = fp.random_trajs(90, 120, seed=1)
+    vectors = np.array([convert_traj_into_vector(traj, 1) for traj in trajs])
+    return fp.FeaturePipeline.train(vectors, clss, n_estimators=20)
+
+
+def test_predict_many(pipeline):
+    trajs, clss = fp.random_trajs(30, 120, seed=2)
+    labels, proba = pipeline.predict_many(trajs)
+    assert proba.shape == (30, 3)
+    assert labels == [pipeline.class_names[cls] for cls in clss]
+    batched_labels, batched_proba = pipeline.predict_many(trajs, batch_size=7)
+    assert batched_labels == labels
+    assert np.allclose(batched_proba, proba)
+    assert pipeline.predict(trajs[4]) == labels[4]
+    assert pipeline.predict_many([]) == ([], pytest.approx(np.empty((0, 3))))
+
+
+def test_save_load(pipeline, tmp_path):
+    model_file = tmp_path / "model.pkl"
+    pipeline.save(model_file)
+    loaded = fp.FeaturePipeline.load(model_file)
+    trajs, _ = fp.random_trajs(10, 120, seed=3)
+    assert np.array_equal(loaded.predict_many(trajs)[1], pipeline.predict_many(trajs)[1])
+
+
+def test_benchmark(pipeline):
+    trajs, _ = fp.random_trajs(20, 120)
+    results = fp.benchmark(pipeline, trajs, batch_sizes=(1, 20))
+    assert set(results) == {1, 20}
+    assert all(tps > 0 for tps in results.values())
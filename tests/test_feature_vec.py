@@ -0,0 +1,135 @@
+import numpy as np
+import pytest
+
+import feature_vec as fv
+
+# pylint: disable=W0621
+
+
+@pytest.fixture
+def metadata(tmp_path):
+    rng = np.random.default_rng(0)
+    metadata = []
+    for i, (length, cls) in enumerate(zip([100, 130, 7, 250, 60], fv.classes)):
+        points = rng.normal(size=(length, 2)).cumsum(axis=0)
+        time = np.arange(length) * rng.integers(1, 4)
+        file_path = str(tmp_path / f"{i}_{cls}.txt")
+        np.savetxt(file_path, np.column_stack([points, time]))
+        metadata.append({"id": f"000_{i}", "file_path": file_path, "class": cls})
+    return metadata
+
+
+def test_stream_feat_vectors(metadata):
+    vectors, clss_mask, clss = fv.stream_feat_vectors(metadata, chunk_size=2)
+    assert all("traj_data" not in traj_md for traj_md in metadata)
+
+    for traj_md in metadata:
+        traj_md["traj_data"] = np.loadtxt(traj_md["file_path"])
+    exp_vectors, exp_clss_mask, exp_clss = fv.get_feat_vectors(metadata)
+    assert vectors == pytest.approx(np.array(exp_vectors), rel=1e-9, abs=1e-12)
+    assert np.array_equal(clss_mask, exp_clss_mask)
+    assert clss == exp_clss
+
+
+def test_stream_feat_vectors_memmap(metadata, tmp_path):
+    out = np.lib.format.open_memmap(
+        tmp_path / "vectors.npy", mode="w+", shape=(len(metadata), len(fv.feat_name))
+    )
+    vectors, _, _ = fv.stream_feat_vectors(metadata, chunk_size=3, out=out)
+    assert vectors is out
+    assert np.load(tmp_path / "vectors.npy") == pytest.approx(
+        fv.stream_feat_vectors(metadata)[0]
+    )
+
+
+def test_stream_feat_vectors_bad_out(metadata):
+    with pytest.raises(ValueError):
+        fv.stream_feat_vectors(metadata, out=np.empty((1, len(fv.feat_name))))
+
+
+def test_iter_feat_chunks(metadata):
+    trajs = [np.loadtxt(traj_md["file_path"]) for traj_md in metadata]
+    chunks = list(fv.iter_feat_chunks(iter(trajs), chunk_size=2))
+    assert [len(chunk) for chunk in chunks] == [2, 2, 1]
+
+
+def test_registry_covers_feat_name():
+    assert set(fv.FEATURES) == set(fv.feat_name)
+    assert fv.required_signals(fv.feat_name) <= set(fv.DERIVATIVE_DEPS)
+
+
+def test_compute_all_features():
+    traj = np.random.default_rng(1).normal(size=(50, 3)).cumsum(axis=0)
+    traj[:, 2] = np.arange(50) * 2
+    full = fv.convert_traj_into_vector(traj, 1)
+    subset = fv.convert_traj_into_vector(traj, 1, fv.feat_name)
+    assert subset == pytest.approx(full, rel=1e-12, abs=1e-15)
+
+    order = ["iqr_angle", "distance", "stop_rate", "mean_velocity"]
+    values = fv.convert_traj_into_vector(traj, 1, order)
+    assert values == pytest.approx(full[fv.feature_indices(order)], rel=1e-12)
+
+
+def test_only_needed_signals():
+    traj = np.random.default_rng(2).normal(size=(30, 3)).cumsum(axis=0)
+    traj[:, 2] = np.arange(30)
+    features = [
+        name for name in fv.feat_name if "angle" not in name and "heading" not in name
+    ]
+    derivs = fv.fe.derivatives(traj)
+    fv.compute_features(derivs, features, 1)
+    computed = set(vars(derivs)) - {"traj"}
+    assert computed == fv.required_signals(features)
+    assert not computed & {"angle", "turning_angle", "heading_change_rate"}
+    assert fv.required_signals(["mean_velocity"]) == {
+        "velocity",
+        "delta_r",
+        "delta_pos",
+        "delta_t",
+    }
+
+
+def test_unknown_feature():
+    with pytest.raises(ValueError):
+        fv.compute_features(np.ones((5, 3)), ["mean_speed"], 1)
+
+
+def test_get_feat_vectors_subset(metadata):
+    for traj_md in metadata:
+        traj_md["traj_data"] = np.loadtxt(traj_md["file_path"])
+    full, _, _ = fv.get_feat_vectors(metadata)
+    subset = ["max_acceleration", "distance"]
+    vectors, _, _ = fv.get_feat_vectors(metadata, subset)
+    assert np.array(vectors) == pytest.approx(
+        np.array(full)[:, fv.feature_indices(subset)], rel=1e-12
+    )
+
+
+def test_balanced_chunks():
+    assert not fv.balanced_chunks([], 4)
+    chunks = fv.balanced_chunks([10, 10, 10, 10, 1000, 10], 3)
+    assert chunks[0][0] == 0 and chunks[-1][1] == 6
+    assert all(stop == start for (_, stop), (start, _) in zip(chunks, chunks[1:]))
+    # The long trajectory gets its own chunk
+    assert (4, 5) in chunks
+    assert fv.balanced_chunks([5, 5], 8) == [(0, 1), (1, 2)]
+
+
+@pytest.mark.parametrize("features", [None, ["max_acceleration", "distance"]])
+def test_get_feat_vectors_parallel(metadata, features):
+    for traj_md in metadata:
+        traj_md["traj_data"] = np.loadtxt(traj_md["file_path"])
+    exp_vectors, exp_clss_mask, exp_clss = fv.get_feat_vectors(metadata, features)
+    vectors, clss_mask, clss = fv.get_feat_vectors(metadata, features, workers=2)
+    assert np.array_equal(np.array(vectors), np.array(exp_vectors), equal_nan=True)
+    assert np.array_equal(clss_mask, exp_clss_mask)
+    assert clss == exp_clss
+
+
+def test_clamp_data():
+    trajs = [np.ones((15, 3)), np.arange(12.0).reshape(4, 3)]
+    batch = fv.clamp_data(trajs, 5)
+    assert batch.shape == (2, 5, 3)
+    assert np.array_equal(batch[0], np.ones((5, 3)))
+    assert np.array_equal(batch[1, 1:], trajs[1])
+    assert not batch[1, 0].any()
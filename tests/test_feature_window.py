@@ -0,0 +1,64 @@
+import warnings
+
+import numpy as np
+import pytest
+
+from feature_vec import convert_traj_into_vector, feat_name
+from feature_window import window_feat_vectors, window_starts
+
+# pylint: disable=W0621
+
+
+@pytest.fixture
+def traj():
+    rng = np.random.default_rng(0)
+    length = 400
+    points = 39.9 + np.cumsum(rng.normal(scale=1e-4, size=(length, 2)), axis=0)
+    # Stops (repeated positions) and irregular sampling
+    points[100:140] = points[100]
+    times = np.cumsum(rng.integers(1, 4, size=length)).astype(np.float64)
+    return np.column_stack([points, times])
+
+
+def test_window_starts():
+    assert window_starts(10, 4).tolist() == list(range(7))
+    assert window_starts(10, 4, stride=3).tolist() == [0, 3, 6]
+    assert window_starts(3, 4).tolist() == []
+    with pytest.raises(ValueError):
+        window_starts(10, 3)
+    with pytest.raises(ValueError):
+        window_starts(10, 4, stride=0)
+
+
+@pytest.mark.parametrize("window, stride", [(4, 1), (50, 1), (50, 7), (30, 60)])
+def test_matches_per_window_vectors(traj, window, stride):
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        vectors = window_feat_vectors(traj, window, stride, threashold=1e-5)
+    starts = window_starts(len(traj), window, stride)
+    assert vectors.shape == (len(starts), len(feat_name))
+    for start, vector in zip(starts, vectors):
+        # The windows inside the stop have no distance (infinite rates)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            expected = convert_traj_into_vector(traj[start : start + window], 1e-5)
+        assert vector == pytest.approx(expected, rel=1e-6, abs=1e-9, nan_ok=True)
+
+
+def test_short_trajectory(traj):
+    assert window_feat_vectors(traj[:10], 20).shape == (0, len(feat_name))
+
+
+def test_repeated_timestamp(traj):
+    # A repeated timestamp gives non-finite velocities (and derived signals)
+    traj = traj.copy()
+    traj[50, 2] = traj[49, 2]
+    window = 50
+    with np.errstate(divide="ignore", invalid="ignore"):
+        vectors = window_feat_vectors(traj, window, threashold=1e-5)
+        expected = [
+            convert_traj_into_vector(traj[start : start + window], 1e-5)
+            for start in window_starts(len(traj), window)
+        ]
+    assert np.isfinite(vectors[150]).all()
+    for vector, exp_vector in zip(vectors, expected):
+        assert vector == pytest.approx(exp_vector, rel=1e-6, abs=1e-9, nan_ok=True)
@@ -0,0 +1,62 @@
+import csv
+import io
+import json
+
+import numpy as np
+
+import instrumentation as ins
+from feature_vec import get_feat_vectors
+
+
+def test_progress_rate_limit():
+    stream = io.StringIO()
+    inst = ins.Instrument([ins.ProgressSink(stream)], progress_interval=3600)
+    for i in range(1000):
+        inst.progress("stage", i + 1, 1000)
+    # First and last events only
+    assert stream.getvalue() == "\rstage: 0.10%\rstage: 100.00%\n"
+
+
+def test_stages_and_counters():
+    inst = ins.Instrument([], trace_memory=True)
+    for _ in range(2):
+        with inst.stage("alloc"):
+            np.ones(100_000)
+            inst.count("items", 3)
+    metrics = inst.metrics()
+    assert metrics["counters"] == {"items": 6}
+    assert metrics["stages"]["alloc"]["calls"] == 2
+    assert metrics["stages"]["alloc"]["seconds"] > 0
+    assert metrics["stages"]["alloc"]["peak_bytes"] >= 800_000
+
+
+def test_export_sinks(tmp_path):
+    json_file, csv_file = tmp_path / "m.json", tmp_path / "m.csv"
+    inst = ins.Instrument([ins.sink_for_path(json_file), ins.sink_for_path(csv_file)])
+    data = [
+        {"class": "walk", "traj_data": np.random.default_rng(i).normal(size=(20, 3))}
+        for i in range(3)
+    ]
+    with ins.using(inst):
+        assert ins.get_instrument() is inst
+        get_feat_vectors(data)
+    assert ins.get_instrument() is not inst
+
+    metrics = json.loads(json_file.read_text())
+    assert metrics["counters"] == {
+        "points_featurized": 60,
+        "trajectories_featurized": 3,
+    }
+    assert metrics["stages"]["get_feat_vectors"]["calls"] == 1
+    rows = list(csv.reader(csv_file.open()))
+    assert rows[0] == ["kind", "name", "field", "value"]
+    assert ["counter", "points_featurized", "value", "60"] in rows
+
+
+def test_null_instrument(capsys):
+    inst = ins.NullInstrument()
+    with ins.using(inst):
+        get_feat_vectors([{"class": "bus", "traj_data": np.random.rand(10, 3)}])
+    assert inst.metrics()["counters"] == {}
+    assert inst.metrics()["stages"] == {}
+    assert capsys.readouterr() == ("", "")
@@ -0,0 +1,80 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+import lstm_service as ls
+
+# pylint: disable=W0621
+
+
+class FakeModel:
+    """Returns the mean time of the last points as the only 'probability'."""
+
+    input_shape = (None, 10, 3)
+
+    def __init__(self):
+        self.batch_shapes = []
+
+    def predict(self, inputs, verbose=0):  # pylint: disable=W0613
+        self.batch_shapes.append(inputs.shape)
+        return inputs[:, :, 2].mean(axis=1, keepdims=True)
+
+
+def test_service_batches_concurrent_requests():
+    model = FakeModel()
+    service = ls.LSTMInferenceService(model, max_batch_size=8, max_delay=0.05)
+    trajs = ls.random_trajs(20, 30)
+
+    async def run():
+        async with service:
+            return await asyncio.gather(*(service.predict(traj) for traj in trajs))
+
+    preds = asyncio.run(run())
+    expected = [traj[-10:, 2].mean() for traj in trajs]
+    assert [pred[0] for pred in preds] == pytest.approx(expected)
+    assert [shape[0] for shape in model.batch_shapes] == [8, 8, 4]
+    stats = service.stats()
+    assert stats["requests"] == 20
+    assert stats["batches"] == 3
+
+
+def test_service_bad_request():
+    model = FakeModel()
+    service = ls.LSTMInferenceService(model, max_batch_size=8, max_delay=0.05)
+    traj = ls.random_trajs(1, 30)[0]
+
+    async def run():
+        async with service:
+            results = await asyncio.wait_for(
+                asyncio.gather(
+                    service.predict(np.ones((5, 2))),
+                    service.predict(traj),
+                    return_exceptions=True,
+                ),
+                5,
+            )
+            # The service keeps serving after the bad request
+            later = await asyncio.wait_for(service.predict(traj), 5)
+        return results, later
+
+    (bad, pred), later = asyncio.run(run())
+    assert isinstance(bad, ValueError)
+    assert pred[0] == pytest.approx(traj[-10:, 2].mean())
+    assert later[0] == pytest.approx(pred[0])
+    # The bad request is left out of the batch
+    assert model.batch_shapes[0][0] == 1
+
+
+def test_run_load():
+    service = ls.LSTMInferenceService(FakeModel(), max_batch_size=16, max_delay=0.01)
+    stats = asyncio.run(ls.run_load(service, ls.random_trajs(100, 20), clients=10))
+    assert stats["requests"] == 100
+    assert stats["mean_batch_size"] > 1
+    assert stats["p99_ms"] >= stats["p50_ms"] > 0
+
+
+def test_service_not_running():
+    service = ls.LSTMInferenceService(FakeModel())
+    with pytest.raises(RuntimeError):
+        asyncio.run(service.predict(np.ones((10, 3))))
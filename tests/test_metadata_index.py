@@ -0,0 +1,89 @@
+import copy
+import json
+import os
+
+import numpy as np
+import pytest
+
+import data_handler as dh
+import metadata_index as mi
+
+# pylint: disable=W0621
+
+
+@pytest.fixture
+def metadata():
+    rng = np.random.default_rng(0)
+    classes = ["car", "taxi", "bus", "walk", "bike", "subway", "train", "run", "boat"]
+    metadata = []
+    for i in range(200):
+        metadata.append(
+            {
+                "id": f"{i // 10:03d}_{i % 10}",
+                "file_path": f"trajectories/{i // 10:03d}/{i % 10}.txt",
+                "class": str(rng.choice(classes)),
+                "mean_dt": float(rng.uniform(0.5, 6)),
+                "length": int(rng.integers(2, 300)),
+                "duration": float(rng.uniform(10, 1000)),
+                "min_lat": 39.9,
+                "max_lat": 40.1,
+                "min_lon": 116.2,
+                "max_lon": 116.5,
+                "distance": float(rng.uniform(0, 1)),
+            }
+        )
+    return metadata
+
+
+def test_index_roundtrip(tmp_path, metadata):
+    index_file = tmp_path / "index.npz"
+    mi.save_index(metadata, index_file)
+    index = mi.load_index(index_file)
+    assert len(index) == len(metadata)
+    assert index.to_metadata() == metadata
+
+
+def test_missing_columns():
+    index = mi.build_index([{"id": "000_0", "class": "walk", "mean_dt": 1.0}])
+    assert np.isnan(index["distance"][0])
+    assert index["length"][0] == -1
+
+
+def test_select_index_matches_select_metadata(metadata):
+    index = mi.build_index(metadata)
+    selected = dh.select_index(index)
+    expected = dh.select_metadata(copy.deepcopy(metadata))
+    assert selected["id"].tolist() == [traj_md["id"] for traj_md in expected]
+    assert selected.classes.tolist() == [traj_md["class"] for traj_md in expected]
+    assert set(selected.classes) == {"car", "bus", "walk", "bike", "train"}
+
+
+def test_class_codes(metadata):
+    index = mi.build_index(metadata)
+    codes = index.class_codes(["walk", "plane"])
+    assert index.class_names[codes[0]] == "walk"
+    assert codes[1] == -1
+
+
+def test_get_selected_metadata_uses_index(tmp_path, metadata, monkeypatch):
+    metadata_file = tmp_path / "metadata.json"
+    metadata_file.write_text(json.dumps(metadata), encoding="utf-8")
+    index_file = tmp_path / "index.npz"
+    mi.save_index(metadata, index_file)
+    expected = dh.select_metadata(copy.deepcopy(metadata))
+
+    def load_trajs_metadata(_):
+        raise AssertionError("the json metadata must not be parsed")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(dh, "load_trajs_metadata", load_trajs_metadata)
+        selected = dh.get_selected_metadata(
+            tmp_path / "missing.store", index_file, metadata_file
+        )
+    assert selected == expected
+
+    # A stale index falls back to the json metadata
+    os.utime(index_file, (0, 0))
+    assert dh.get_selected_metadata(
+        tmp_path / "missing.store", index_file, metadata_file
+    ) == expected
@@ -0,0 +1,127 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+import traj_store as ts
+from sequence_dataset import WindowDataset
+
+# pylint: disable=W0621
+
+
+@pytest.fixture
+def trajs():
+    rng = np.random.default_rng(0)
+    return [rng.normal(size=(length, 3)) for length in [5, 30, 47, 100]]
+
+
+def make_dataset(trajs, **kwargs):
+    return WindowDataset(
+        [len(traj) for traj in trajs],
+        np.arange(len(trajs)),
+        lambda i: trajs[i],
+        **kwargs,
+    )
+
+
+def test_strided_windows(trajs):
+    dataset = make_dataset(trajs, window=20, stride=10, shuffle=False)
+    traj_idx, starts, sizes = dataset.windows()
+    assert traj_idx.tolist() == [0, 1, 1, 2, 2, 2, 2] + [3] * 9
+    # The last window of the trajectory of 47 points ends at its end
+    assert starts.tolist() == [0, 0, 10, 0, 10, 20, 27] + list(range(0, 81, 10))
+    assert sizes.tolist() == [5] + [20] * 15
+
+
+def test_default_stride_covers_tail(trajs):
+    dataset = make_dataset(trajs, window=20, shuffle=False)
+    traj_idx, starts, sizes = dataset.windows()
+    assert traj_idx.tolist() == [0, 1, 1, 2, 2, 2, 3, 3, 3, 3, 3]
+    assert starts.tolist() == [0, 0, 10, 0, 20, 27, 0, 20, 40, 60, 80]
+    lengths = np.array([len(traj) for traj in trajs])
+    assert np.array_equal(np.maximum.reduceat(starts + sizes, [0, 1, 3, 6]), lengths)
+
+
+@pytest.mark.parametrize("prefetch", [0, 2])
+def test_batches_cover_windows(trajs, prefetch):
+    dataset = make_dataset(
+        trajs, window=20, stride=10, batch_size=4, n_buckets=2, prefetch=prefetch
+    )
+    batches = list(dataset)
+    assert len(batches) == len(dataset)
+    seen = []
+    for inputs, labels in batches:
+        assert inputs.shape[0] == len(labels) <= 4
+        for window, label in zip(inputs, labels):
+            traj = trajs[label]
+            size = np.count_nonzero(np.any(window != 0, axis=1))
+            last = np.all(traj.astype(np.float32) == window[-1], axis=1)
+            start = np.flatnonzero(last)[0] + 1 - size
+            expected = traj[start : start + size].astype(np.float32)
+            assert np.array_equal(window[-size:], expected)
+            seen.append((label, start))
+    assert sorted(seen) == sorted(zip(*dataset.windows()[:2]))
+
+
+def test_buckets_reduce_padding(trajs):
+    dataset = make_dataset(trajs, window=20, batch_size=8, n_buckets=2)
+    widths = {inputs.shape[1] for inputs, _ in dataset}
+    # The short trajectory is not padded to the window size
+    assert 5 in widths
+
+
+def test_random_windows(trajs):
+    dataset = make_dataset(trajs, window=20, samples_per_traj=3, batch_size=5)
+    traj_idx, starts, sizes = dataset.windows()
+    assert len(traj_idx) == 12
+    assert np.all(starts + sizes <= np.array([len(t) for t in trajs])[traj_idx])
+    assert sum(len(labels) for _, labels in dataset) == 12
+
+
+def test_errors_propagate(trajs):
+    def get_traj(i):
+        raise OSError(f"cannot read {i}")
+
+    dataset = WindowDataset([10], [0], get_traj, window=5)
+    with pytest.raises(OSError):
+        list(dataset)
+
+
+def test_early_stop(trajs):
+    dataset = make_dataset(trajs, window=5, batch_size=1, prefetch=1)
+    for _ in dataset:
+        break
+
+
+def test_early_stop_after_producer_done():
+    trajs = [np.ones((10, 3)), np.ones((10, 3))]
+    dataset = make_dataset(trajs, window=10, batch_size=1, prefetch=1, n_buckets=1)
+    assert len(dataset) == 2
+
+    def consume():
+        for _ in dataset:
+            # The producer is done and blocked on the full queue
+            time.sleep(0.3)
+            break
+
+    consumer = threading.Thread(target=consume, daemon=True)
+    consumer.start()
+    consumer.join(timeout=5)
+    assert not consumer.is_alive()
+
+
+def test_from_store(tmp_path, trajs):
+    store_file = tmp_path / "trajs.store"
+    with ts.TrajStoreWriter(store_file) as writer:
+        for i, traj in enumerate(trajs):
+            writer.add(traj, {"id": str(i)})
+    store = ts.TrajStore(store_file)
+    dataset = WindowDataset.from_store(
+        store, [1, 3], indices=[1, 3], window=50, n_buckets=1, shuffle=False
+    )
+    batches = list(dataset)
+    assert len(batches) == 1
+    inputs, labels = batches[0]
+    assert inputs.shape == (3, 50, 3)
+    assert sorted(labels.tolist()) == [1, 3, 3]
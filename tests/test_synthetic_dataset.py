@@ -0,0 +1,53 @@
+import data_parser as dp
+import synthetic_dataset as sd
+
+
+def test_generate_dataset(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    summary = sd.generate_dataset(
+        tmp_path / "geolife", n_users=2, points_per_day=400, n_days=2, seed=1
+    )
+    assert summary == {"users": 2, "plt_files": 4, "points": 1600}
+
+    usr_folder = tmp_path / "geolife" / "001"
+    plts = sorted((usr_folder / "Trajectory").glob("*.plt"))
+    assert len(plts) == 2
+    assert plts[0].read_text().splitlines()[:6] == sd.PLT_HEADER.splitlines()
+
+    regs = dp.load_registers(usr_folder)
+    assert len(regs.lat) == 800
+    labels = dp.load_labels(usr_folder / "labels.txt")
+    assert {label.clsf for label in labels} <= set(sd.MODE_SPEEDS)
+
+    usr_metadata = dp.process_usr_trajs(usr_folder)
+    # The parser drops the last label (no register follows it)
+    assert len(usr_metadata) == len(labels) - 1
+    assert sum(md["length"] for md in usr_metadata) < 800
+    assert all(1 <= md["mean_dt"] <= 3 for md in usr_metadata)
+
+
+def test_run_harness(tmp_path):
+    report = sd.run_harness(tmp_path / "run", n_users=2, points_per_day=600, seed=2)
+    assert report["dataset"]["points"] == 2400
+    assert report["dataset"]["selected_trajs"] > 0
+    assert [stage["stage"] for stage in report["stages"]] == [
+        "parse",
+        "select",
+        "features",
+    ]
+    for stage in report["stages"]:
+        assert stage["wall_time"] > 0
+        # Not traced by default
+        assert stage["peak_bytes"] is None
+        assert stage["points_per_second"] > 0
+    assert (tmp_path / "run" / "trajectories" / "metadata.json").exists()
+
+
+def test_run_harness_trace_memory(tmp_path):
+    report = sd.run_harness(
+        tmp_path / "run", n_users=1, points_per_day=300, seed=2, trace_memory=True
+    )
+    for stage in report["stages"]:
+        assert stage["peak_bytes"] > 0
+        assert stage["max_rss_bytes"] is None or stage["max_rss_bytes"] > 0
+    assert report["stages"][1]["points"] == report["stages"][2]["points"]
@@ -0,0 +1,102 @@
+import numpy as np
+import pytest
+
+import data_handler as dh
+import feature_est as fe
+from traj_resample import compress, preprocess, resample
+
+
+def test_resample():
+    traj = np.array([[0.0, 0.0, 0], [1.0, 2.0, 5], [1.0, 4.0, 11]])
+    res = resample(traj, 2)
+    assert res[:, 2].tolist() == [0, 2, 4, 6, 8, 10]
+    assert res[:, 0] == pytest.approx([0, 0.4, 0.8, 1, 1, 1])
+    assert res[:, 1] == pytest.approx([0, 0.8, 1.6, 2 + 1 / 3, 3, 3 + 2 / 3])
+    assert resample(traj, 5.5)[:, 2].tolist() == [0, 5.5, 11]
+    with pytest.raises(ValueError):
+        resample(traj, 0)
+
+
+def test_resample_sparse_trajectory():
+    times = np.cumsum(np.full(50, 8.0))
+    traj = np.column_stack([np.linspace(0, 1, 50), np.zeros(50), times])
+    res = resample(traj, 2)
+    assert np.all(np.diff(res[:, 2]) == 2)
+    assert len(res) == 197
+    assert fe.distance(res) == pytest.approx(fe.distance(traj))
+
+
+def test_compress_stationary_and_collinear():
+    # Straight constant-speed segment, a stop and a turn
+    straight = np.column_stack([np.arange(10.0), np.zeros(10), np.arange(10.0)])
+    stop = np.column_stack([np.full(20, 9.0), np.zeros(20), np.arange(10.0, 30)])
+    turn = np.column_stack([np.full(5, 9.0), np.arange(1.0, 6), np.arange(30.0, 35)])
+    traj = np.concatenate([straight, stop, turn])
+    comp = compress(traj, 1e-9)
+    # The inner points of the straight segment and the turn are removed,
+    # the stop is kept whole
+    assert comp.tolist() == [[0, 0, 0]] + traj[9:30].tolist() + [[9, 5, 34]]
+    assert fe.distance(comp) == pytest.approx(fe.distance(traj))
+    assert fe.stop_rate(comp, 1e-9) == fe.stop_rate(traj, 1e-9)
+
+
+def test_compress_keeps_noisy_points():
+    rng = np.random.default_rng(0)
+    traj = np.column_stack(
+        [rng.normal(size=(100, 2)).cumsum(axis=0), np.arange(100.0)]
+    )
+    assert np.array_equal(compress(traj, 1e-9), traj)
+    comp = compress(traj, 0.5)
+    assert 2 <= len(comp) < 100
+    assert np.array_equal(comp[[0, -1]], traj[[0, -1]])
+
+
+def test_compress_gps_like_trajectory():
+    rng = np.random.default_rng(1)
+    # 1-second fixes: driving straight, stopped for 5 minutes, walking
+    driving = np.column_stack([np.arange(300) * 1e-4, np.zeros(300)])
+    stopped = np.repeat(driving[-1:], 300, axis=0)
+    walking = stopped[-1] + np.cumsum(rng.normal(scale=1e-5, size=(300, 2)), axis=0)
+    points = np.concatenate([driving, stopped, walking])
+    traj = np.column_stack([points, np.arange(len(points), dtype=np.float64)])
+    comp = preprocess(traj, compress_tol=1e-9, threashold=1e-9)
+    assert len(comp) < 0.7 * len(traj)
+    assert fe.distance(comp) == pytest.approx(fe.distance(traj), rel=1e-12)
+    assert fe.stop_rate(comp, 1e-9) == fe.stop_rate(traj, 1e-9)
+    # At the default threashold every point of this slow trajectory counts
+    assert len(preprocess(traj, compress_tol=1e-9)) == len(traj)
+
+
+def test_compress_keeps_feature_counts():
+    rng = np.random.default_rng(2)
+    # Fast straight segment, a stop, a slow straight walk and a fast noisy
+    # segment (speeds around the feature threashold 1)
+    fast = np.column_stack([np.arange(100) * 2.0, np.zeros(100)])
+    stop = np.repeat(fast[-1:], 50, axis=0)
+    slow = stop[-1] + np.arange(1, 101)[:, None] * [0.3, 0.4]
+    noisy = slow[-1] + np.cumsum(rng.uniform(0.2, 3, size=(100, 2)), axis=0)
+    points = np.concatenate([fast, stop, slow, noisy])
+    traj = np.column_stack([points, np.arange(len(points), dtype=np.float64)])
+    comp = compress(traj, 1e-9, threashold=1)
+    assert len(comp) < len(traj) - 90
+    # A tiny threashold removes the inner points of the slow walk
+    assert len(compress(traj, 1e-9, threashold=1e-12)) < len(comp) - 90
+    with np.errstate(divide="ignore"):
+        for feature in (fe.stop_rate, fe.vel_change_rate):
+            assert feature(comp, 1) == pytest.approx(feature(traj, 1), rel=1e-12)
+
+
+def test_compressed_mean_dt():
+    traj = np.column_stack([np.arange(100.0), np.zeros(100), np.arange(100.0)])
+    data = [{"id": "0", "traj_data": traj, "length": 100, "mean_dt": 1.0}]
+    dh.preprocess_trajs_data(data, compress_tol=1e-9)
+    assert data[0]["length"] == 2
+    assert data[0]["mean_dt"] == 1.0
+
+
+def test_preprocess_trajs_data():
+    traj = np.column_stack([np.linspace(0, 1, 30), np.zeros(30), np.arange(30) * 5.0])
+    data = [{"id": "0", "traj_data": traj, "length": 30, "mean_dt": 5.0}]
+    dh.preprocess_trajs_data(data, resample_interval=1)
+    assert data[0]["length"] == 146
+    assert data[0]["mean_dt"] == 1.0
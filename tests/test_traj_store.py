@@ -0,0 +1,128 @@
+import json
+
+import numpy as np
+import pytest
+
+import data_handler as dh
+import traj_store as ts
+from compact_traj import CompactTraj, save_compact
+
+# pylint: disable=W0621
+
+
+@pytest.fixture
+def trajs():
+    rng = np.random.default_rng(0)
+    return [rng.normal(size=(length, 3)) for length in [2, 5, 120]]
+
+
+@pytest.fixture
+def metadata(trajs):
+    classes = ["walk", "taxi", "subway"]
+    return [
+        {"id": f"000_{i}", "class": cls, "mean_dt": 1.5, "length": len(traj)}
+        for i, (traj, cls) in enumerate(zip(trajs, classes))
+    ]
+
+
+def test_store_roundtrip(tmp_path, trajs, metadata):
+    store_file = tmp_path / "trajs.store"
+    with ts.TrajStoreWriter(store_file) as writer:
+        for traj, traj_md in zip(trajs, metadata):
+            writer.add(traj, traj_md)
+
+    store = ts.TrajStore(store_file)
+    assert len(store) == len(trajs)
+    loaded = dh.load_trajs_store(store_file)
+    for traj, traj_md, loaded_md in zip(trajs, metadata, loaded):
+        assert np.array_equal(loaded_md.pop("traj_data"), traj)
+        assert loaded_md == traj_md
+    assert isinstance(store[2], np.memmap)
+
+
+def test_empty_store(tmp_path):
+    store_file = tmp_path / "trajs.store"
+    ts.TrajStoreWriter(store_file).close()
+    assert not dh.load_trajs_store(store_file)
+
+
+def test_failed_write_removes_store(tmp_path, trajs, metadata):
+    store_file = tmp_path / "trajs.store"
+    with pytest.raises(OSError):
+        with ts.TrajStoreWriter(store_file) as writer:
+            writer.add(trajs[0], metadata[0])
+            raise OSError("cannot read the next trajectory")
+    assert not store_file.exists()
+
+
+def test_not_a_store(tmp_path):
+    bad_file = tmp_path / "trajs.store"
+    bad_file.write_bytes(b"\x00" * 64)
+    with pytest.raises(ValueError):
+        ts.TrajStore(bad_file)
+
+
+def test_convert_trajs_folder(tmp_path, trajs, metadata):
+    for traj, traj_md in zip(trajs, metadata):
+        traj_md["file_path"] = str(tmp_path / f"{traj_md['id']}.txt")
+        np.savetxt(traj_md["file_path"], traj)
+    metadata_file = tmp_path / "metadata.json"
+    metadata_file.write_text(json.dumps(metadata), encoding="utf-8")
+
+    store_file = ts.convert_trajs_folder(metadata_file)
+    assert store_file == tmp_path / "trajectories.store"
+    store = ts.TrajStore(store_file)
+    for i, traj in enumerate(trajs):
+        assert store[i] == pytest.approx(traj)
+
+
+def test_convert_compact_trajs_folder(tmp_path, trajs, metadata):
+    compact = [CompactTraj.from_array(traj) for traj in trajs]
+    for traj, traj_md in zip(compact, metadata):
+        traj_md["file_path"] = str(tmp_path / f"{traj_md['id']}.npz")
+        save_compact(traj_md["file_path"], traj)
+    metadata_file = tmp_path / "metadata.json"
+    metadata_file.write_text(json.dumps(metadata), encoding="utf-8")
+
+    store = ts.TrajStore(ts.convert_trajs_folder(metadata_file))
+    for i, traj in enumerate(compact):
+        assert np.array_equal(store[i], traj.to_array())
+
+
+def test_get_selected_data_from_store(tmp_path, metadata):
+    rng = np.random.default_rng(1)
+    store_file = tmp_path / "trajs.store"
+    with ts.TrajStoreWriter(store_file) as writer:
+        for traj_md in metadata:
+            traj_md["length"] = 100
+            writer.add(rng.normal(size=(100, 3)), traj_md)
+
+    data = dh.get_selected_data(store_file)
+    assert [md["class"] for md in data] == ["walk", "car", "train"]
+    assert all(md["traj_data"].shape == (100, 3) for md in data)
+
+
+def test_stale_store_is_ignored(tmp_path, trajs, metadata):
+    for traj_md, traj in zip(metadata, trajs):
+        traj_md["length"] = 100
+        traj_md["file_path"] = str(tmp_path / f"{traj_md['id']}.txt")
+        np.savetxt(traj_md["file_path"], np.ones((100, 3)))
+    metadata_file = tmp_path / "metadata.json"
+    metadata_file.write_text(json.dumps(metadata), encoding="utf-8")
+    store_file = ts.convert_trajs_folder(metadata_file)
+    missing_index = tmp_path / "missing.npz"
+
+    assert dh.store_is_current(store_file, metadata_file)
+    data = dh.get_selected_data(
+        store_file, index_file=missing_index, metadata_file=metadata_file
+    )
+    assert all(isinstance(md["traj_data"], np.memmap) for md in data)
+
+    # A new parse rewrites the metadata (the store is not rebuilt)
+    metadata_file.write_text(json.dumps(metadata[:2]), encoding="utf-8")
+    assert not dh.store_is_current(store_file, metadata_file)
+    data = dh.get_selected_data(
+        store_file, index_file=missing_index, metadata_file=metadata_file
+    )
+    assert [md["id"] for md in data] == ["000_0", "000_1"]
+    assert not any(isinstance(md["traj_data"], np.memmap) for md in data)
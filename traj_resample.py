@@ -0,0 +1,203 @@
+"""
+Resampling and redundant-point compression of trajectories.
+
+``resample`` interpolates a trajectory at a uniform time interval, so sparse
+trajectories get the same time step as dense ones (and 1-second ones are
+thinned). ``compress`` drops the points that are predicted, within a
+tolerance, by linear interpolation in time between their neighbours: the
+inner points of straight constant-speed segments. Both are vectorized.
+
+``compress`` keeps the points the stop rate and the velocity change rate
+count (see ``feature_est``) for the feature ``threashold``: the ends of the
+segments slower than it (stationary runs included) and the points around
+the velocity changes above it. So both counts are kept, and the total
+distance (their denominator) only changes by the tolerance-sized deviations
+of the removed points. The time step of a compressed trajectory is no
+longer uniform: its ``mean_dt`` metadata is the one of the trajectory
+before the compression (see ``sampled_mean_dt``).
+"""
+from typing import Optional
+
+import numpy as np
+import numpy.typing as npt
+from numpy.linalg import norm
+
+import feature_est as fe
+
+FloatArray = npt.NDArray[np.float64]
+
+
+def resample(traj: FloatArray, interval: float) -> FloatArray:
+    """
+    Resamples a trajectory at a uniform time interval.
+
+    The positions are linearly interpolated at the times ``t0``,
+    ``t0 + interval``, ... up to the last time of the trajectory.
+
+    Parameters
+    ----------
+    traj : FloatArray
+        The trajectory (Nx3 matrix with increasing times).
+    interval : float
+        The time interval (in seconds).
+
+    Returns
+    -------
+    FloatArray
+        The resampled trajectory.
+    """
+    if interval <= 0:
+        raise ValueError(f"The interval must be positive, got {interval}")
+    traj = np.asarray(traj, dtype=np.float64)
+    if len(traj) < 2:
+        return traj.copy()
+    times = traj[:, 2]
+    new_times = times[0] + np.arange(0, times[-1] - times[0] + interval / 2, interval)
+    new_times = new_times[new_times <= times[-1]]
+    return np.column_stack(
+        [
+            np.interp(new_times, times, traj[:, 0]),
+            np.interp(new_times, times, traj[:, 1]),
+            new_times,
+        ]
+    )
+
+
+def _removable(traj: FloatArray, idx: npt.NDArray[np.int64], tol: float):
+    """Whether each inner point of ``traj[idx]`` is predicted by its
+    neighbours (linear interpolation in time) within ``tol``."""
+    prev, cur, nxt = idx[:-2], idx[1:-1], idx[2:]
+    span = traj[nxt, 2] - traj[prev, 2]
+    frac = np.divide(
+        traj[cur, 2] - traj[prev, 2],
+        span,
+        out=np.zeros(len(cur)),
+        where=span != 0,
+    )
+    pred = traj[prev, :2] + frac[:, None] * (traj[nxt, :2] - traj[prev, :2])
+    return norm(traj[cur, :2] - pred, axis=1) <= tol
+
+
+def _feature_points(traj: FloatArray, tol: float, threashold: float):
+    """Points counted by the stop rate and the velocity change rate (and
+    the stationary ones), which ``compress`` always keeps."""
+    derivs = fe.derivatives(traj)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        slow = (derivs.delta_r <= tol) | (derivs.velocity < threashold)
+        # The rate of the inner point i + 1 uses the points i to i + 2
+        changes = derivs.velocity_rate > threashold
+    kept = np.zeros(len(traj), dtype=bool)
+    kept[:-1] |= slow
+    kept[1:] |= slow
+    for shift in range(3):
+        kept[shift : len(traj) - 2 + shift] |= changes
+    return kept
+
+
+def compress(traj: FloatArray, tol: float = 1e-6, threashold: float = 1) -> FloatArray:
+    """
+    Removes the redundant points of a trajectory.
+
+    A point is redundant if its position is predicted within ``tol`` by the
+    linear interpolation in time between its neighbours and no feature
+    counts it: the ends of the stationary (within ``tol``) segments and of
+    the segments slower than ``threashold`` (stop rate) and the points
+    around a relative velocity change above ``threashold`` (velocity change
+    rate) are always kept. Runs of redundant points are removed in rounds
+    (every other point of each run per round, so a point is always checked
+    against kept neighbours), which takes a logarithmic number of vectorized
+    passes.
+
+    Parameters
+    ----------
+    traj : FloatArray
+        The trajectory (Nx3 matrix).
+    tol : float
+        Tolerance (in coordinate units, degrees).
+    threashold : float
+        Threashold of the stop rate and velocity change rate features (the
+        one given to ``feature_vec.convert_traj_into_vector``).
+
+    Returns
+    -------
+    FloatArray
+        The compressed trajectory (the first and last points are kept).
+    """
+    traj = np.asarray(traj, dtype=np.float64)
+    keep = np.ones(len(traj), dtype=bool)
+    if len(traj) < 3:
+        return traj[keep]
+    counted = _feature_points(traj, tol, threashold)
+    while True:
+        idx = np.flatnonzero(keep)
+        if len(idx) < 3:
+            break
+        cand = _removable(traj, idx, tol) & ~counted[idx[1:-1]]
+        if not cand.any():
+            break
+        # Position of each candidate inside its run of candidates, only the
+        # even ones are removed in this round
+        pos = np.arange(len(cand))
+        run_start = cand.copy()
+        run_start[1:] &= ~cand[:-1]
+        first = np.maximum.accumulate(np.where(run_start, pos, 0))
+        remove = cand & ((pos - first) % 2 == 0)
+        keep[idx[1:-1][remove]] = False
+    return traj[keep]
+
+
+def preprocess(
+    traj: FloatArray,
+    resample_interval: Optional[float] = None,
+    compress_tol: Optional[float] = None,
+    threashold: float = 1,
+) -> FloatArray:
+    """
+    Resamples and/or compresses a trajectory.
+
+    Parameters
+    ----------
+    traj : FloatArray
+        The trajectory (Nx3 matrix).
+    resample_interval : Optional[float]
+        Time interval of the resampling (None to skip it).
+    compress_tol : Optional[float]
+        Tolerance of the compression (None to skip it).
+    threashold : float
+        Feature threashold of the compression (see ``compress``).
+
+    Returns
+    -------
+    FloatArray
+        The processed trajectory.
+    """
+    traj = np.asarray(traj, dtype=np.float64)
+    if resample_interval is not None:
+        traj = resample(traj, resample_interval)
+    if compress_tol is not None:
+        traj = compress(traj, compress_tol, threashold)
+    return traj
+
+
+def sampled_mean_dt(traj: FloatArray, n_sampled: int) -> float:
+    """
+    Mean time step of a trajectory before its compression.
+
+    The compression keeps the first and the last points, so the duration
+    is the one of the ``n_sampled`` points it was computed from.
+
+    Parameters
+    ----------
+    traj : FloatArray
+        The (compressed) trajectory.
+    n_sampled : int
+        Number of points before the compression.
+
+    Returns
+    -------
+    float
+        The mean time step (inf if there was a single point).
+    """
+    if n_sampled < 2:
+        return np.inf
+    return float((traj[-1, 2] - traj[0, 2]) / (n_sampled - 1))
@@ -0,0 +1,235 @@
+"""
+Single-file binary store of trajectories.
+
+All the trajectory points are packed in one contiguous float64 array that is
+opened with ``np.memmap``, so every trajectory is handed out as a zero-copy
+view and opening the store does not depend on the number of trajectories.
+
+File layout::
+
+    MAGIC (16 bytes)
+    points   float64 (n_points x 3)
+    offsets  int64 (n_traj + 1)
+    footer   utf-8 json with the metadata columns
+    trailer  uint64 footer position + MAGIC[:8]
+
+The footer also records a digest of the metadata file the store was built
+from (``source_digest``), so a store that is older than the metadata (e.g.
+after ``data_parser`` processed new users) can be detected and ignored.
+"""
+import hashlib
+import json
+import logging
+import struct
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+import numpy.typing as npt
+
+MAGIC = b"TRAJSTORE\x00\x00\x00\x00\x00\x00\x01"
+TRAILER = struct.Struct("<Q8s")
+POINT_DIM = 3
+
+DEFAULT_STORE_FILE = Path("trajectories/trajectories.store")
+
+
+def file_digest(path: Path) -> str:
+    """
+    Content digest of a file (e.g. the metadata file of a store).
+
+    Parameters
+    ----------
+    path : Path
+        Path to the file.
+
+    Returns
+    -------
+    str
+        The digest.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as s_file:
+        for block in iter(lambda: s_file.read(2**20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class TrajStoreWriter:
+    """
+    Appends trajectories to a new store file.
+
+    Parameters
+    ----------
+    store_file : Path
+        Path of the store file to create (overwritten if it exists).
+    source_digest : Optional[str]
+        Digest of the metadata file the trajectories come from (see
+        ``file_digest``).
+    """
+
+    def __init__(self, store_file: Path, source_digest: Optional[str] = None):
+        self.store_file = Path(store_file)
+        self.source_digest = source_digest
+        self.store_file.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(self.store_file, "wb")  # pylint: disable=R1732
+        self._file.write(MAGIC)
+        self._offsets: List[int] = [0]
+        self._columns: Dict[str, list] = {}
+
+    def add(self, traj: np.ndarray, traj_md: dict) -> None:
+        """
+        Appends a trajectory and its metadata.
+
+        Parameters
+        ----------
+        traj : np.ndarray
+            The trajectory (Nx3 matrix).
+        traj_md : dict
+            The metadata of the trajectory. The ``traj_data`` key (if any) is
+            not stored.
+        """
+        traj = np.ascontiguousarray(traj, dtype="<f8").reshape(-1, POINT_DIM)
+        md_items = {k: v for k, v in traj_md.items() if k != "traj_data"}
+        n_trajs = len(self._offsets) - 1
+        for key in md_items.keys() - self._columns.keys():
+            self._columns[key] = [None] * n_trajs
+        for key, column in self._columns.items():
+            column.append(md_items.get(key))
+        self._file.write(traj.tobytes())
+        self._offsets.append(self._offsets[-1] + len(traj))
+
+    def close(self) -> None:
+        """Writes the offsets index and the metadata and closes the file."""
+        if self._file.closed:
+            return
+        self._file.write(np.array(self._offsets, dtype="<i8").tobytes())
+        footer_pos = self._file.tell()
+        footer = {
+            "n_points": self._offsets[-1],
+            "n_trajs": len(self._offsets) - 1,
+            "columns": self._columns,
+            "source_digest": self.source_digest,
+        }
+        self._file.write(json.dumps(footer, ensure_ascii=False).encode("utf-8"))
+        self._file.write(TRAILER.pack(footer_pos, MAGIC[:8]))
+        self._file.close()
+
+    def __enter__(self) -> "TrajStoreWriter":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if exc_type is None:
+            self.close()
+            return
+        # A partial store would look valid once finalized: remove it
+        self._file.close()
+        self.store_file.unlink(missing_ok=True)
+
+
+class TrajStore:
+    """
+    Read-only, memory-mapped view of a store file.
+
+    Parameters
+    ----------
+    store_file : Path
+        Path of the store file.
+    """
+
+    def __init__(self, store_file: Path):
+        self.store_file = Path(store_file)
+        with open(self.store_file, "rb") as s_file:
+            if s_file.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"Not a trajectory store: '{self.store_file}'")
+            s_file.seek(-TRAILER.size, 2)
+            footer_pos, magic = TRAILER.unpack(s_file.read(TRAILER.size))
+            if magic != MAGIC[:8]:
+                raise ValueError(f"Truncated trajectory store: '{self.store_file}'")
+            s_file.seek(footer_pos)
+            footer = json.loads(s_file.read()[: -TRAILER.size].decode("utf-8"))
+
+        self.n_points: int = footer["n_points"]
+        self.columns: Dict[str, list] = footer["columns"]
+        self.source_digest: Optional[str] = footer.get("source_digest")
+        n_trajs = footer["n_trajs"]
+        offsets_pos = len(MAGIC) + self.n_points * POINT_DIM * 8
+        self.offsets: npt.NDArray[np.int64] = np.memmap(
+            self.store_file, dtype="<i8", mode="r", offset=offsets_pos,
+            shape=(n_trajs + 1,),
+        )
+        if self.n_points:
+            self.points: np.ndarray = np.memmap(
+                self.store_file, dtype="<f8", mode="r", offset=len(MAGIC),
+                shape=(self.n_points, POINT_DIM),
+            )
+        else:
+            self.points = np.empty((0, POINT_DIM))
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, idx: int) -> np.ndarray:
+        return self.points[self.offsets[idx] : self.offsets[idx + 1]]
+
+    def metadata(self) -> List[dict]:
+        """
+        Metadata of each trajectory with its (zero-copy) data view included.
+
+        Returns
+        -------
+        List[dict]
+            The metadata of each trajectory with the trajectory data included.
+        """
+        metadata = []
+        for i in range(len(self)):
+            traj_md = {key: column[i] for key, column in self.columns.items()}
+            traj_md["traj_data"] = self[i]
+            metadata.append(traj_md)
+        return metadata
+
+
+def convert_trajs_folder(
+    metadata_file: Path = Path("trajectories/metadata.json"),
+    store_file: Optional[Path] = None,
+) -> Path:
+    """
+    Converts the trajectory files (text or compact) of a metadata file into
+    a store.
+
+    Parameters
+    ----------
+    metadata_file : Path
+        Path to the metadata file created by ``data_parser``.
+    store_file : Optional[Path]
+        Path of the store file. By default ``trajectories.store`` next to
+        the metadata file.
+
+    Returns
+    -------
+    Path
+        The path of the store file.
+    """
+    # pylint: disable=C0415
+    from data_handler import load_traj_file
+
+    metadata_file = Path(metadata_file)
+    if store_file is None:
+        store_file = metadata_file.parent / DEFAULT_STORE_FILE.name
+    with open(metadata_file, "r", encoding="utf-8") as md_file:
+        metadata: List[dict] = json.load(md_file)
+
+    logging.info("Converting %d trajectories into '%s'", len(metadata), store_file)
+    with TrajStoreWriter(store_file, file_digest(metadata_file)) as writer:
+        for traj_md in metadata:
+            writer.add(np.asarray(load_traj_file(traj_md["file_path"])), traj_md)
+    return Path(store_file)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s [%(levelname)s] %(message)s",
+        datefmt="%H:%M:%S",
+    )
+    convert_trajs_folder()